@@ -1,14 +1,21 @@
-from typing import Union
+import os
+from collections import OrderedDict
+from typing import List, Union
 
 import bw2calc
 import bw2data
+import numpy as np
 from bw2data.project import projects
 from bw2data.utils import get_activity
 from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
+from pydantic import BaseModel
 
 api = FastAPI()
 
+# The number of (project, database) LCAs kept warm
+LCA_CACHE_SIZE = int(os.environ.get("BWAPI_LCA_CACHE_SIZE", 4))
+
 # projects and databases
 
 
@@ -117,20 +124,138 @@ async def characterization_factors(
 # impacts
 
 
+def database_version(project: str, dbname: str) -> tuple:
+    """When the database, and the ones it links to, were last modified"""
+    if projects.current != project:
+        projects.set_current(project)
+    # The databases can be written by other processes than the server
+    bw2data.databases.load()
+    metadata = bw2data.databases.get(dbname, {})
+    return tuple(
+        bw2data.databases.get(name, {}).get("modified")
+        for name in [dbname, *sorted(metadata.get("depends", []))]
+    )
+
+
+class WarmLCA:
+    """The LCA of a database, with its matrices loaded and its technosphere factorized
+    once, so that any demand on the database is a solve and a product of matrices"""
+
+    def __init__(self, project: str, dbname: str):
+        self.version = database_version(project, dbname)
+        self.project = project
+        self.ids = {
+            activity["code"]: activity.id for activity in bw2data.Database(dbname)
+        }
+        if not self.ids:
+            raise KeyError(f"Database {dbname} not found or empty")
+        self.lca = bw2calc.LCA({next(iter(self.ids.values())): 1})
+        self.lca.lci(factorize=True)
+        # method -> (impact categories, units, characterization factors per category)
+        self.methods = {}
+
+    def characterization(self, method: str):
+        if method not in self.methods:
+            projects.set_current(self.project)
+            impact_categories = [m for m in bw2data.methods if m[0] == method]
+            if not impact_categories:
+                raise KeyError(f"Method {method} not found")
+            factors = []
+            for impact_category in impact_categories:
+                self.lca.switch_method(impact_category)
+                # The score of a category is the sum of the characterized inventory
+                factors.append(
+                    np.asarray(self.lca.characterization_matrix.sum(axis=0)).ravel()
+                )
+            self.methods[method] = (
+                impact_categories,
+                [
+                    bw2data.methods[m].get("unit", "(no unit)")
+                    for m in impact_categories
+                ],
+                np.vstack(factors),
+            )
+        return self.methods[method]
+
+    def scores(self, demands: List[tuple], method: str):
+        """The scores of each impact category of `method` (rows) for each of the
+        (code, amount) `demands` (columns)"""
+        impact_categories, units, factors = self.characterization(method)
+        demand_matrix = np.zeros((len(self.lca.dicts.product), len(demands)))
+        for column, (code, amount) in enumerate(demands):
+            if code not in self.ids:
+                raise KeyError(f"Activity {code} not found")
+            demand_matrix[self.lca.dicts.product[self.ids[code]], column] = amount
+        supply = np.column_stack(
+            [
+                self.lca.solve_linear_system(demand_matrix[:, column])
+                for column in range(len(demands))
+            ]
+        )
+        return impact_categories, units, factors @ (self.lca.biosphere_matrix @ supply)
+
+
+_warm_lcas: "OrderedDict[tuple, WarmLCA]" = OrderedDict()
+
+
+def warm_lca(project: str, dbname: str) -> WarmLCA:
+    """The warm LCA of the database, rebuilt when the database was modified since. The
+    least recently used one is evicted when more than LCA_CACHE_SIZE are kept"""
+    key = (project, dbname)
+    if key in _warm_lcas and _warm_lcas[key].version == database_version(
+        project, dbname
+    ):
+        _warm_lcas.move_to_end(key)
+    else:
+        _warm_lcas.pop(key, None)
+        _warm_lcas[key] = WarmLCA(project, dbname)
+        while len(_warm_lcas) > LCA_CACHE_SIZE:
+            _warm_lcas.popitem(last=False)
+    return _warm_lcas[key]
+
+
+def _impacts(impact_categories, units, scores):
+    return [
+        {"method": m, "score": float(score), "unit": unit}
+        for m, unit, score in zip(impact_categories, units, scores)
+    ]
+
+
 @api.get("/{project}/{dbname}/{code}/impacts/{method}", response_class=JSONResponse)
 async def impacts(_: Request, project: str, dbname: str, code: str, method: str):
-    projects.set_current(project)
-    lca = bw2calc.LCA({get_activity((dbname, code)): 1})
-    lca.lci()
-    impacts = []
-    for m in [m for m in list(bw2data.methods) if m[0] == method]:
-        lca.switch_method(m)
-        lca.lcia()
-        impacts.append(
-            {
-                "method": m,
-                "score": lca.score,
-                "unit": bw2data.methods[m].get("unit", "(no unit)"),
-            }
+    try:
+        impact_categories, units, scores = warm_lca(project, dbname).scores(
+            [(code, 1)], method
+        )
+    except KeyError as e:
+        return JSONResponse(status_code=404, content={"message": e.args[0]})
+    return _impacts(impact_categories, units, scores[:, 0])
+
+
+class Demand(BaseModel):
+    code: str
+    amount: float = 1
+
+
+class Demands(BaseModel):
+    demands: List[Demand]
+
+
+@api.post("/{project}/{dbname}/impacts/{method}", response_class=JSONResponse)
+async def batch_impacts(
+    _: Request, project: str, dbname: str, method: str, body: Demands
+):
+    try:
+        impact_categories, units, scores = warm_lca(project, dbname).scores(
+            [(demand.code, demand.amount) for demand in body.demands], method
         )
-    return impacts
+    except KeyError as e:
+        return JSONResponse(status_code=404, content={"message": e.args[0]})
+    return [
+        {
+            "code": demand.code,
+            "amount": demand.amount,
+            "impacts": _impacts(impact_categories, units, scores[:, column]),
+        }
+        for column, demand in enumerate(body.demands)
+    ]
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+
+import time
+from pathlib import Path
+from typing import Callable, List
+
+import typer
+from rich.console import Console
+from rich.table import Table
+from typing_extensions import Annotated
+
+from common import format_numbers
+from config import PROJECT_ROOT_DIR
+from ecobalyse_data.catalog import load_catalog
+from ecobalyse_data.export.export_generic import (
+    ingredient_metadata_record,
+    process_generic_record,
+)
+from ecobalyse_data.export.food import ingredient_records
+from ecobalyse_data.export.textile import activity_to_material_records
+from ecobalyse_data.export.utils import get_metadata_for_scope
+from models.process import (
+    GENERIC_SCOPES,
+    ComputedBy,
+    Ingredient,
+    IngredientMetadata,
+    Material,
+    Process,
+    ProcessGeneric,
+    serialize_all,
+)
+
+PROCESS_EXCLUDE = {"bw_activity", "computed_by"}
+
+
+def _best_time(func: Callable, repeat: int):
+    """The result of `func` and its best time out of `repeat` runs"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def _process_records(activities: List[dict]) -> List[dict]:
+    # Like `activity_to_process_with_impacts`, with the hardcoded impacts or none:
+    # Brightway is not needed to build the records
+    return [
+        dict(
+            activity_name=activity.get(
+                "activityName", "This process is not linked to a Brightway activity"
+            ),
+            bw_activity=None,
+            categories=activity.get("categories", []),
+            comment=activity.get("comment", ""),
+            computed_by=ComputedBy.hardcoded,
+            display_name=activity.get("displayName", ""),
+            elec_mj=activity.get("elecMJ", 0),
+            heat_mj=activity.get("heatMJ", 0),
+            id=activity["id"],
+            impacts=activity.get("impacts") or {},
+            location=activity.get("location"),
+            mass_per_unit=activity.get("massPerUnit"),
+            scopes=activity.get("scopes", []),
+            source=activity["source"],
+            unit=activity.get("unit"),
+            waste=activity.get("waste", 0),
+        )
+        for activity in activities
+    ]
+
+
+def _generic_records(activities: List[dict], processes: List[dict]) -> List[dict]:
+    processes_by_id = {process["id"]: process for process in processes}
+    return [
+        process_generic_record(
+            processes_by_id[activity["id"]],
+            activity,
+            variant,
+            variant.get("landOccupation"),
+        )
+        for activity in activities
+        if GENERIC_SCOPES & set(activity["scopes"])
+        for variant in activity["metadata"]
+    ]
+
+
+def main(
+    catalog_dir: Annotated[
+        Path, typer.Option(help="The lci_catalog to build the records from")
+    ] = PROJECT_ROOT_DIR / "lci_catalog",
+    repeat: Annotated[
+        int, typer.Option(help="Keep the best time out of this number of runs")
+    ] = 5,
+    multiply: Annotated[
+        int,
+        typer.Option(help="Serialize the records of the catalog this number of times"),
+    ] = 1,
+):
+    """
+    Compare the time to validate and serialize the exported records of the catalog
+    one model at a time and column by column, with `serialize_all`.
+    """
+    activities = load_catalog([catalog_dir]) * multiply
+
+    process_records = _process_records(activities)
+    processes = format_numbers(
+        serialize_all(Process, process_records, exclude=PROCESS_EXCLUDE)
+    )
+    records = {
+        Process: process_records,
+        # The activities exported by `bin/export.py metadata`
+        Material: [
+            record
+            for activity in activities
+            if "textile_material" in activity.get("categories", [])
+            for record in activity_to_material_records(activity)
+        ],
+        Ingredient: [
+            record
+            for activity in activities
+            if "ingredient" in activity.get("categories", [])
+            for record in ingredient_records(activity, {}, activity.get("location"))
+        ],
+        IngredientMetadata: [
+            ingredient_metadata_record(food_metadata, activity)
+            for activity in activities
+            for food_metadata in get_metadata_for_scope(activity, "food")
+        ],
+        ProcessGeneric: _generic_records(activities, processes),
+    }
+
+    table = Table(title=f"Serialization of {catalog_dir}", show_header=True)
+    table.add_column("model", style="cyan", no_wrap=True)
+    table.add_column("records", justify="right")
+    table.add_column("one at a time", justify="right")
+    table.add_column("by column", justify="right")
+    table.add_column("", justify="right")
+
+    def add_row(model, count, per_object, batch):
+        (per_object_dicts, per_object_time), (batch_dicts, batch_time) = (
+            _best_time(per_object, repeat),
+            _best_time(batch, repeat),
+        )
+        if per_object_dicts != batch_dicts:
+            raise ValueError(f"The two paths serialize {model.__name__} differently")
+        table.add_row(
+            model.__name__,
+            str(count),
+            f"{per_object_time * 1000:.1f} ms",
+            f"{batch_time * 1000:.1f} ms",
+            f"[green]x{per_object_time / batch_time:.2f}[/green]"
+            if batch_time
+            else "-",
+        )
+
+    for model, model_records in records.items():
+        exclude = PROCESS_EXCLUDE if model is Process else None
+        add_row(
+            model,
+            len(model_records),
+            lambda: [
+                model(**record).model_dump(by_alias=True, exclude=exclude)
+                for record in model_records
+            ],
+            lambda: serialize_all(model, model_records, exclude),
+        )
+
+    Console().print(table)
+
+
+if __name__ == "__main__":
+    typer.run(main)
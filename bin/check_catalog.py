@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+
+import multiprocessing
+from pathlib import Path
+from typing import List, Optional
+
+import typer
+from typing_extensions import Annotated
+
+from ecobalyse_data.catalog import CatalogValidationError, load_catalog
+from ecobalyse_data.logging import logger
+
+
+def main(
+    catalog_dirs: Annotated[
+        List[Path],
+        typer.Argument(
+            exists=True,
+            file_okay=False,
+            dir_okay=True,
+            help="The lci_catalog directories to validate",
+        ),
+    ],
+    cpu_count: Annotated[
+        Optional[int],
+        typer.Option(
+            help="The number of CPUs/cores to use for validation. Default to MAX/2."
+        ),
+    ] = max(multiprocessing.cpu_count() // 2, 1),
+    cache: Annotated[
+        bool,
+        typer.Option(help="Only validate the files modified since the last run."),
+    ] = True,
+):
+    """
+    Validate the lci_catalog files against schemas/lci-schema.json.
+    """
+    kwargs = {} if cache else {"cache_path": None}
+    try:
+        activities = load_catalog(catalog_dirs, cpu_count=cpu_count, **kwargs)
+    except CatalogValidationError as e:
+        logger.error(str(e))
+        raise typer.Exit(1)
+
+    logger.info(f"-> {len(activities)} lci_catalog files are valid")
+
+
+if __name__ == "__main__":
+    typer.run(main)
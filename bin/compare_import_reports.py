@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+from pathlib import Path
+from typing import Optional
+
+import typer
+from rich.console import Console
+from rich.table import Table
+from typing_extensions import Annotated
+
+from ecobalyse_data.bw.profiling import compare_reports, load_report
+
+
+def _seconds(stage: Optional[dict], key: str) -> str:
+    return f"{stage[key]:.2f}s" if stage else "-"
+
+
+def _mib(stage: Optional[dict]) -> str:
+    return f"{stage['peak_rss'] / 2**20:.0f} MiB" if stage else "-"
+
+
+def _ratio(before: Optional[dict], after: Optional[dict], key: str) -> str:
+    if not before or not after or not before[key]:
+        return "-"
+    ratio = after[key] / before[key]
+    style = "green" if ratio <= 1 else "red"
+    return f"[{style}]x{ratio:.2f}[/{style}]"
+
+
+def main(
+    before: Annotated[
+        Path, typer.Argument(exists=True, dir_okay=False, help="The reference report")
+    ],
+    after: Annotated[
+        Path, typer.Argument(exists=True, dir_okay=False, help="The report to compare")
+    ],
+):
+    """
+    Compare the time and memory of the stages of two import reports.
+    """
+    before_report, after_report = load_report(before), load_report(after)
+
+    table = Table(
+        title=f"{before_report['name']} ({before_report['started']}) → "
+        f"{after_report['name']} ({after_report['started']})",
+        show_header=True,
+    )
+    table.add_column("stage", style="cyan", no_wrap=True)
+    table.add_column("wall", justify="right")
+    table.add_column("", justify="right")
+    table.add_column("CPU", justify="right")
+    table.add_column("", justify="right")
+    table.add_column("peak RSS", justify="right")
+    table.add_column("", justify="right")
+    table.add_column("datasets", justify="right")
+    table.add_column("exchanges", justify="right")
+
+    for row in compare_reports(before_report, after_report):
+        stage_before, stage_after = row["before"], row["after"]
+        counts = stage_after or stage_before
+        table.add_row(
+            row["name"],
+            f"{_seconds(stage_before, 'wall_time')} → {_seconds(stage_after, 'wall_time')}",
+            _ratio(stage_before, stage_after, "wall_time"),
+            f"{_seconds(stage_before, 'cpu_time')} → {_seconds(stage_after, 'cpu_time')}",
+            _ratio(stage_before, stage_after, "cpu_time"),
+            f"{_mib(stage_before)} → {_mib(stage_after)}",
+            _ratio(stage_before, stage_after, "peak_rss"),
+            str(counts.get("datasets") or ""),
+            str(counts.get("exchanges") or ""),
+        )
+
+    Console().print(table)
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -1,9 +1,10 @@
 #!/usr/bin/env python3
 
-import json
 import logging
 import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from enum import Enum
+from functools import partial
 from pathlib import Path
 from typing import List, Optional
 
@@ -12,10 +13,13 @@ from bw2data.project import projects
 from typing_extensions import Annotated
 
 from config import PROJECT_ROOT_DIR, settings
+from ecobalyse_data.bw.overlay import MatrixOverlay
+from ecobalyse_data.catalog import load_catalog
 from ecobalyse_data.export import export_generic
 from ecobalyse_data.export import food as export_food
 from ecobalyse_data.export import process as export_process
 from ecobalyse_data.export import textile as export_textile
+from ecobalyse_data.export.utils import get_metadata_for_scope
 from ecobalyse_data.logging import logger
 from models.process import GENERIC_SCOPES, Scope
 
@@ -49,91 +53,103 @@ def metadata(
     if verbose:
         logger.setLevel(logging.DEBUG)
 
+    dirs_to_export_to = _dirs_to_export_to(root_dir)
+
+    activities = _get_lcias(root_dir, cpu_count)
+
+    for scope in scopes:
+        METADATA_STAGES[scope](activities, root_dir, dirs_to_export_to, cpu_count)
+
+
+def _dirs_to_export_to(root_dir: Path) -> List[Path]:
     dirs_to_export_to = [settings.output_dir]
 
-    if settings.LOCAL_EXPORT:
+    if settings.local_export:
         dirs_to_export_to.append(root_dir / "public" / "data")
 
-    activities = _get_lcias(root_dir)
+    return dirs_to_export_to
 
-    for s in scopes:
-        scope_dirname = settings.scopes.get(s.value).dirname
-        es_files_path = root_dir / scope_dirname
 
-        feed_file_path = es_files_path / settings.scopes.food.feed_file
+def _es_files_paths(root_dir: Path, scope: MetadataScope) -> dict:
+    es_files_path = root_dir / settings.scopes.get(scope.value).dirname
+    return dict(
+        ecosystemic_factors_path=es_files_path
+        / settings.scopes.food.ecosystemic_factors_file,
+        feed_file_path=es_files_path / settings.scopes.food.feed_file,
+        raw_to_transformed_file_path=es_files_path
+        / settings.scopes.food.raw_to_transformed_ratios_file,
+    )
 
-        ecosystemic_factors_path = (
-            es_files_path / settings.scopes.food.ecosystemic_factors_file
-        )
-        raw_to_transformed_file_path = (
-            es_files_path / settings.scopes.food.raw_to_transformed_ratios_file
-        )
 
-        if s == MetadataScope.textile:
-            # Export textile materials
-            activities_textile_materials = [
-                a
-                for a in activities
-                if scope_dirname in a.get("scopes", [])
-                and "textile_material" in a.get("categories", [])
-            ]
-
-            export_textile.activities_to_materials_json(
-                activities_textile_materials,
-                materials_paths=[
-                    root_dir / dir / scope_dirname / "materials.json"
-                    for dir in dirs_to_export_to
-                ],
-            )
-
-        elif s == MetadataScope.food:
-            # Export food ingredients
-            activities_food_ingredients = [
-                a
-                for a in activities
-                if scope_dirname in a.get("scopes", [])
-                and "ingredient" in a.get("categories", [])
-            ]
-            ingredients_paths = [
-                root_dir / dir / scope_dirname / "ingredients.json"
-                for dir in dirs_to_export_to
-            ]
-
-            export_food.activities_to_ingredients_json(
-                activities_food_ingredients,
-                ingredients_paths=ingredients_paths,
-                ecosystemic_factors_path=ecosystemic_factors_path,
-                feed_file_path=feed_file_path,
-                raw_to_transformed_file_path=raw_to_transformed_file_path,
-                cpu_count=cpu_count,
-            )
-
-        elif s == MetadataScope.generic:
-            # Export all generic processes (object + veli + food2) to processes_generic.json
-            generic_activities = [
-                activity
-                for activity in activities
-                if GENERIC_SCOPES & set(activity["scopes"])
-            ]
-
-            export_generic.activities_to_processes_generic_json(
-                generic_activities,
-                processes_impacts_path=root_dir
-                / dirs_to_export_to[-1]  # last dir is local dir
-                / settings.processes_impacts_full_file,
-                aggregated_output_paths=[
-                    root_dir / dir / "processes_generic.json"
-                    for dir in dirs_to_export_to
-                ],
-                impacts_output_paths=[
-                    root_dir / dir / "processes_generic_impacts.json"
-                    for dir in dirs_to_export_to
-                ],
-                cpu_count=cpu_count,
-                ecosystemic_factors_path=ecosystemic_factors_path,
-                feed_file_path=feed_file_path,
-                raw_to_transformed_file_path=raw_to_transformed_file_path,
-            )
+def _export_materials(activities, root_dir, dirs_to_export_to, cpu_count):
+    scope_dirname = settings.scopes.textile.dirname
+    activities_textile_materials = [
+        a
+        for a in activities
+        if scope_dirname in a.get("scopes", [])
+        and "textile_material" in a.get("categories", [])
+    ]
+
+    return export_textile.activities_to_materials_json(
+        activities_textile_materials,
+        materials_paths=[
+            root_dir / dir / scope_dirname / "materials.json"
+            for dir in dirs_to_export_to
+        ],
+    )
+
+
+def _export_ingredients(activities, root_dir, dirs_to_export_to, cpu_count):
+    scope_dirname = settings.scopes.food.dirname
+    activities_food_ingredients = [
+        a
+        for a in activities
+        if scope_dirname in a.get("scopes", [])
+        and "ingredient" in a.get("categories", [])
+    ]
+
+    return export_food.activities_to_ingredients_json(
+        activities_food_ingredients,
+        ingredients_paths=[
+            root_dir / dir / scope_dirname / "ingredients.json"
+            for dir in dirs_to_export_to
+        ],
+        cpu_count=cpu_count,
+        **_es_files_paths(root_dir, MetadataScope.food),
+    )
+
+
+def _export_processes_generic(
+    activities, root_dir, dirs_to_export_to, cpu_count, processes=None
+):
+    # Export all generic processes (object + veli + food2) to processes_generic.json
+    generic_activities = [
+        activity for activity in activities if GENERIC_SCOPES & set(activity["scopes"])
+    ]
+
+    return export_generic.activities_to_processes_generic_json(
+        generic_activities,
+        processes_impacts_path=root_dir
+        / dirs_to_export_to[-1]  # last dir is local dir
+        / settings.processes_impacts_full_file,
+        aggregated_output_paths=[
+            root_dir / dir / "processes_generic.json" for dir in dirs_to_export_to
+        ],
+        impacts_output_paths=[
+            root_dir / dir / "processes_generic_impacts.json"
+            for dir in dirs_to_export_to
+        ],
+        cpu_count=cpu_count,
+        processes=processes,
+        **_es_files_paths(root_dir, MetadataScope.generic),
+    )
+
+
+METADATA_STAGES = {
+    MetadataScope.textile: _export_materials,
+    MetadataScope.food: _export_ingredients,
+    MetadataScope.generic: _export_processes_generic,
+}
 
 
 @app.command()
@@ -154,6 +170,13 @@ def processes(
         bool,
         typer.Option(help="Use simapro"),
     ] = False,
+    created_activities: Annotated[
+        Optional[Path],
+        typer.Option(
+            help="Compute the Ecobalyse activities from this activities_to_create.json"
+            " file, without writing them to the Ecobalyse database."
+        ),
+    ] = None,
     plot: bool = typer.Option(False, "--plot", "-p"),
     merge: bool = typer.Option(False, "--merge", "-m"),
     verbose: bool = typer.Option(False, "--verbose", "-v"),
@@ -186,6 +209,10 @@ def processes(
             f"-> Filtered activities to scopes: {scopes}, activities remaining: {len(activities)}"
         )
 
+    overlay = None
+    if created_activities is not None:
+        overlay = MatrixOverlay.from_file("Ecobalyse", created_activities)
+
     export_process.activities_to_processes(
         activities=activities,
         aggregated_relative_file_path=settings.processes_aggregated_file,
@@ -197,19 +224,152 @@ def processes(
         simapro=simapro,
         merge=merge,
         scopes=scopes,
+        overlay=overlay,
     )
 
 
-def _get_lcias(root_dir):
-    lci_catalog = root_dir / "lci_catalog"
-    logger.debug(f"-> Loading lci_catalog {lci_catalog}")
+@app.command("all")
+def export_all(
+    graph_folder: Annotated[
+        Optional[Path],
+        typer.Option(help="The graph output path."),
+    ] = PROJECT_ROOT_DIR / "graphs",
+    display_changes: Annotated[
+        bool,
+        typer.Option(help="Display changes with old processes."),
+    ] = True,
+    simapro: Annotated[
+        bool,
+        typer.Option(help="Use simapro"),
+    ] = False,
+    created_activities: Annotated[
+        Optional[Path],
+        typer.Option(
+            help="Compute the Ecobalyse activities from this activities_to_create.json"
+            " file, without writing them to the Ecobalyse database."
+        ),
+    ] = None,
+    plot: bool = typer.Option(False, "--plot", "-p"),
+    verbose: bool = typer.Option(False, "--verbose", "-v"),
+    cpu_count: Annotated[
+        Optional[int],
+        typer.Option(
+            help="The number of CPUs/cores to use for computation. Default to MAX/2."
+        ),
+    ] = max(multiprocessing.cpu_count() // 2, 1),
+    root_dir: Path = PROJECT_ROOT_DIR,
+):
+    """
+    Export the processes, then the metadata files, in a single run sharing the
+    catalog, the Brightway searches, the land occupations and the processes impacts
+    """
+    if verbose:
+        logger.setLevel(logging.DEBUG)
+
+    dirs_to_export_to = _dirs_to_export_to(root_dir)
+
+    activities = _get_lcias(root_dir, cpu_count)
+
+    overlay = None
+    if created_activities is not None:
+        overlay = MatrixOverlay.from_file("Ecobalyse", created_activities)
+
+    processes = export_process.activities_to_processes(
+        activities=activities,
+        aggregated_relative_file_path=settings.processes_aggregated_file,
+        impacts_relative_file_path=settings.processes_impacts_file,
+        dirs_to_export_to=dirs_to_export_to,
+        plot=plot or settings.plot_export,
+        graph_folder=graph_folder,
+        display_changes=display_changes,
+        simapro=simapro,
+        overlay=overlay,
+    )
+
+    # Computed once for the ingredients and the generic processes
+    activities = _add_land_occupations(activities, cpu_count)
+
+    _export_metadata_concurrently(
+        activities, processes, root_dir, dirs_to_export_to, cpu_count
+    )
+
+
+# The in-memory inputs of the metadata stages of `export_all`, inherited by the forked
+# stage processes rather than pickled to them
+_metadata_stages_inputs = {}
+
+
+def _init_metadata_stage_worker(project_name: str):
+    # Not to use the SQLite connections of the parent process
+    projects.set_current(project_name)
+
+
+def _run_metadata_stage(scope: MetadataScope, cpu_count: int):
+    inputs = _metadata_stages_inputs
+    stage = METADATA_STAGES[scope]
+    if scope == MetadataScope.generic:
+        stage = partial(stage, processes=inputs["processes"])
+    stage(
+        inputs["activities"], inputs["root_dir"], inputs["dirs_to_export_to"], cpu_count
+    )
+
+
+def _export_metadata_concurrently(
+    activities, processes, root_dir, dirs_to_export_to, cpu_count
+):
+    """Run the metadata stages, that only depend on the activities and the processes,
+    each in a forked process with its share of the `cpu_count` cores"""
+    _metadata_stages_inputs.update(
+        activities=activities,
+        processes=processes,
+        root_dir=root_dir,
+        dirs_to_export_to=dirs_to_export_to,
+    )
+    try:
+        with ProcessPoolExecutor(
+            len(METADATA_STAGES),
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=_init_metadata_stage_worker,
+            initargs=(projects.current,),
+        ) as executor:
+            futures = {
+                scope: executor.submit(
+                    _run_metadata_stage,
+                    scope,
+                    max(cpu_count // len(METADATA_STAGES), 1),
+                )
+                for scope in METADATA_STAGES
+            }
+            for scope, future in futures.items():
+                future.result()
+                logger.info(f"-> Exported the {scope.value} metadata")
+    finally:
+        _metadata_stages_inputs.clear()
+
+
+def _add_land_occupations(activities: List[dict], cpu_count: int) -> List[dict]:
+    """Add the land occupations of the food and forest activities"""
+    food_activities = export_food.add_land_occupations(
+        [a for a in activities if get_metadata_for_scope(a, "food")], cpu_count
+    )
+    by_id = {a["id"]: a for a in food_activities}
+    activities = [by_id.get(a["id"], a) for a in activities]
+
+    forest_activities = export_generic.add_land_occupations(
+        [
+            a
+            for a in activities
+            if GENERIC_SCOPES & set(a["scopes"])
+            and any("forestManagement" in m for m in a.get("metadata", []))
+        ],
+        cpu_count,
+    )
+    by_id = {a["id"]: a for a in forest_activities}
+    return [by_id.get(a["id"], a) for a in activities]
+
 
-    activities = []
-    for lci_path in lci_catalog.glob("*/*.json"):
-        if lci_path.is_file():
-            with open(lci_path, "r") as file:
-                activities.append(json.load(file))
-    return activities
+def _get_lcias(root_dir, cpu_count=1):
+    return load_catalog([root_dir / "lci_catalog"], cpu_count=cpu_count)
 
 
 if __name__ == "__main__":
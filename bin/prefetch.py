@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+
+from typing import List, Optional
+
+import typer
+from typing_extensions import Annotated
+
+from ecobalyse_data import s3
+from ecobalyse_data.logging import logger
+
+
+def main(
+    paths: Annotated[
+        Optional[List[str]],
+        typer.Argument(help="The dbfiles to download. Default to all of them."),
+    ] = None,
+    max_concurrency: Annotated[
+        int,
+        typer.Option(help="The number of file parts downloaded at once."),
+    ] = s3.MAX_CONCURRENCY,
+):
+    """
+    Download the database files of `settings.dbfiles` to the local cache.
+    """
+    files = s3.dbfiles()
+    if paths:
+        files = [(path, md5) for path, md5 in files if path in paths]
+    local_filepaths = s3.prefetch(files, max_concurrency=max_concurrency)
+    logger.info(f"-> {len(local_filepaths)} files are cached")
+
+
+if __name__ == "__main__":
+    typer.run(main)
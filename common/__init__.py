@@ -2,7 +2,6 @@
 import functools
 import json
 from copy import deepcopy
-from subprocess import call
 from uuid import UUID
 
 from frozendict import frozendict
@@ -32,13 +31,20 @@ def get_normalization_weighting_factors(impact_defs):
     )
 
 
-def patch_agb3(path: str):
+AGB3_PATCHES = [
     # `yield` is used as a variable in some Simapro parameters. bw2parameters cannot handle it:
-    # (sed is faster than Python)
-    call("sed -i 's/yield/Yield_/g' " + path, shell=True)
+    (b"yield", b"Yield_"),
     # Fix some errors in Agribalyse:
-    call("sed -i 's/01\\/03\\/2005/1\\/3\\/5/g' " + path, shell=True)
-    call("sed -i 's/\"0;001172\"/0,001172/' " + path, shell=True)
+    (b"01/03/2005", b"1/3/5"),
+    (b'"0;001172"', b"0,001172"),
+]
+
+
+def patch_agb3(content: bytes) -> bytes:
+    """Patch the official AGB3 release file. `content` must only contain whole lines"""
+    for old, new in AGB3_PATCHES:
+        content = content.replace(old, new)
+    return content
 
 
 def spproject(activity):
@@ -158,27 +164,30 @@ def fix_unit(unit):
             return unit
 
 
+def format_numbers(obj):
+    """The numbers of `obj` formatted like in the exported json files, and its
+    UUIDs as strings"""
+    # in python, bools are a subclass of int, so we should check explicitly
+    # if obj is not a bool, otherwise it will be converted to a float…
+    if isinstance(obj, (int, float)) and not isinstance(obj, bool):
+        if obj == 0:
+            return int(0)
+        else:
+            return float(f"{obj:.5g}")
+    elif isinstance(obj, dict):
+        return {k: format_numbers(v) for k, v in obj.items()}
+    # it looks like we are using tuples as lists, so treat them the same way
+    elif isinstance(obj, list) or isinstance(obj, tuple):
+        return [format_numbers(v) for v in obj]
+    elif isinstance(obj, UUID):
+        return str(obj)
+    else:
+        return obj
+
+
 class FormatNumberJsonEncoder(json.JSONEncoder):
     def encode(self, obj):
-        def recursive_format_number(obj):
-            # in python, bools are a subclass of int, so we should check explicitly
-            # if obj is not a bool, otherwise it will be converted to a float…
-            if isinstance(obj, (int, float)) and not isinstance(obj, bool):
-                if obj == 0:
-                    return int(0)
-                else:
-                    return float(f"{obj:.5g}")
-            elif isinstance(obj, dict):
-                return {k: recursive_format_number(v) for k, v in obj.items()}
-            # it looks like we are using tuples as lists, so treat them the same way
-            elif isinstance(obj, list) or isinstance(obj, tuple):
-                return [recursive_format_number(v) for v in obj]
-            elif isinstance(obj, UUID):
-                return str(obj)
-            else:
-                return obj
-
-        return super().encode(recursive_format_number(obj))
+        return super().encode(format_numbers(obj))
 
 
 def activities_processes_sort_key(entry):
@@ -6,11 +6,12 @@ import bw2io
 from bw2data import methods
 from bw2data.backends.proxies import Activity
 from bw2data.method import Method
-from bw2data.utils import get_geocollection, get_node
+from bw2data.utils import get_geocollection
 from bw2io.extractors import simapro_csv
 from bw2io.importers.simapro_lcia_csv import SimaProLCIACSVExtractor
 from bw2io.strategies import simapro
 
+from ecobalyse_data.bw.method import node_ids
 from ecobalyse_data.logging import logger
 
 
@@ -123,11 +124,14 @@ def patched_write_method(self, data, process=True):
         self.register()
     self.metadata["num_cfs"] = len(data)
 
+    # Resolve all the keys at once instead of one query per CF
+    ids = node_ids(line[0] for line in data if isinstance(line[0], tuple))
+
     def normalize_ids(line: Iterable) -> tuple:
         if isinstance(line[0], Activity):
             return (line[0].id, *line[1:])
         elif isinstance(line[0], tuple):
-            return (get_node(key=line[0]).id, *line[1:])
+            return (ids[line[0]], *line[1:])
         # Don't touch anything when it's a list to be backward compatible with old biosphere LCIA
         elif isinstance(line[0], list):
             return line
@@ -1,11 +1,17 @@
+import csv
 import functools
-import tempfile
+import io
 import zipfile
+from multiprocessing import Pool
 from pathlib import Path
 
 import orjson
 from bw2data import Database, config
-from bw2io.extractors.simapro_csv import SimaProCSVExtractor
+from bw2io.extractors.simapro_csv import (
+    EndOfDatasets,
+    SimaProCSVExtractor,
+    strip_whitespace_and_delete,
+)
 from bw2io.importers.base_lci import LCIImporter
 from bw2io.strategies import (
     assign_only_product_as_production,
@@ -37,64 +43,233 @@ from ecobalyse_data.logging import logger
 _CP1252_UNDEFINED = bytes([0x81, 0x8D, 0x8F, 0x90, 0x9D])
 _CP1252_SANITIZE = bytes.maketrans(_CP1252_UNDEFINED, b"?" * len(_CP1252_UNDEFINED))
 
+# Size of the chunks read from the zipped CSV file
+CHUNK_SIZE = 4 * 1024 * 1024
+
 
-def _sanitize_undefined_cp1252_bytes(filepath):
+def _sanitize_undefined_cp1252_bytes(content: bytes) -> bytes:
     """Replace bytes undefined in CP1252 with '?'.
 
     SimaPro CSV files are CP1252 but may contain stray bytes (0x81, 0x8D,
     0x8F, 0x90, 0x9D) that are undefined in CP1252 and meaningless control
     characters in Latin-1.
     """
-    p = Path(filepath)
-    p.write_bytes(p.read_bytes().translate(_CP1252_SANITIZE))
+    return content.translate(_CP1252_SANITIZE)
+
+
+def preprocess_simapro_csv(stream, patch=None, chunk_size=CHUNK_SIZE):
+    """Yield the content of the binary `stream` by chunks of whole lines,
+    sanitized and patched with the optional `patch(chunk: bytes) -> bytes` function.
+
+    Only one chunk is held in memory at a time."""
+    remainder = b""
+    while chunk := stream.read(chunk_size):
+        chunk = remainder + chunk
+        # Keep the incomplete last line for the next chunk, so that patches
+        # never see a line cut in half
+        end = chunk.rfind(b"\n") + 1
+        chunk, remainder = chunk[:end], chunk[end:]
+        if chunk:
+            yield _sanitize_undefined_cp1252_bytes(patch(chunk) if patch else chunk)
+    if remainder:
+        yield _sanitize_undefined_cp1252_bytes(patch(remainder) if patch else remainder)
+
+
+class _ChunksReader(io.RawIOBase):
+    """Read-only binary stream over an iterable of bytes chunks"""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._chunk = b""
+        self._offset = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while self._offset >= len(self._chunk):
+            self._chunk = next(self._chunks, None)
+            self._offset = 0
+            if self._chunk is None:
+                self._chunk = b""
+                return 0
+        size = min(len(buffer), len(self._chunk) - self._offset)
+        buffer[:size] = self._chunk[self._offset : self._offset + size]
+        self._offset += size
+        return size
+
+
+# Arguments of `read_data_set` shared by all the blocks, set once per worker process
+_worker_args = None
+
+
+def _init_worker(args):
+    global _worker_args
+    _worker_args = args
+
+
+def _read_block(block):
+    """Read the dataset of a `Process ... End` block.
+
+    Return the dataset (None if the block ends the datasets) and whether the block
+    was read exactly like it would have been in the whole file."""
+    try:
+        ds, index = SimaProCSVStreamExtractor.read_data_set(block, 0, *_worker_args)
+    except EndOfDatasets:
+        return None, True
+    except IndexError:
+        return None, False
+    # The dataset must stop at the `End` line of the block (or at the end of the
+    # file for the last block), not run over it
+    ends_block = block[-1][:1] == ["End"]
+    return ds, index == len(block) - 1 or not ends_block
+
+
+class SimaProCSVStreamExtractor(SimaProCSVExtractor):
+    """`SimaProCSVExtractor` reading from an open text stream instead of a file,
+    optionally reading the datasets in parallel"""
+
+    @classmethod
+    def extract_stream(cls, stream, filepath, name=None, delimiter=";", cpu_count=1):
+        reader = csv.reader(stream, delimiter=delimiter)
+        lines = [[strip_whitespace_and_delete(obj) for obj in line] for line in reader]
+
+        # Check if valid SimaPro file
+        assert "SimaPro" in lines[0][0] or "CSV separator" in lines[0][0], (
+            "File is not valid SimaPro export"
+        )
+
+        project_name = name or cls.get_project_name(lines)
+
+        project_metadata = cls.get_project_metadata(lines)
+        global_parameters, global_precompiled = cls.get_global_parameters(
+            lines, project_metadata
+        )
+        args = (
+            project_name,
+            filepath,
+            global_parameters,
+            project_metadata,
+            global_precompiled,
+        )
+
+        datasets = None
+        if cpu_count > 1:
+            datasets = cls.read_data_sets_in_parallel(lines, args, cpu_count)
+        if datasets is None:
+            datasets = cls.read_data_sets(lines, args)
+
+        return datasets, global_parameters, project_metadata
+
+    @classmethod
+    def read_data_sets(cls, lines, args):
+        datasets = []
+        index = cls.get_next_process_index(lines, 0)
+
+        while True:
+            try:
+                ds, index = cls.read_data_set(lines, index, *args)
+                datasets.append(ds)
+                index = cls.get_next_process_index(lines, index)
+            except EndOfDatasets:
+                break
+
+        return datasets
+
+    @classmethod
+    def split_process_blocks(cls, lines):
+        """Split `lines` into blocks going from the line following `Process` to the
+        next `End` line (included)"""
+        blocks = []
+        index = cls.get_next_process_index(lines, 0)
+
+        while True:
+            end = index
+            while end < len(lines) and lines[end][:1] != ["End"]:
+                end += 1
+            blocks.append(lines[index : end + 1])
+            try:
+                index = cls.get_next_process_index(lines, end)
+            except EndOfDatasets:
+                break
+
+        return blocks
+
+    @classmethod
+    def read_data_sets_in_parallel(cls, lines, args, cpu_count):
+        """Read the `Process ... End` blocks in a process pool.
+
+        Return None if a block could not be read independently of the others, the
+        datasets should then be read sequentially."""
+        blocks = cls.split_process_blocks(lines)
+
+        with Pool(cpu_count, initializer=_init_worker, initargs=(args,)) as pool:
+            results = pool.map(
+                _read_block,
+                blocks,
+                chunksize=max(len(blocks) // (cpu_count * 4), 1),
+            )
+
+        datasets = []
+        for ds, is_consistent in results:
+            if not is_consistent:
+                logger.warning(
+                    "-> A SimaPro process spans over its `End` line, reading the datasets sequentially"
+                )
+                return None
+            if ds is None:
+                break
+            datasets.append(ds)
+
+        return datasets
 
 
 def export_zipped_csv_to_json(
     input_path: Path,
     output_path: Path,
     db_name: str | None = None,
+    cpu_count: int = 1,
 ):
     logger.debug(f"Start json creation for input file '{input_path}'")
 
     logger.debug(f"-> JSON output to '{output_path}'")
-    with tempfile.TemporaryDirectory() as tempdir:
-        assert input_path.suffix.lower() == ".zip"
-        with zipfile.ZipFile(input_path) as zf:
-            logger.debug(f"-> Extracting the zip file in {tempdir}")
-            csv_file = zf.extract(zf.namelist()[0], tempdir)
-            assert Path(csv_file).name == input_path.stem
-
-            logger.debug(f"-> Reading from CSV file '{csv_file}'")
-            data = []
-            global_parameters = []
-            metadata = []
-
-            if "AGB3" in input_path.name:
-                # Path the official AGB3 release file
-                patch_agb3(csv_file)
-
-            _sanitize_undefined_cp1252_bytes(csv_file)
-
-            data, global_parameters, metadata = SimaProCSVExtractor.extract(
-                filepath=csv_file,
-                name=db_name,
-                delimiter=";",
-                encoding="cp1252",
-            )
+    assert input_path.suffix.lower() == ".zip"
+    with zipfile.ZipFile(input_path) as zf:
+        csv_file = zf.namelist()[0]
+        assert Path(csv_file).name == input_path.stem
 
-            logger.debug(f"-> Writing to json file '{output_path}'")
+        logger.debug(f"-> Reading from CSV file '{csv_file}' in the zip file")
+        # Path the official AGB3 release file
+        patch = patch_agb3 if "AGB3" in input_path.name else None
 
-            with open(output_path, "wb") as fp:
-                if db_name:
-                    for ds in data:
-                        ds["database"] = db_name
+        with zf.open(csv_file) as raw:
+            chunks = preprocess_simapro_csv(raw, patch=patch)
+            with io.TextIOWrapper(
+                io.BufferedReader(_ChunksReader(chunks)), encoding="cp1252"
+            ) as stream:
+                data, global_parameters, metadata = (
+                    SimaProCSVStreamExtractor.extract_stream(
+                        stream,
+                        filepath=csv_file,
+                        name=db_name,
+                        delimiter=";",
+                        cpu_count=cpu_count,
+                    )
+                )
 
-                extracted_data = {
-                    "data": data,
-                    "global_parameters": global_parameters,
-                    "metadata": metadata,
-                }
-                fp.write(orjson.dumps(extracted_data))
+    logger.debug(f"-> Writing to json file '{output_path}'")
+
+    with open(output_path, "wb") as fp:
+        if db_name:
+            for ds in data:
+                ds["database"] = db_name
+
+        extracted_data = {
+            "data": data,
+            "global_parameters": global_parameters,
+            "metadata": metadata,
+        }
+        fp.write(orjson.dumps(extracted_data))
 
 
 class SimaProJsonImporter(LCIImporter):
@@ -162,6 +337,24 @@ class SimaProJsonImporter(LCIImporter):
             ]
         )
 
+    # Checkpoints
+    STATE_ATTRIBUTES = ("data", "global_parameters", "metadata", "applied_strategies")
+
+    def get_state(self) -> dict:
+        return {
+            attribute: getattr(self, attribute, [])
+            for attribute in self.STATE_ATTRIBUTES
+        }
+
+    @classmethod
+    def from_state(cls, name, state: dict):
+        """Restore an importer from a `get_state` checkpoint, without reading the JSON"""
+        importer = cls.__new__(cls)
+        LCIImporter.__init__(importer, name)
+        for attribute in cls.STATE_ATTRIBUTES:
+            setattr(importer, attribute, state[attribute])
+        return importer
+
     def write_database(self, data=None, name=None, *args, **kwargs):
         importer = super(SimaProJsonImporter, self)
         db = importer.write_database(data, name, *args, **kwargs)
@@ -0,0 +1,34 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import bw2data
+
+
+def _init_worker(project):
+    bw2data.projects.set_current(project)
+
+
+def _create_default_project():
+    # bw2data, imported with this module, creates the default project, and bw2io
+    # the directories it needs in it
+    import bw2io  # noqa: F401
+
+
+def spawn_executor(max_workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """A pool of `max_workers` processes, set on the current project.
+
+    Workers are spawned rather than forked, not to share the SQLite connection.
+    Importing Brightway sets the default project, creating it in a new brightway
+    directory: a first process creates it beforehand, so that the workers don't all
+    create it at once."""
+    context = multiprocessing.get_context("spawn")
+    if "default" not in bw2data.projects:
+        with ProcessPoolExecutor(1, mp_context=context) as executor:
+            executor.submit(_create_default_project).result()
+    return ProcessPoolExecutor(
+        max_workers,
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(bw2data.projects.current,),
+    )
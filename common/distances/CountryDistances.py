@@ -1,8 +1,17 @@
+import numpy as np
+
+
 class CountryDistances:
-    def __init__(self, distances):
-        self.distances = self._convert_distances(distances)
-        self._all_countries = set()
-        self._update_all_countries()
+    """
+    The distances between countries, for each transport mode.
+
+    The countries are indexed, and the distances are stored in a dense
+    (countries × countries × modes) array, symmetric in the two first axes. A missing
+    distance for a mode (no road between two countries) is NaN, and the `defined`
+    mask tells which pairs of countries have distances at all.
+    """
+
+    MODES = ("air", "road", "sea")
 
     self_distance = {
         "road": 500,
@@ -10,48 +19,123 @@ class CountryDistances:
         "air": 500,
     }
 
+    def __init__(self, distances):
+        self.countries = []
+        self.index = {}
+        self.values = np.full((0, 0, len(self.MODES)), np.nan)
+        self.defined = np.zeros((0, 0), dtype=bool)
+
+        pairs = self._convert_distances(distances)
+        self._add_countries(
+            sorted(
+                {
+                    country
+                    for countryA, countryB, _ in pairs
+                    for country in (countryA, countryB)
+                }
+            )
+        )
+        self._set_pairs(pairs)
+
     def _convert_distances(self, distances):
         """
-        Converts the nested country distance dictionary into a flat dictionary with alphabetical keys.
+        Converts the nested country distance dictionary into a list of (countryA, countryB, distance).
         """
-        flat_distances = {}
-        for countryA, destinations in distances.items():
-            for countryB, distance in destinations.items():
-                key = "|".join(sorted([countryA, countryB]))
-                flat_distances[key] = distance
-        return flat_distances
+        return [
+            (countryA, countryB, distance)
+            for countryA, destinations in distances.items()
+            for countryB, distance in destinations.items()
+        ]
 
-    def _update_all_countries(self):
+    @property
+    def _all_countries(self):
         """
         Returns a set of all countries for which distances are defined.
         """
-        countries = set()
-        for key in self.distances.keys():
-            countries.update(key.split("|"))
-        self._all_countries = countries
+        return {
+            country
+            for country, defined in zip(self.countries, self.defined.any(axis=1))
+            if defined
+        }
+
+    def _add_countries(self, countries):
+        countries = [
+            country for country in dict.fromkeys(countries) if country not in self.index
+        ]
+        if not countries:
+            return
+        for country in countries:
+            self.index[country] = len(self.countries)
+            self.countries.append(country)
+
+        size = len(self.countries)
+        added = size - self.values.shape[0]
+        self.values = np.pad(
+            self.values, ((0, added), (0, added), (0, 0)), constant_values=np.nan
+        )
+        self.defined = np.pad(self.defined, ((0, added), (0, added)))
+
+    def _to_row(self, distance):
+        unknown_modes = set(distance) - set(self.MODES)
+        if unknown_modes:
+            raise ValueError(f"Unknown transport modes: {unknown_modes}")
+        return [
+            np.nan if distance.get(mode) is None else distance[mode]
+            for mode in self.MODES
+        ]
+
+    def _set_pairs(self, pairs):
+        """
+        Sets the distances of a list of (countryA, countryB, distance), in both directions.
+        """
+        if not pairs:
+            return
+        rows = np.array([self.index[countryA] for countryA, _, _ in pairs])
+        columns = np.array([self.index[countryB] for _, countryB, _ in pairs])
+        values = np.array(
+            [self._to_row(distance) for _, _, distance in pairs], dtype="float64"
+        )
+        self.values[rows, columns] = values
+        self.values[columns, rows] = values
+        self.defined[rows, columns] = True
+        self.defined[columns, rows] = True
+
+    def _to_distance(self, row):
+        """
+        The distance dictionary of a row of values, given as a list of floats.
+        """
+        return {
+            # NaN is the only value that isn't equal to itself
+            mode: None
+            if value != value
+            else int(value)
+            if value.is_integer()
+            else value
+            for mode, value in zip(self.MODES, row)
+        }
 
     def get(self, countryA, countryB):
         """
         Returns the distance between two countries.
         """
-        key = "|".join(sorted([countryA, countryB]))
-        return self.distances.get(key, None)
+        i, j = self.index.get(countryA), self.index.get(countryB)
+        if i is None or j is None or not self.defined[i, j]:
+            return None
+        return self._to_distance(self.values[i, j].tolist())
 
     def validate(self):
         """
         Validates that each country has a distance defined for all other countries in the dataset.
         Returns True if validation passes, otherwise raises a ValueError with details.
         """
-        countries = self._all_countries
-
-        missing_pairs = set()
-        for countryA in countries:
-            for countryB in countries:
-                key = "|".join(sorted([countryA, countryB]))
-                if key not in self.distances:
-                    missing_pairs.add(key)
-
-        if missing_pairs:
+        # Only the countries for which distances are defined
+        countries = self.defined.any(axis=1)
+        missing = ~self.defined & countries[:, None] & countries[None, :]
+        if missing.any():
+            missing_pairs = {
+                "|".join(sorted([self.countries[i], self.countries[j]]))
+                for i, j in zip(*np.nonzero(missing))
+            }
             raise ValueError(f"Missing distances for country pairs: {missing_pairs}")
         return True
 
@@ -59,64 +143,101 @@ class CountryDistances:
         """
         Extracts and returns a dictionary of distances involving the specified country.
         """
-        country_distances = {}
-        for key, distance in self.distances.items():
-            if country in key:
-                # Extract the other country's name and map the distance
-                other_country = key.replace(country, "").replace("|", "")
-                if other_country:
-                    country_distances[other_country] = distance
-        return country_distances
+        i = self.index.get(country)
+        if i is None:
+            return {}
+        columns = [j for j in np.nonzero(self.defined[i])[0].tolist() if j != i]
+        return {
+            self.countries[j]: self._to_distance(row)
+            for j, row in zip(columns, self.values[i, columns].tolist())
+        }
 
     def add_country(self, country, distances):
         """
         Adds a new country and its distances to other countries.
         """
-        for countryB, distance in distances.items():
-            self.distances["|".join(sorted([country, countryB]))] = distance
+        self._add_countries([country, *distances])
+        self._set_pairs(
+            [(country, countryB, distance) for countryB, distance in distances.items()]
+        )
 
         self.validate()
-        self._update_all_countries()
 
     def export_to_nested_dict(self):
         """
-        Serializes the flat distance structure back into a nested dictionary format.
+        Serializes the distances back into a nested dictionary format, each pair being
+        under the country that comes first in alphabetical order.
         """
-        nested_dict = {}
-        for key, distance in self.distances.items():
-            countryA, countryB = key.split("|")
-            if countryA not in nested_dict:
-                nested_dict[countryA] = {}
-            if countryB not in nested_dict:
-                nested_dict[countryB] = {}
-            nested_dict[countryA][countryB] = distance
+        order = sorted(self._all_countries)
+        indexes = np.array([self.index[country] for country in order], dtype=np.intp)
+        defined = np.triu(self.defined[np.ix_(indexes, indexes)])
+        values = self.values[np.ix_(indexes, indexes)]
+
+        rows, columns = np.nonzero(defined)
+        nested_dict = {country: {} for country in order}
+        for i, j, row in zip(
+            rows.tolist(), columns.tolist(), values[rows, columns].tolist()
+        ):
+            nested_dict[order[i]][order[j]] = self._to_distance(row)
         return nested_dict
 
     def add_region(self, new_region, corresponding_country):
-        print(
-            f"Adding region {new_region} with corresponding country {corresponding_country}"
+        self.add_regions({new_region: corresponding_country})
+
+    def add_regions(self, regions):
+        """
+        Adds regions, at the same distance from every country as their corresponding country.
+        """
+        for new_region, corresponding_country in regions.items():
+            print(
+                f"Adding region {new_region} with corresponding country {corresponding_country}"
+            )
+        # Grow the arrays once for all the regions
+        self._add_countries(list(regions))
+
+        for new_region, corresponding_country in regions.items():
+            i, j = self.index[corresponding_country], self.index[new_region]
+            self.values[j, :] = self.values[i, :]
+            self.values[:, j] = self.values[:, i]
+            self.defined[j, :] = self.defined[i, :]
+            self.defined[:, j] = self.defined[:, i]
+            # We have to add the distance from the new_region to its corresponding country manually
+            self._set_pairs(
+                [
+                    (new_region, corresponding_country, self.self_distance),
+                    (new_region, new_region, self.self_distance),
+                ]
+            )
+
+        self.validate()
+
+    def delete_countries(self, countries):
+        """
+        Deletes countries and their associated distances from the object.
+        """
+        deleted = {
+            self.index[country] for country in countries if country in self.index
+        }
+        if not deleted:
+            return
+        kept = np.array(
+            [i for i in range(len(self.countries)) if i not in deleted], dtype=np.intp
         )
-        new_region_distances = self.extract_distances_for_country(corresponding_country)
-        # We have to add the distance from the new_region to its corresponding country manually
-        new_region_distances[corresponding_country] = self.self_distance
-        new_region_distances[new_region] = self.self_distance
-        self.add_country(new_region, new_region_distances)
-        self._update_all_countries()
+        self.values = self.values[np.ix_(kept, kept)]
+        self.defined = self.defined[np.ix_(kept, kept)]
+        self.countries = [self.countries[i] for i in kept]
+        self.index = {country: i for i, country in enumerate(self.countries)}
 
     def delete_country(self, country):
         """
         Deletes a country and its associated distances from the object.
         """
-        keys_to_delete = [key for key in self.distances if country in key.split("|")]
-        for key in keys_to_delete:
-            del self.distances[key]
-        self._update_all_countries()
+        self.delete_countries([country])
 
     def add_self_distances(self):
         """
         Adds a self-referential distance of 500 for each country.
         """
-        for country in self._all_countries:
-            self.distances[f"{country}|{country}"] = self.self_distance
-
-        self._update_all_countries()
+        self._set_pairs(
+            [(country, country, self.self_distance) for country in self._all_countries]
+        )
@@ -0,0 +1,215 @@
+import asyncio
+import itertools
+import json
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from ecobalyse_data.logging import logger
+
+Route = Tuple[str, str]
+
+DEFAULT_WORKERS = 4
+DEFAULT_RETRIES = 5
+
+
+class DistanceProvider(ABC):
+    """A source of distances between countries, for one or several transport modes"""
+
+    # The transport modes ("road", "sea", "air") the provider gives the distances for
+    modes: Tuple[str, ...] = ()
+    # The maximum number of requests per second, None for no limit
+    rate: Optional[float] = None
+
+    @abstractmethod
+    def get_distance(self, mode: str, route: Route) -> Optional[int]:
+        """The distance of the route in km for the transport `mode`, None if there's
+        no such route. Raise an exception when the distance couldn't be fetched, to
+        retry later."""
+
+
+class TokenBucket:
+    """Allow `rate` acquisitions per second on average, with bursts of up to
+    `capacity`"""
+
+    def __init__(self, rate: float, capacity: int = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated_at) * self.rate
+                )
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class RouteCheckpoint:
+    """The distances of the fetched routes, appended to a JSON lines file as soon as
+    each route is complete, so that an interrupted run can be resumed"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+
+    def load(self) -> Dict[Route, dict]:
+        if not self.path.is_file():
+            return {}
+        distances = {}
+        with open(self.path, "r") as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # The last line of an interrupted run
+                    logger.warning(f"-> Ignoring a corrupted line of {self.path}")
+                    continue
+                distances[tuple(entry["route"])] = entry["distances"]
+        return distances
+
+    def append(self, route: Route, distances: dict):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a") as file:
+            file.write(json.dumps({"route": route, "distances": distances}) + "\n")
+
+
+def routes_for(countries: Iterable[str]) -> List[Route]:
+    """The n(n-1)/2 routes between the countries, each in alphabetical order"""
+    return list(itertools.combinations(sorted(set(countries)), 2))
+
+
+def existing_routes(distances: dict) -> Dict[Route, dict]:
+    """The routes of nested distances, like the ones of `distances_raw.json`"""
+    return {
+        tuple(sorted((country_from, country_to))): route_distances
+        for country_from, destinations in distances.items()
+        for country_to, route_distances in destinations.items()
+    }
+
+
+def to_nested_distances(countries: Iterable[str], distances: Dict[Route, dict]) -> dict:
+    """The distances of the routes, nested by country as in `distances_raw.json`"""
+    nested = {country: {} for country in sorted(set(countries))}
+    for (country_from, country_to), route_distances in sorted(distances.items()):
+        if country_from in nested and country_to in nested:
+            nested[country_from][country_to] = route_distances
+    return nested
+
+
+class DistanceFetcher:
+    """Fetch the distances of many routes from the `providers`, with `workers` routes
+    fetched at a time and the requests to each provider rate limited.
+
+    The routes already in the checkpoint, or in the `existing` distances, are not
+    fetched again."""
+
+    def __init__(
+        self,
+        providers: List[DistanceProvider],
+        checkpoint: Optional[RouteCheckpoint] = None,
+        workers: int = DEFAULT_WORKERS,
+        retries: int = DEFAULT_RETRIES,
+        backoff: float = 1.0,
+    ):
+        self.providers = providers
+        self.checkpoint = checkpoint
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+
+    async def _get_distance(
+        self,
+        provider: DistanceProvider,
+        bucket: Optional[TokenBucket],
+        mode: str,
+        route: Route,
+        executor: ThreadPoolExecutor,
+    ) -> Optional[int]:
+        for attempt in range(self.retries):
+            if bucket is not None:
+                await bucket.acquire()
+            try:
+                return await asyncio.get_running_loop().run_in_executor(
+                    executor, provider.get_distance, mode, route
+                )
+            except Exception as e:
+                if attempt == self.retries - 1:
+                    raise
+                logger.debug(f"-> Retrying {mode} distance for {route}: {e}")
+                await asyncio.sleep(self.backoff * 2**attempt)
+
+    async def _fetch_route(self, route, buckets, executor) -> dict:
+        distances = {}
+        for provider in self.providers:
+            for mode in provider.modes:
+                distances[mode] = await self._get_distance(
+                    provider, buckets[id(provider)], mode, route, executor
+                )
+        return distances
+
+    async def fetch_routes(self, routes: List[Route]) -> Tuple[Dict[Route, dict], set]:
+        """The distances of the `routes` that could be fetched, and the routes that
+        couldn't"""
+        buckets = {
+            id(provider): TokenBucket(provider.rate) if provider.rate else None
+            for provider in self.providers
+        }
+        queue = asyncio.Queue()
+        for route in routes:
+            queue.put_nowait(route)
+        fetched, failed = {}, set()
+
+        async def worker(executor):
+            while not queue.empty():
+                route = queue.get_nowait()
+                try:
+                    distances = await self._fetch_route(route, buckets, executor)
+                except Exception as e:
+                    logger.error(f"-> Failed to get the distances for {route}: {e}")
+                    failed.add(route)
+                    continue
+                fetched[route] = distances
+                if self.checkpoint is not None:
+                    self.checkpoint.append(route, distances)
+                logger.info(
+                    f"-> [{len(fetched) + len(failed)}/{len(routes)}] Distances for {route}: {distances}"
+                )
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            await asyncio.gather(*[worker(executor) for _ in range(self.workers)])
+        return fetched, failed
+
+    def fetch(self, countries: Iterable[str], existing: Optional[dict] = None) -> dict:
+        """The nested distances between all the `countries`, only fetching the routes
+        that are neither in the checkpoint nor in the `existing` nested distances.
+
+        The known routes between other countries are kept in the result."""
+        countries = sorted(set(countries))
+        existing = existing or {}
+        known = existing_routes(existing)
+        if self.checkpoint is not None:
+            known.update(self.checkpoint.load())
+
+        missing = [route for route in routes_for(countries) if route not in known]
+        logger.info(
+            f"-> Fetching the distances of {len(missing)} routes, {len(routes_for(countries)) - len(missing)} already known"
+        )
+        fetched, failed = asyncio.run(self.fetch_routes(missing))
+        if failed:
+            raise ValueError(
+                f"Failed to get the distances for {len(failed)} routes: {sorted(failed)}. Run again to only fetch them."
+            )
+        distances = {**known, **fetched}
+        return to_nested_distances(
+            set(countries).union(existing, *distances), distances
+        )
@@ -1,22 +1,35 @@
 import json
 import random
-import time
-from datetime import datetime
+from pathlib import Path
 
 import geopy.distance
 import pandas as pd
 import requests
 
+from common.distances.fetcher import (
+    DistanceFetcher,
+    DistanceProvider,
+    RouteCheckpoint,
+)
+from common.export import load_json
+from config import PROJECT_ROOT_DIR, settings
+from ecobalyse_data.logging import logger
+
 """Script to get the distances between countries for a list of countries. To identify countries we use the 2 letters code (France->FR).
 
 
 # Runtime
-Takes about 1 minute to compute 10 routes.
-10 countries -> 45 routes -> 4.5 minutes
 The number of routes is n(n-1)/2 with n the number of countries.
-20 countries -> 190 routes -> 19 minutes
+The Searates API is queried at most once per second (2 queries per route), from a few workers.
+20 countries -> 190 routes -> about 6 minutes
+
+Only the routes missing from `distances_raw.json` are fetched. Each fetched route is saved
+in a checkpoint, in the cache directory: an interrupted run starts again where it stopped.
 """
 
+DISTANCES_RAW = PROJECT_ROOT_DIR / "common" / "distances" / "distances_raw.json"
+CHECKPOINT = Path(settings.CACHE_DIR) / "distances-checkpoint.jsonl"
+
 
 # select list of countries to calculate distances
 # be careful, the number of pairs of n countries is big : n(n-1)/2
@@ -60,50 +73,62 @@ countries = [
 ]
 
 
-def getSearatesDistance(route_type, route, headers):
-    """Query the Searates API for a route ("FR","CN") and a route_type ("road") and returns the distance
+class SearatesProvider(DistanceProvider):
+    """The road and sea distances of the Searates API"""
 
-    Args:@@
-        route_type (string): "road", "sea" or "air"
-        route (tuple): Pair of countries alpha 2 codes : ("FR","CN")
+    modes = ("road", "sea")
+    # Searates stops answering when queried too fast
+    rate = 1.0
 
-    Returns:
-        float : distance of the route in km for the given route_type
-    """
-    url = buildSearatesQuery(route_type, route)
-    retries = 5
-
-    dist = None
-
-    for i in range(retries):
-        try:
-            response = requests.get(
-                url,
-                headers=headers,
-                # proxies={"http": proxy, "https": proxy}
-            )
-            resp_json = response.json()
-            if route_type == "road":
-                dist = round(float(resp_json[route_type]["distance"]))
-            else:
-                dist = round(float(resp_json[route_type]["dist"]))
-            break
-
-        except Exception:
-            print("Error")
-            time.sleep(1)
-            if i == 5:
-                print(
-                    "failed to get distance for " + str(route_type) + " " + str(route)
-                )
-
-    return dist
-
-
-def buildSearatesQuery(route_type, route):
+    def __init__(self, country_coords):
+        self.country_coords = country_coords
+        self.session = requests.Session()
+
+    def get_distance(self, mode, route):
+        """Query the Searates API for a route ("FR","CN") and a mode ("road") and returns the distance
+
+        Args:
+            mode (string): "road" or "sea"
+            route (tuple): Pair of countries alpha 2 codes : ("FR","CN")
+
+        Returns:
+            int : distance of the route in km for the given mode, None if there's no route
+        """
+        # Searates API won't work after a nb of requests, changing the user agent fixes that
+        headers = {"User-Agent": random.choice(user_agent_list)}
+        response = self.session.get(
+            buildSearatesQuery(self.country_coords, mode, route),
+            headers=headers,
+            timeout=(10, 60),
+        )
+        response.raise_for_status()
+        resp_json = response.json()
+        if not resp_json.get(mode):
+            return None
+        return round(float(resp_json[mode]["distance" if mode == "road" else "dist"]))
+
+
+class GreatCircleProvider(DistanceProvider):
+    """The air distances, between the average coordinates of the countries"""
+
+    modes = ("air",)
+
+    def __init__(self, country_coords):
+        self.country_coords = country_coords
+
+    def get_distance(self, mode, route):
+        return round(
+            geopy.distance.distance(
+                self.country_coords[route[0]], self.country_coords[route[1]]
+            ).km
+        )
+
+
+def buildSearatesQuery(country_coords, route_type, route):
     """build the url to query the searates API based on a route ("FR","CN") and a route_type ("road")
 
     Args:
+        country_coords (dict): country alpha 2 code -> (latitude, longitude)
         route_type (string): "road", "sea" or "air"
         route (tuple): Pair of countries alpha 2 codes : ("FR","CN")
 
@@ -121,70 +146,6 @@ def buildSearatesQuery(route_type, route):
     return base_url + from_str + to_str + countries_str
 
 
-def compute_distances(countries, intermediarySave=False):
-    remaining_countries = countries.copy()
-
-    index = 1
-    for i, country_from in enumerate(countries):
-        # pick a random user_agent
-        user_agent = random.choice(user_agent_list)
-        headers = {"User-Agent": user_agent}
-        # remove current country (country_from) from remaining_countries
-        remaining_countries.remove(country_from)
-        # for current country build a dictionary of distances with all remaining countries
-        country_from_dic = {}
-
-        if len(remaining_countries) > 0:
-            # iterate on all remaining countries (country_to)
-            for i2, country_to in enumerate(remaining_countries):
-                route = (country_from, country_to)
-                # sleep 10 seconds 1 out of 10 times
-                # if random.randint(1, 10) == 10:
-                #    time.sleep(10)
-                # sleep for a few seconds
-                time.sleep(random.randint(1, 3))
-                timeObj = str(datetime.now().time())
-
-                print(
-                    timeObj
-                    + " computing distances for route "
-                    + str(index)
-                    + " out of "
-                    + str(nb_routes)
-                    + " : "
-                    + str(route)
-                )
-
-                # get distances between country_from and country_to
-                country_from_dic[country_to] = {
-                    "road": getSearatesDistance("road", route, headers),
-                    "sea": getSearatesDistance("sea", route, headers),
-                    "air": round(
-                        geopy.distance.distance(
-                            country_coords[route[0]], country_coords[route[1]]
-                        ).km
-                    ),
-                }
-                index += 1
-            # add dictionary of distances to master dictionary
-            distances[country_from] = country_from_dic
-            timeObj = str(datetime.now().time())
-            print(timeObj + " finished computing distances for " + country_from)
-        else:
-            distances[country_from] = {}
-
-        if i % 2 == 0 and intermediarySave:
-            with open("distances_" + str(index) + ".json", "w") as outfile:
-                json.dump(distances, outfile)
-            timeObj = str(datetime.now().time())
-            print(timeObj + " " + str(index) + " writing intermediate output")
-
-        print(remaining_countries)
-
-
-# Searates API won't work after a nb of requests
-# Changing the user agent fix that
-
 user_agent_list = [
     "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_5) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/13.1.1 Safari/605.1.15",
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:77.0) Gecko/20100101 Firefox/77.0",
@@ -192,7 +153,6 @@ user_agent_list = [
     "Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:77.0) Gecko/20100101 Firefox/77.0",
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/83.0.4103.97 Safari/537.36",
 ]
-url = "https://httpbin.org/headers"
 
 
 if __name__ == "__main__":
@@ -208,19 +168,15 @@ if __name__ == "__main__":
             float(country_data["Longitude (average)"]),
         )
 
-    countries = sorted(countries)
-
-    # log the nb of routes
-
-    distances = {}
-
-    n = len(countries)
-    nb_routes = round(n * (n - 1) / 2)
-    print("number of routes : " + str(nb_routes))
+    # The routes of distances_raw.json are kept, only the missing ones are fetched
+    existing = load_json(DISTANCES_RAW) if DISTANCES_RAW.is_file() else {}
 
-    compute_distances(countries, intermediarySave=True)
+    fetcher = DistanceFetcher(
+        [SearatesProvider(country_coords), GreatCircleProvider(country_coords)],
+        checkpoint=RouteCheckpoint(CHECKPOINT),
+    )
+    distances = fetcher.fetch(countries, existing=existing)
 
-    with open("distances_raw.json", "w") as outfile:
-        json.dump(distances, outfile)
-    timeObj = str(datetime.now().time())
-    print(timeObj + " finished writing output to distances.json")
+    with open(DISTANCES_RAW, "w") as outfile:
+        json.dump(distances, outfile, indent=2, sort_keys=True)
+    logger.info(f"Finished writing output to {DISTANCES_RAW}")
@@ -36,18 +36,18 @@ if __name__ == "__main__":
 
     countries_official_list = set([c["code"] for c in load_json(COUNTRIES_OFFICIAL)])
     # delete countries that are not needed
-    for country in country_distances._all_countries:
-        if (
-            country not in countries_official_list
+    country_distances.delete_countries(
+        [
+            country
+            for country in country_distances._all_countries
+            if country not in countries_official_list
             and country not in placeholder_countries
-        ):
-            country_distances.delete_country(country)
+        ]
+    )
 
-    for region, corresponding_country in regions.items():
-        country_distances.add_region(region, corresponding_country)
+    country_distances.add_regions(regions)
 
-    for country in placeholder_countries:
-        country_distances.delete_country(country)
+    country_distances.delete_countries(placeholder_countries)
 
     if (countries_real := country_distances._all_countries) != countries_official_list:
         missing_countries = countries_official_list - countries_real
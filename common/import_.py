@@ -1,33 +1,36 @@
-import functools
-import json
 import sys
 from enum import StrEnum
 from pathlib import Path, PurePosixPath
-from typing import List, Optional
+from typing import Optional
 
 import bw2data
 import bw2io
-from bw2io.strategies.generic import link_iterable_by_fields
-from bw2io.utils import activity_hash
+import orjson
+from bw2io.utils import DEFAULT_FIELDS, activity_hash
 
 from common import biosphere
 from common.bw.simapro_json import SimaProJsonImporter, export_zipped_csv_to_json
 from config import settings
 from ecobalyse_data import s3
-from ecobalyse_data.bw.search import cached_search_one
+from ecobalyse_data.bw.checkpoint import (
+    Checkpoints,
+    fingerprint,
+    migrations_fingerprint,
+    strategy_fingerprint,
+)
+from ecobalyse_data.bw.created_activities import build_created_activities
+from ecobalyse_data.bw.linking import (
+    Linker,
+    LinkingPass,
+    append_activities,
+    database_fingerprint,
+    save_database_index,
+)
+from ecobalyse_data.bw.parallel import parallelize_strategies
+from ecobalyse_data.bw.profiling import Profiler
 from ecobalyse_data.logging import logger
 
 
-class ActivityFrom(StrEnum):
-    SCRATCH = "from_scratch"
-    EXISTING = "from_existing"
-
-
-class ExchangeType(StrEnum):
-    TECHNOSPHERE = "technosphere"
-    BIOSPHERE = "biosphere"
-
-
 def setup_project(
     setup_biosphere=True,
 ):
@@ -60,352 +63,33 @@ def setup_project(
     bw2io.create_core_migrations()
 
 
-def link_technosphere_by_activity_hash_ref_product(
-    db, external_db_name: Optional[str] = None, fields: Optional[List[str]] = None
-):
-    """
-    This is a custom version of `bw2io.strategies.generic.link_technosphere_by_activity_hash`
-
-    It adds the check for "processwithreferenceproduct" that was added in https://github.com/brightway-lca/brightway2-data/blob/main/CHANGES.md#40dev57-2024-10-03
-    and avoid breaking the linking as processes are now imported with the default type "processwithreferenceproduct"
-    """
-
-    TECHNOSPHERE_TYPES = {"technosphere", "substitution", "production"}
-    if external_db_name is not None:
-        other = (
-            obj
-            for obj in bw2data.Database(external_db_name)
-            if obj.get("type", "process") == "process"
-            or obj.get("type") == "processwithreferenceproduct"
-        )
-        internal = False
-    else:
-        other = None
-        internal = True
-    return link_iterable_by_fields(
-        db, other, internal=internal, kind=TECHNOSPHERE_TYPES, fields=fields
-    )
-
-
-def search_activity(activity_dict: dict, default_db: str | None = None):
-    """Search for an activity using either a string or dict specification.
-
-    Args:
-        activity_dict: dict with keys:
-                  - name (required): activity name
-                  - database (optional): database name (uses default_db if not provided)
-                  - location (optional): location code
-                  - code (optional): specific activity code/UUID
-        default_db: Default database name if not specified
-
-    Returns:
-        The found activity
-    """
-    if isinstance(activity_dict, dict):
-        db_name = activity_dict.get("database", default_db)
-        if db_name is None:
-            raise ValueError("No database specified in activity dict or default_db")
-        activity_name = activity_dict["name"]
-        location = activity_dict.get("location")
-        code = activity_dict.get("code")
-        categories = activity_dict.get("categories")
-        unit = activity_dict.get("unit")
-
-        result = cached_search_one(
-            db_name,
-            activity_name,
-            location=location,
-            code=code,
-            categories=tuple(categories) if categories else None,
-            unit=unit,
-        )
-        return result
-    else:
-        raise ValueError("Activity must be a dict")
-
-
-def create_activity(
-    dbname, new_activity_name, base_activity=None, unit="kilogram", location=None
-):
-    """Creates a new activity by copying a base activity or from nothing. Returns the created activity"""
-
-    if base_activity:
-        data = base_activity.as_dict().copy()
-        del data["code"]
-        # Id should be autogenerated or BW will throw an error
-        # `id` must be created automatically, but `id=137934742532190208` given
-        if "id" in data:
-            del data["id"]
-        data["name"] = new_activity_name
-        data["System description"] = "Ecobalyse"
-        data["database"] = "Ecobalyse"
-        # see https://github.com/brightway-lca/brightway2-data/blob/main/CHANGES.md#40dev57-2024-10-03
-        data["type"] = "processwithreferenceproduct"
-        if location is not None:
-            data["location"] = location
-        code = activity_hash(data)
-        new_activity = base_activity.copy(code, **data)
-    else:
-        data = {
-            "production amount": 1,
-            "unit": unit,
-            # see https://github.com/brightway-lca/brightway2-data/blob/main/CHANGES.md#40dev57-2024-10-03
-            "type": "processwithreferenceproduct",
-            "comment": "",
-            "name": new_activity_name,
-            "System description": "Ecobalyse",
-            "location": location,
-        }
-        code = activity_hash(data)
-        new_activity = bw2data.Database(dbname).new_activity(code, **data)
-        new_activity["code"] = code
-    new_activity["Process identifier"] = code
-    new_activity.save()
-    logger.debug(f"Created activity {new_activity}")
-    return new_activity
-
-
 def add_created_activities(created_activities_db, activities_to_create):
     """
     Once the agribalyse database has been imported, add to the database the new activities defined in `ACTIVITIES_TO_CREATE.json`.
-    """
-    with open(activities_to_create, "r") as f:
-        activities_data = json.load(f)
-
-    bw2data.Database(created_activities_db).register()
-
-    for activity_data in activities_data:
-        logger.debug(
-            f"-> Creating activity {activity_data.get('activityCreationType')} '{activity_data.get('alias')}'"
-        )
-        if activity_data.get("activityCreationType") == ActivityFrom.SCRATCH:
-            add_activity_from_scratch(activity_data, created_activities_db)
-            logger.debug("-")
-        if activity_data.get("activityCreationType") == ActivityFrom.EXISTING:
-            add_activity_from_existing(activity_data, created_activities_db)
-            logger.debug("-")
-
-
-def add_activity_from_scratch(activity_data, dbname):
-    """Add to the database dbname a new activity created from scratch
-
-    Example : the "diesel, B7" activity is created from scratch with the following exchanges
-    defined in activities_to_create.json
-
-    "exchanges": [
-      {
-        {
-          "name": "Carbon dioxide, fossil",
-          "code": "349b29d1-3e58-4c66-98b9-9d1a076efd2e",
-          "database": "biosphere3"
-        },
-        "amount": 2.19
-      },
-      {
-        {
-          "name": "Carbon monoxide, fossil",
-          "code": "6edcc2df-88a3-48e1-83d8-ffc38d31c35b",
-          "database": "biosphere3"
-        },
-        "amount": 0.014
-      },
-     ...
-    """
-    unit = activity_data.get("unit", "kilogram")
-    activity_from_scratch = create_activity(
-        dbname,
-        f"{activity_data['newName']}",
-        unit=unit,
-        location=activity_data.get("location"),
-    )
 
-    for exchange_item in activity_data["exchanges"]:
-        amount = exchange_item["amount"]
-        activity_add = search_activity(exchange_item, activity_data["database"])
-        new_exchange(activity_from_scratch, activity_add, amount)
-
-    activity_from_scratch.save()
-
-
-def delete_exchange(activity, activity_to_delete, amount=False):
-    """Deletes an exchange from an activity."""
-    if amount:
-        for exchange in activity.exchanges():
-            if (
-                exchange.input["name"] == activity_to_delete["name"]
-                and exchange["amount"] == amount
-            ):
-                exchange.delete()
-                logger.debug(f"Deleted {exchange}")
-                return
-
-    else:
-        for exchange in activity.exchanges():
-            if exchange.input["name"] == activity_to_delete["name"]:
-                exchange.delete()
-                logger.debug(f"Deleted {exchange}")
-                return
-    raise ValueError(f"Did not find exchange {activity_to_delete}. No exchange deleted")
-
-
-def get_exchange_type(activity: dict) -> ExchangeType:
-    """Get the type of an exchange based on the activity"""
-    if activity.get("database") == "biosphere3":
-        return ExchangeType.BIOSPHERE
-    return ExchangeType.TECHNOSPHERE
-
-
-def new_exchange(activity, new_activity, new_amount=None, activity_to_copy_from=None):
-    """Create a new exchange. If an activity_to_copy_from is provided, the amount is copied from this activity. Otherwise, the amount is new_amount.
-
-    activity: the activity to which the new exchange is added
-    new_activity: the new exchange will link to this new_activity
-    new_amount: the amount of the new exchange
-    activity_to_copy_from: the activity from which the amount is copied
-    """
-    assert new_amount is not None or activity_to_copy_from is not None, (
-        "No amount or activity to copy from provided"
-    )
-    if new_amount is None and activity_to_copy_from is not None:
-        for exchange in list(activity.exchanges()):
-            if exchange.input["name"] == activity_to_copy_from["name"]:
-                new_amount = exchange["amount"]
-                break
-        else:
-            raise ValueError(
-                f"Exchange to duplicate from :{activity_to_copy_from} not found. No exchange added"
-            )
-
-    new_exchange = activity.new_exchange(
-        name=new_activity["name"],
-        input=new_activity,
-        amount=new_amount,
-        type=get_exchange_type(new_activity),
-        unit=new_activity["unit"],
-        comment="",
-    )
-    new_exchange.save()
-    logger.debug(f"Exchange {new_activity} added with amount: {new_amount}")
-
-
-def replace_activities(new_activity, activity_data, base_db):
-    """Replace all activities in activity_data["replace"] with variants of these activities"""
-    # replace is now an array of objects: [{"from": {...}, "to": {...}}, ...]
-    for replacement in activity_data["replacementPlan"].get("replace", []):
-        activity_to_be_replaced = search_activity(replacement["from"], base_db)
-        activity_replacing = search_activity(replacement["to"], base_db)
-        new_exchange(
-            new_activity,
-            activity_replacing,
-            activity_to_copy_from=activity_to_be_replaced,
-        )
-        delete_exchange(new_activity, activity_to_be_replaced)
-
-
-def add_activity_from_existing(activity_data, created_activities_db):
-    """Add to the database a new activity : the variant of an activity
-
-    Example : ingredient flour-organic is not in agribalyse so it is created at this step. It's a
-    variant of activity flour
+    The activities are built in memory and written at once.
     """
-    default_db = activity_data["database"]
-    # Example : the flour-conventional
-    # existingActivity is now an object: {"name": "...", "database": "..."}
-    existing_activity = search_activity(activity_data["existingActivity"], default_db)
-
-    # create a new  activity
-    # Example: this is where we create the flour-organic activity
-    new_activity = create_activity(
-        created_activities_db,
-        f"{activity_data['newName']}",
-        existing_activity,
-        location=activity_data.get("location"),
-    )
-
-    if "delete" in activity_data:
-        # delete is now an array of exchange objects: [{"name": "..."}, ...]
-        for exchange_spec in activity_data["delete"]:
-            for exchange in new_activity.exchanges():
-                if all(
-                    [exchange.get(spec[0]) == spec[1] for spec in exchange_spec.items()]
-                ):
-                    exchange.delete()
-                    logger.debug(f"Deleted {exchange}")
-
-    if "exchanges" in activity_data:
-        for exchange_item in activity_data["exchanges"]:
-            amount = exchange_item["amount"]
-            activity_add = search_activity(exchange_item, activity_data["database"])
-            new_exchange(new_activity, activity_add, amount)
-        new_activity.save()
-
-    if "replacementPlan" in activity_data:
-        # if the activity has no upstream path, we can directly replace the seed activity with the seed
-        #  activity variant
-        if not activity_data["replacementPlan"]["upstreamPath"]:
-            replace_activities(new_activity, activity_data, activity_data["database"])
-
-        # else we have to iterate through the upstream path and create a new variant activity for each upstream activity
-
-        # Example: for flour-organic we have to dig through the upstream process `global milling process` and
-        #  replace the wheat activity with the wheat-organic activity
-        else:
-            for i, upstream_activity_data in enumerate(
-                activity_data["replacementPlan"]["upstreamPath"]
-            ):
-                upstream_activity = search_activity(upstream_activity_data, default_db)
-
-                # create a new upstream_activity_variant
-                upstream_activity_variant = create_activity(
-                    created_activities_db,
-                    f"{upstream_activity['name']} {{{{{activity_data['alias']}}}}}",
-                    upstream_activity,
-                )
-                upstream_activity_variant.save()
-
-                # link the newly created upstream_activity_variant to the parent activity_variant
-                new_exchange(
-                    new_activity,
-                    upstream_activity_variant,
-                    activity_to_copy_from=upstream_activity,
-                )
-                delete_exchange(new_activity, upstream_activity)
-
-                # for the last upstream activity: apply replacements and add any exchanges
-                if i == len(activity_data["replacementPlan"]["upstreamPath"]) - 1:
-                    replace_activities(
-                        upstream_activity_variant,
-                        activity_data,
-                        upstream_activity["database"],
-                    )
-                    if "exchanges" in activity_data["replacementPlan"]:
-                        for exchange_item in activity_data["replacementPlan"][
-                            "exchanges"
-                        ]:
-                            amount = exchange_item["amount"]
-                            activity_add = search_activity(
-                                exchange_item, upstream_activity["database"]
-                            )
-                            new_exchange(
-                                upstream_activity_variant, activity_add, amount
-                            )
-                        upstream_activity_variant.save()
-
-                # update the activity_variant (parent activity)
-                new_activity = upstream_activity_variant
+    build_created_activities(created_activities_db, activities_to_create).write()
 
 
 def add_unlinked_flows_to_biosphere_database(
     database,
     biosphere_name=None,
     fields={"name", "unit", "categories"},
+    linker=None,
 ) -> None:
+    """Add the biosphere flows that could not be linked to the biosphere database,
+    then link them.
+
+    Only the flows that are not already in the biosphere are appended: the
+    biosphere is not rewritten. The hash index of the `linker` (or a persisted one)
+    is used and kept up to date instead of reading the whole biosphere."""
     biosphere_name = biosphere_name or bw2data.config.biosphere
     assert biosphere_name in bw2data.databases, (
         "{} biosphere database not found".format(biosphere_name)
     )
-
-    bio = bw2data.Database(biosphere_name)
+    linker = linker or Linker(biosphere=biosphere_name)
+    index = linker.get_index(biosphere_name, database.data)
 
     def reformat(exc):
         dct = {key: value for key, value in list(exc.items()) if key in fields}
@@ -417,34 +101,52 @@ def add_unlinked_flows_to_biosphere_database(
         )
         return dct
 
-    new_data = [
-        reformat(exc)
-        for ds in database.data
-        for exc in ds.get("exchanges", [])
-        if exc["type"] == "biosphere" and not exc.get("input")
-    ]
-
-    # Dictionary eliminate duplicates
-    # first load the new data with activity_hash
-    data = {(biosphere_name, exc["code"]): exc for exc in new_data}
-    # then deduplicate/overwrite them with original data
-    # still using the activity_hash as a key but the uuis as internal code
-    data.update(
-        {(biosphere_name, activity_hash(exc)): exc for exc in bio.load().values()}
-    )
-    # then reconstruct data with the uuid
-    data = {(biosphere_name, exc["code"]): exc for exc in data.values()}
-    bio.write(data)
+    # Dictionary eliminate duplicates, and existing flows are kept as they are
+    new_flows = {}
+    for ds in database.data:
+        for exc in ds.get("exchanges", []):
+            if exc["type"] == "biosphere" and not exc.get("input"):
+                flow = reformat(exc)
+                if flow not in index:
+                    new_flows.setdefault(flow["code"], flow)
+
+    if new_flows:
+        logger.info(f"-> Adding {len(new_flows)} new flows to {biosphere_name}")
+        append_activities(biosphere_name, list(new_flows.values()))
+        for flow in new_flows.values():
+            index.add(flow)
+        save_database_index(biosphere_name, index)
 
     database.apply_strategy(
-        functools.partial(
-            link_iterable_by_fields,
-            other=(obj for obj in bw2data.Database(biosphere_name)),
-            edge_kinds=["biosphere"],
-        ),
+        LinkingPass(linker, biosphere_name, DEFAULT_FIELDS, {"biosphere"})
     )
 
 
+def write_migrations(migrations):
+    """Register the `migrations` in the current project.
+
+    The migrations that are already registered with the same data are not written
+    again, so that concurrent imports only read the project migrations."""
+    for migration in migrations:
+        if migration["name"] in bw2io.migrations and bw2io.Migration(
+            migration["name"]
+        ).load() == orjson.loads(orjson.dumps(migration["data"])):
+            continue
+        bw2io.Migration(migration["name"]).write(
+            migration["data"],
+            description=migration["description"],
+        )
+
+
+class ImportStage(StrEnum):
+    """The stages of `import_simapro_csv` that can be resumed from, in order"""
+
+    EXTRACT = "extract"
+    MIGRATIONS = "migrations"
+    STRATEGIES = "strategies"
+    LINKING = "linking"
+
+
 def import_simapro_csv(
     database_s3_key: str,
     database_md5: str,
@@ -453,9 +155,26 @@ def import_simapro_csv(
     biosphere="biosphere3",
     migrations=[],
     strategies=[],
+    cpu_count=1,
+    from_stage: Optional[ImportStage] = None,
+    until_stage: Optional[ImportStage] = None,
 ):
     """
     Import the s3 file `database_s3_key` into a database named `dbname` and apply the provided brightway `migrations`.
+
+    The SimaPro datasets are read and the dataset-local `strategies` are applied on
+    `cpu_count` processes.
+
+    The state of the import is checkpointed after each stage and a rerun resumes after
+    the last stage whose inputs did not change. `from_stage` forces to rerun from
+    this stage (`extract` converts the CSV file to JSON again).
+
+    With `until_stage`, the import stops once this stage is checkpointed, without
+    writing anything to the project: a later call resumes from it. The checkpoint of
+    `extract` is the JSON file converted from the CSV file.
+
+    The time and memory of each stage are written to a JSON report in the
+    `import-reports` cache directory, see `bin/compare_import_reports.py`.
     """
     logger.info(f"🟢 Importing {database_s3_key} into {dbname}")
     assert PurePosixPath(database_s3_key).suffixes[-2:] in [
@@ -465,77 +184,150 @@ def import_simapro_csv(
         "⛔ the LCA databases should be zipped CSV files, and have a `.csv.zip` extension"
     )
 
-    local_path = s3.get_file(database_s3_key, database_md5)
+    profiler = Profiler(dbname)
+    try:
+        _import_simapro_csv(
+            profiler,
+            database_s3_key,
+            database_md5,
+            dbname,
+            external_db=external_db,
+            biosphere=biosphere,
+            migrations=migrations,
+            strategies=strategies,
+            cpu_count=cpu_count,
+            from_stage=from_stage,
+            until_stage=until_stage,
+        )
+    finally:
+        profiler.save(Path(settings.CACHE_DIR) / "import-reports")
+
+
+def _import_simapro_csv(
+    profiler: Profiler,
+    database_s3_key: str,
+    database_md5: str,
+    dbname,
+    external_db,
+    biosphere,
+    migrations,
+    strategies,
+    cpu_count,
+    from_stage: Optional[ImportStage],
+    until_stage: Optional[ImportStage],
+):
+    with profiler.stage("download"):
+        local_path = s3.get_file(database_s3_key, database_md5)
     json_datapath = local_path.parent / Path(local_path.stem).with_suffix(
         f".{database_md5}.json"
     )
 
-    if not json_datapath.is_file():
-        logger.info(
-            f"🟠 converting to JSON (that will only be done once) => {json_datapath}"
+    # Each checkpoint key depends on the key of the previous stage
+    keys = {ImportStage.EXTRACT: fingerprint(database_md5, dbname)}
+    keys[ImportStage.MIGRATIONS] = fingerprint(
+        keys[ImportStage.EXTRACT], migrations_fingerprint(migrations)
+    )
+    keys[ImportStage.STRATEGIES] = fingerprint(
+        keys[ImportStage.MIGRATIONS], *map(strategy_fingerprint, strategies)
+    )
+    keys[ImportStage.LINKING] = fingerprint(
+        keys[ImportStage.STRATEGIES],
+        external_db,
+        external_db and database_fingerprint(external_db),
+        biosphere,
+        database_fingerprint(biosphere),
+    )
+
+    stages = list(ImportStage)
+    checkpoints = Checkpoints(local_path.parent, Path(local_path.stem).stem)
+    resumed_stage, database = None, None
+    for stage in reversed(stages[1:]):
+        if from_stage is not None and stages.index(stage) >= stages.index(from_stage):
+            continue
+        if (
+            until_stage is not None
+            and stages.index(stage) >= stages.index(until_stage)
+            and checkpoints.exists(stage, keys[stage])
+        ):
+            logger.info(
+                f"🟢 {dbname} is already imported until the {until_stage} stage"
+            )
+            return
+        if (state := checkpoints.load(stage, keys[stage])) is not None:
+            resumed_stage = stage
+            database = SimaProJsonImporter.from_state(dbname, state)
+            break
+
+    def should_run(stage):
+        return resumed_stage is None or stages.index(stage) > stages.index(
+            resumed_stage
         )
-        export_zipped_csv_to_json(local_path, json_datapath, db_name=dbname)
-        assert json_datapath.is_file()
 
-    database = SimaProJsonImporter(str(json_datapath), dbname, normalize_biosphere=True)
+    def checkpoint(stage):
+        checkpoints.save(stage, keys[stage], database.get_state())
+        return stage == until_stage
 
-    logger.debug("Applying migrations")
-    # Apply provided migrations
-    for migration in migrations:
-        logger.debug(f"-> Applying custom migration: {migration['description']}")
-        bw2io.Migration(migration["name"]).write(
-            migration["data"],
-            description=migration["description"],
-        )
-        database.migrate(migration["name"])
-    database.statistics()
+    if database is None:
+        with profiler.stage(ImportStage.EXTRACT, data=lambda: database.data):
+            if not json_datapath.is_file() or from_stage == ImportStage.EXTRACT:
+                logger.info(
+                    f"🟠 converting to JSON (that will only be done once) => {json_datapath}"
+                )
+                export_zipped_csv_to_json(
+                    local_path, json_datapath, db_name=dbname, cpu_count=cpu_count
+                )
+                assert json_datapath.is_file()
 
-    logger.debug("Applying strategies")
-    database.strategies = strategies
+            database = SimaProJsonImporter(
+                str(json_datapath), dbname, normalize_biosphere=True
+            )
 
-    database.apply_strategies()
-    database.statistics()
+        # The JSON file converted from the CSV file is the checkpoint of this stage
+        if until_stage == ImportStage.EXTRACT:
+            return
 
-    # try to link remaining unlinked technosphere activities
-    database.apply_strategy(
-        functools.partial(
-            link_technosphere_by_activity_hash_ref_product,
-            fields=("name", "unit", "location"),
-        )
-    )
-    database.apply_strategy(
-        functools.partial(
-            link_technosphere_by_activity_hash_ref_product, fields=("name", "unit")
-        )
-    )
-    database.apply_strategy(
-        functools.partial(
-            link_technosphere_by_activity_hash_ref_product,
-            external_db_name=external_db,
-            fields=("name", "unit", "location"),
-        )
-    )
-    database.apply_strategy(
-        functools.partial(
-            link_technosphere_by_activity_hash_ref_product,
-            external_db_name=external_db,
-            fields=("name", "unit"),
+    if should_run(ImportStage.MIGRATIONS):
+        logger.debug("Applying migrations")
+        # Apply provided migrations
+        write_migrations(migrations)
+        for migration in migrations:
+            logger.debug(f"-> Applying custom migration: {migration['description']}")
+            with profiler.stage(
+                f"{ImportStage.MIGRATIONS}/{migration['name']}",
+                data=lambda: database.data,
+            ):
+                database.migrate(migration["name"])
+        database.statistics()
+        if checkpoint(ImportStage.MIGRATIONS):
+            return
+
+    if should_run(ImportStage.STRATEGIES):
+        logger.debug("Applying strategies")
+        # Consecutive dataset-local strategies are applied in a single pass over the
+        # datasets, sharded between `cpu_count` processes
+        database.strategies = parallelize_strategies(strategies, cpu_count)
+
+        profiler.apply_strategies(database)
+        database.statistics()
+        if checkpoint(ImportStage.STRATEGIES):
+            return
+
+    linker = Linker(external_db_name=external_db, biosphere=biosphere)
+    if should_run(ImportStage.LINKING):
+        # try to link remaining unlinked technosphere activities, then the biosphere flows
+        profiler.apply_strategies(
+            database, linker.strategies(), prefix=ImportStage.LINKING
         )
-    )
-    database.apply_strategy(
-        functools.partial(
-            link_iterable_by_fields,
-            other=bw2data.Database(biosphere),
-            kind="biosphere",
-        ),
-    )
 
-    database.statistics()
+        database.statistics()
+        if checkpoint(ImportStage.LINKING):
+            return
 
     logger.debug("Adding unlinked flows and activities")
     # comment to enable stopping on unlinked activities and creating an excel file
-    add_unlinked_flows_to_biosphere_database(database, biosphere)
-    database.add_unlinked_activities()
+    with profiler.stage("unlinked", data=lambda: database.data):
+        add_unlinked_flows_to_biosphere_database(database, biosphere, linker=linker)
+        database.add_unlinked_activities()
 
     # stop if there are unlinked activities
     if len(list(database.unlinked)):
@@ -551,7 +343,8 @@ def import_simapro_csv(
 
     database.statistics()
     bw2data.Database(biosphere).register()
-    database.write_database()
+    with profiler.stage("write", data=lambda: database.data):
+        database.write_database()
 
     logger.info(f"🟢 Finished importing {database_s3_key}")
 
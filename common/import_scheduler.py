@@ -0,0 +1,134 @@
+from concurrent.futures import FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+from graphlib import CycleError, TopologicalSorter
+from itertools import chain
+from typing import List, Optional
+
+import bw2data
+
+from common.bw.workers import spawn_executor
+from common.import_ import ImportStage, import_simapro_csv, write_migrations
+from ecobalyse_data.logging import logger
+
+
+@dataclass
+class DatabaseImport:
+    """A SimaPro database to import with `import_simapro_csv`"""
+
+    dbname: str
+    s3_key: str
+    md5: str
+    external_db: Optional[str] = None
+    migrations: list = field(default_factory=list)
+    strategies: list = field(default_factory=list)
+
+    @property
+    def dependencies(self) -> set:
+        """The databases that must be written before this one can be linked"""
+        return {self.external_db} if self.external_db is not None else set()
+
+    def run(self, **kwargs):
+        return import_simapro_csv(
+            self.s3_key,
+            self.md5,
+            self.dbname,
+            external_db=self.external_db,
+            migrations=self.migrations,
+            strategies=self.strategies,
+            **kwargs,
+        )
+
+
+def dependency_order(imports: List[DatabaseImport]) -> List[DatabaseImport]:
+    """Sort the imports so that each database comes after its dependencies.
+
+    The dependencies that are not imported must already be in the project."""
+    names = {imp.dbname for imp in imports}
+    for imp in imports:
+        for dependency in imp.dependencies - names:
+            if dependency not in bw2data.databases:
+                raise ValueError(
+                    f"{imp.dbname} depends on {dependency}, which is neither imported"
+                    " nor in the project"
+                )
+
+    sorter = TopologicalSorter(
+        {imp.dbname: imp.dependencies & names for imp in imports}
+    )
+    try:
+        order = list(sorter.static_order())
+    except CycleError as e:
+        raise ValueError(f"Circular dependencies between databases: {e.args[1]}")
+    by_name = {imp.dbname: imp for imp in imports}
+    return [by_name[name] for name in order]
+
+
+def _prepare(imp: DatabaseImport, cpu_count: int, from_stage):
+    imp.run(
+        cpu_count=cpu_count, from_stage=from_stage, until_stage=ImportStage.STRATEGIES
+    )
+
+
+def import_databases(
+    imports: List[DatabaseImport],
+    cpu_count: int = 1,
+    max_workers: Optional[int] = None,
+    from_stage: Optional[ImportStage] = None,
+):
+    """Import several databases concurrently.
+
+    The CSV conversion, migrations and strategies of each database don't touch the
+    SQLite database: they run in `max_workers` worker processes, that leave their
+    result as the checkpoint of the strategies stage. The linking and the write
+    then happen in the main process, one database at a time, as soon as a database
+    is prepared and its dependencies are written.
+
+    The `cpu_count` cores are shared between the workers to apply the strategies."""
+    pending = []
+    for imp in imports:
+        if imp.dbname in bw2data.databases:
+            logger.info(f"{imp.dbname} already imported")
+        else:
+            pending.append(imp)
+    if not pending:
+        return
+    order = dependency_order(pending)
+
+    # Migrations are registered in the project metadata: write them before
+    # starting the workers, so that they don't write the metadata concurrently
+    write_migrations(chain.from_iterable(imp.migrations for imp in order))
+
+    max_workers = min(max_workers or len(order), len(order))
+    names = {imp.dbname for imp in order}
+    sorter = TopologicalSorter({imp.dbname: imp.dependencies & names for imp in order})
+    sorter.prepare()
+    with spawn_executor(max_workers) as executor:
+        futures = {
+            imp.dbname: executor.submit(
+                _prepare, imp, max(cpu_count // max_workers, 1), from_stage
+            )
+            for imp in order
+        }
+        try:
+            ready = []
+            while sorter.is_active():
+                ready += sorter.get_ready()
+                prepared = [name for name in ready if futures[name].done()]
+                if not prepared:
+                    wait([futures[name] for name in ready], return_when=FIRST_COMPLETED)
+                    continue
+
+                # Keep the dependency order between the prepared databases
+                imp = next(imp for imp in order if imp.dbname in prepared)
+                futures[imp.dbname].result()
+                # Resume from the checkpoint left by the worker, except for the
+                # linking if it has to be redone
+                imp.run(
+                    cpu_count=cpu_count,
+                    from_stage=ImportStage.LINKING if from_stage is not None else None,
+                )
+                ready.remove(imp.dbname)
+                sorter.done(imp.dbname)
+        except BaseException:
+            executor.shutdown(cancel_futures=True)
+            raise
@@ -0,0 +1,200 @@
+import asyncio
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional
+
+import orjson
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config import settings
+from ecobalyse_data.logging import logger
+
+SCORE_CACHE_DIR = Path(settings.CACHE_DIR) / "score-history"
+
+DEFAULT_CONCURRENCY = 8
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (10, 120)
+DEFAULT_RETRIES = 3
+
+
+def query_hash(query: dict) -> str:
+    """Digest of a simulation query, independent of the order of its keys"""
+    return hashlib.blake2b(
+        orjson.dumps(query, option=orjson.OPT_SORT_KEYS), digest_size=16
+    ).hexdigest()
+
+
+def create_session(pool_size: int, retries: int = DEFAULT_RETRIES) -> requests.Session:
+    """A session keeping up to `pool_size` connections to the API open, that retries
+    the requests failing on a connection error or a server error"""
+    retry = Retry(
+        total=retries,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        # The simulations are POST requests, that don't change anything on the API
+        allowed_methods=None,
+    )
+    adapter = HTTPAdapter(pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_api_version(
+    session: requests.Session, api_url: str, timeout=DEFAULT_TIMEOUT
+) -> Optional[str]:
+    """The release tag of the app serving the API, from its `/version.json`, or None
+    if it can't be known.
+
+    Not its commit hash, that changes with every merge, even when the scores can't."""
+    try:
+        response = session.get(f"{api_url}/version.json", timeout=timeout)
+        response.raise_for_status()
+        version = response.json()
+    except (requests.RequestException, ValueError) as e:
+        logger.warning(f"-> Unable to get the version of the API at {api_url}: {e}")
+        return None
+    if not isinstance(version, dict):
+        return None
+    return version.get("tag")
+
+
+def data_digest(data_dir: Optional[Path]) -> Optional[str]:
+    """Digest of the JSON files of `data_dir`, the data the scores are computed from,
+    or None if there are none"""
+    if data_dir is None:
+        return None
+    data_dir = Path(data_dir)
+    paths = sorted(data_dir.rglob("*.json"))
+    if not paths:
+        return None
+    digest = hashlib.blake2b(digest_size=16)
+    for path in paths:
+        digest.update(path.relative_to(data_dir).as_posix().encode() + b"\0")
+        digest.update(path.read_bytes() + b"\0")
+    return digest.hexdigest()
+
+
+class ScoreCache:
+    """The responses of the API for a version of the data, stored in
+    `cache_dir/<version>/<query hash>.json`"""
+
+    def __init__(self, cache_dir: Path, version: str):
+        self.dir = Path(cache_dir) / version
+
+    def _path(self, endpoint: str, query: dict) -> Path:
+        return self.dir / f"{query_hash({'endpoint': endpoint, 'query': query})}.json"
+
+    def get(self, endpoint: str, query: dict) -> Optional[dict]:
+        path = self._path(endpoint, query)
+        if not path.is_file():
+            return None
+        try:
+            return orjson.loads(path.read_bytes())
+        except orjson.JSONDecodeError:
+            logger.warning(f"-> Ignoring corrupted score cache {path}")
+            return None
+
+    def set(self, endpoint: str, query: dict, response: dict):
+        path = self._path(endpoint, query)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write then rename, so that an interrupted run doesn't leave a partial file
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_bytes(orjson.dumps(response))
+        tmp_path.replace(path)
+
+
+class ScoreApiClient:
+    """Simulate the examples through the Ecobalyse API, `concurrency` requests at a
+    time.
+
+    The responses are cached by (API release, digest of the `data_dir` files, query
+    hash): the examples that didn't change since a previous run against the same data
+    are not simulated again, whatever the commit of the app. Without the data files,
+    nothing is cached."""
+
+    def __init__(
+        self,
+        api_url: str,
+        data_dir: Optional[Path] = None,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        timeout=DEFAULT_TIMEOUT,
+        retries: int = DEFAULT_RETRIES,
+        cache_dir: Optional[Path] = SCORE_CACHE_DIR,
+        session: Optional[requests.Session] = None,
+    ):
+        self.api_url = api_url.rstrip("/")
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.session = session or create_session(concurrency, retries)
+        self.api_version = get_api_version(self.session, self.api_url, timeout)
+        self.data_version = data_digest(data_dir)
+        self.cache = (
+            ScoreCache(
+                cache_dir,
+                query_hash({"api": self.api_version, "data": self.data_version}),
+            )
+            if cache_dir and self.data_version
+            else None
+        )
+        # The number of queries actually sent to the API
+        self.simulated = 0
+
+    def _post(self, endpoint: str, query: dict) -> dict:
+        response = self.session.post(
+            f"{self.api_url}{endpoint}", json=query, timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def _simulate(
+        self,
+        endpoint: str,
+        query: dict,
+        semaphore: asyncio.Semaphore,
+        executor: ThreadPoolExecutor,
+    ) -> dict:
+        if self.cache is not None:
+            cached = self.cache.get(endpoint, query)
+            if cached is not None:
+                return cached
+
+        async with semaphore:
+            response = await asyncio.get_running_loop().run_in_executor(
+                executor, self._post, endpoint, query
+            )
+        self.simulated += 1
+
+        if self.cache is not None:
+            self.cache.set(endpoint, query, response)
+        return response
+
+    async def simulate_all(self, endpoint: str, queries: List[dict]) -> List[dict]:
+        """The responses of the API to the `queries`, in the same order"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            return await asyncio.gather(
+                *[
+                    self._simulate(endpoint, query, semaphore, executor)
+                    for query in queries
+                ]
+            )
+
+    def compute_scores_for_examples(
+        self, examples: List[dict], endpoint: str
+    ) -> List[dict]:
+        """Set the `response` of the API for each of the `examples`"""
+        self.simulated = 0
+        responses = asyncio.run(
+            self.simulate_all(endpoint, [example["query"] for example in examples])
+        )
+        for example, response in zip(examples, responses):
+            example["response"] = response
+        logger.info(
+            f"-> Simulated {self.simulated}/{len(examples)} examples on {endpoint}, the others were cached for the API {self.api_version} and data {self.data_version}"
+        )
+        return examples
@@ -14,3 +14,23 @@ impact text NOT NULL,
 value numeric NOT NULL,
 norm_value_ecs numeric NOT NULL
 );
+
+CREATE TABLE score_history_latest (
+branch text NOT NULL,
+domain text NOT NULL,
+commit text NOT NULL,
+datetime timestamp NOT NULL,
+content_hash text NOT NULL,
+PRIMARY KEY (branch, domain)
+);
+
+CREATE TABLE score_history_commits (
+commit text NOT NULL,
+domain text NOT NULL,
+branch text NOT NULL,
+datetime timestamp NOT NULL,
+PRIMARY KEY (commit, domain)
+);
+
+CREATE INDEX score_history_commit_idx ON score_history (commit);
+CREATE INDEX score_history_latest_idx ON score_history (branch, domain, datetime);
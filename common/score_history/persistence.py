@@ -0,0 +1,286 @@
+import csv
+import hashlib
+import io
+import math
+from datetime import datetime
+from decimal import Decimal
+from typing import Optional
+
+import orjson
+import pandas as pd
+from sqlalchemy import Engine, text
+
+SCORE_HISTORY_TABLE = "score_history"
+LATEST_SCORE_TABLE = "score_history_latest"
+SCORED_COMMITS_TABLE = "score_history_commits"
+
+# The columns identifying a score set, the datetime and commit only date it
+HASH_COLUMNS = [
+    "branch",
+    "domain",
+    "product_name",
+    "id",
+    "query",
+    "mass",
+    "elements",
+    "lifecycle_step",
+    "lifecycle_step_country",
+    "impact",
+    "value",
+    "norm_value_ecs",
+]
+NUMERIC_COLUMNS = {"mass", "value", "norm_value_ecs"}
+# Equal hashes are enough to know that two score sets are the same. The numbers are
+# rounded to 4 decimals, so equal hashes also mean values within the tolerance, but
+# not the other way around: 0.00004 and 0.00006 are within it and don't round the same
+HASH_DECIMALS = 4
+# A value change of more than this is a new score set
+SCORE_TOLERANCE = 0.0001
+# The rows of two score sets compared with the tolerance are matched on these columns
+KEY_COLUMNS = [
+    "domain",
+    "product_name",
+    "query",
+    "lifecycle_step",
+    "lifecycle_step_country",
+    "impact",
+]
+VALUE_COLUMNS = ["value", "norm_value_ecs"]
+# Rows per INSERT statement when COPY is not available
+INSERT_CHUNK_SIZE = 1000
+
+
+def _canonical(column: str, value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    if column in NUMERIC_COLUMNS:
+        # `+ 0.0` turns -0.0 into 0.0
+        return round(float(value), HASH_DECIMALS) + 0.0
+    return str(value)
+
+
+def score_hash(df: pd.DataFrame) -> str:
+    """Digest of the content of a score set, independent of the order of its rows
+    and of the way the database returns its values (Decimal, UUID, …)"""
+    rows = sorted(
+        orjson.dumps(
+            [_canonical(column, value) for column, value in zip(HASH_COLUMNS, row)]
+        )
+        for row in zip(*(df[column].tolist() for column in HASH_COLUMNS))
+    )
+    digest = hashlib.blake2b(digest_size=16)
+    for row in rows:
+        digest.update(row)
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def are_scores_different(
+    previous_df: pd.DataFrame, score_df: pd.DataFrame, tolerance=SCORE_TOLERANCE
+) -> bool:
+    """Whether a row was added to or removed from a score set, or one of its values
+    changed by more than the absolute `tolerance`"""
+
+    def values(df):
+        return (
+            df[KEY_COLUMNS]
+            .astype(str)
+            .assign(**{column: df[column].astype(float) for column in VALUE_COLUMNS})
+            .drop_duplicates(KEY_COLUMNS, keep="last")
+            .set_index(KEY_COLUMNS)
+        )
+
+    previous, new = values(previous_df), values(score_df)
+    if len(previous) != len(new) or not new.index.isin(previous.index).all():
+        return True
+    differences = (new - previous.reindex(new.index)).abs()
+    return bool((differences > tolerance).to_numpy().any())
+
+
+def _copy_insert(table, conn, keys, data_iter):
+    """`DataFrame.to_sql` method inserting all the rows with a single PostgreSQL
+    COPY"""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(
+        [
+            # csv writes None as an empty string, that COPY reads as NULL
+            [str(value) if isinstance(value, Decimal) else value for value in row]
+            for row in data_iter
+        ]
+    )
+    buffer.seek(0)
+
+    columns = ", ".join(f'"{key}"' for key in keys)
+    table_name = f"{table.schema}.{table.name}" if table.schema else table.name
+    sql = f"COPY {table_name} ({columns}) FROM STDIN WITH (FORMAT csv)"
+    with conn.connection.cursor() as cursor:
+        if hasattr(cursor, "copy_expert"):
+            # psycopg2
+            cursor.copy_expert(sql=sql, file=buffer)
+        else:
+            # psycopg 3
+            with cursor.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+
+
+class ScoreHistoryStore:
+    """The score history, with the hash of the latest stored score set of each
+    (branch, domain) and the scored commits kept in their own tables.
+
+    Deciding whether a commit has to be scored, or whether its score set has to be
+    stored, only reads a few rows of these tables. The latest score set is only read
+    back from the history when a new one has a different hash, to compare their values
+    with the tolerance."""
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+
+    def create_tables(self):
+        with self.engine.begin() as conn:
+            conn.execute(
+                text(
+                    f"""CREATE TABLE IF NOT EXISTS {LATEST_SCORE_TABLE} (
+                    branch text NOT NULL,
+                    domain text NOT NULL,
+                    "commit" text NOT NULL,
+                    datetime timestamp NOT NULL,
+                    content_hash text NOT NULL,
+                    PRIMARY KEY (branch, domain)
+                    )"""
+                )
+            )
+            conn.execute(
+                text(
+                    f"""CREATE TABLE IF NOT EXISTS {SCORED_COMMITS_TABLE} (
+                    "commit" text NOT NULL,
+                    domain text NOT NULL,
+                    branch text NOT NULL,
+                    datetime timestamp NOT NULL,
+                    PRIMARY KEY ("commit", domain)
+                    )"""
+                )
+            )
+            # For the commits scored before the scored commits were kept, and the
+            # latest score set of a branch
+            conn.execute(
+                text(
+                    f"CREATE INDEX IF NOT EXISTS {SCORE_HISTORY_TABLE}_commit_idx "
+                    f'ON {SCORE_HISTORY_TABLE} ("commit")'
+                )
+            )
+            conn.execute(
+                text(
+                    f"CREATE INDEX IF NOT EXISTS {SCORE_HISTORY_TABLE}_latest_idx "
+                    f"ON {SCORE_HISTORY_TABLE} (branch, domain, datetime)"
+                )
+            )
+
+    def is_new_commit(self, commit: str) -> bool:
+        """If the scores of `commit` haven't been computed yet, on any branch"""
+        with self.engine.connect() as conn:
+            return (
+                conn.execute(
+                    text(
+                        f"SELECT 1 FROM {SCORED_COMMITS_TABLE} "
+                        'WHERE "commit" = :commit '
+                        "UNION ALL "
+                        f"SELECT 1 FROM {SCORE_HISTORY_TABLE} "
+                        'WHERE "commit" = :commit '
+                        "LIMIT 1"
+                    ),
+                    {"commit": commit},
+                ).first()
+                is None
+            )
+
+    def latest_scores(self, branch: str, domain: str) -> pd.DataFrame:
+        """The latest score set of `branch` for `domain` in the history"""
+        with self.engine.connect() as conn:
+            return pd.read_sql(
+                text(
+                    f"SELECT * FROM {SCORE_HISTORY_TABLE} "
+                    "WHERE branch = :branch AND domain = :domain AND datetime = ("
+                    f"SELECT max(datetime) FROM {SCORE_HISTORY_TABLE} "
+                    "WHERE branch = :branch AND domain = :domain)"
+                ),
+                conn,
+                params={"branch": branch, "domain": domain},
+            )
+
+    def latest_hash(self, branch: str, domain: str) -> Optional[str]:
+        """The hash of the latest stored score set of `branch` for `domain`.
+
+        Branches scored before the hashes were kept get theirs computed from their
+        latest score set in the history."""
+        with self.engine.connect() as conn:
+            content_hash = conn.execute(
+                text(
+                    f"SELECT content_hash FROM {LATEST_SCORE_TABLE} "
+                    "WHERE branch = :branch AND domain = :domain"
+                ),
+                {"branch": branch, "domain": domain},
+            ).scalar()
+        if content_hash is not None:
+            return content_hash
+
+        previous_score_df = self.latest_scores(branch, domain)
+        return None if previous_score_df.empty else score_hash(previous_score_df)
+
+    def record(
+        self, branch: str, domain: str, commit: str, score_df: pd.DataFrame
+    ) -> bool:
+        """Store `score_df` in the history if its values differ, beyond the tolerance,
+        from the latest score set of `branch` for `domain`, and return whether it was
+        stored. In both cases, `commit` is recorded as scored."""
+        content_hash = score_hash(score_df)
+        latest_hash = self.latest_hash(branch, domain)
+        is_different = content_hash != latest_hash and (
+            latest_hash is None
+            or are_scores_different(self.latest_scores(branch, domain), score_df)
+        )
+
+        method, chunksize = (
+            (_copy_insert, None)
+            if self.engine.dialect.name == "postgresql"
+            else ("multi", INSERT_CHUNK_SIZE)
+        )
+        now = datetime.now()
+        with self.engine.begin() as conn:
+            if is_different:
+                score_df.to_sql(
+                    SCORE_HISTORY_TABLE,
+                    con=conn,
+                    if_exists="append",
+                    index=False,
+                    method=method,
+                    chunksize=chunksize,
+                )
+                # PostgreSQL and SQLite both support these upserts, `commit` has to be
+                # quoted for SQLite
+                conn.execute(
+                    text(
+                        f"INSERT INTO {LATEST_SCORE_TABLE} "
+                        '(branch, domain, "commit", datetime, content_hash) '
+                        "VALUES (:branch, :domain, :commit, :datetime, :content_hash) "
+                        "ON CONFLICT (branch, domain) DO UPDATE SET "
+                        '"commit" = excluded."commit", datetime = excluded.datetime, '
+                        "content_hash = excluded.content_hash"
+                    ),
+                    {
+                        "branch": branch,
+                        "domain": domain,
+                        "commit": commit,
+                        "datetime": now,
+                        "content_hash": content_hash,
+                    },
+                )
+            conn.execute(
+                text(
+                    f"INSERT INTO {SCORED_COMMITS_TABLE} "
+                    '("commit", domain, branch, datetime) '
+                    "VALUES (:commit, :domain, :branch, :datetime) "
+                    'ON CONFLICT ("commit", domain) DO NOTHING'
+                ),
+                {"commit": commit, "domain": domain, "branch": branch, "datetime": now},
+            )
+        return is_different
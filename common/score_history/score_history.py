@@ -2,14 +2,15 @@ import json
 import pathlib
 import sys
 import uuid
-from contextlib import contextmanager
 from datetime import datetime
 from enum import StrEnum
 
+import numpy as np
 import pandas as pd
-import requests
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine
 
+from common.score_history.api_client import ScoreApiClient
+from common.score_history.persistence import ScoreHistoryStore
 from ecobalyse_data.logging import logger
 
 # Constants
@@ -67,28 +68,148 @@ def load_json(file):
 # API functions
 
 
+SCORE_COLUMNS = [
+    "datetime",
+    "branch",
+    "commit",
+    "domain",
+    "product_name",
+    "id",
+    "query",
+    "mass",
+    "elements",
+    "lifecycle_step",
+    "lifecycle_step_country",
+    "impact",
+    "value",
+    "norm_value_ecs",
+]
+
+
+class ScoreRowsBuilder:
+    """
+    Accumulate the score rows of the examples of a domain and build them into a single DataFrame.
+
+    The impacts of each lifecycle step are kept as blocks until `build`, which allocates
+    every column once and fills it block by block. The values of an example (query,
+    elements, …) are serialized once and shared by all its rows.
+    """
+
+    def __init__(self, domain, branch, commit, normalization_factors):
+        self.domain = domain
+        self.branch = branch
+        self.commit = commit
+        self.normalization_factors = normalization_factors
+        # Per example columns
+        self.examples = {
+            "product_name": [],
+            "id": [],
+            "query": [],
+            "mass": [],
+            "elements": [],
+        }
+        # (example index, lifecycle step, country, impacts, is_complement)
+        self.blocks = []
+        self.row_count = 0
+
+    def add_example(self, example, mass, elements):
+        """Add the per example values and return the index of the example"""
+        self.examples["product_name"].append(example["name"])
+        self.examples["id"].append(example["id"])
+        self.examples["query"].append(json.dumps(example["query"]))
+        self.examples["mass"].append(mass)
+        self.examples["elements"].append(json.dumps(elements))
+        return len(self.examples["id"]) - 1
+
+    def add_impacts(self, example_index, lifecycle_step, country, impacts):
+        """Add a row per impact, normalized with the normalization factors"""
+        self._add_block(example_index, lifecycle_step, country, impacts, False)
+
+    def add_complements(self, example_index, lifecycle_step, country, complements):
+        """Add a row per complement, which are already expressed in 'ecs' units"""
+        self._add_block(example_index, lifecycle_step, country, complements, True)
+
+    def _add_block(
+        self, example_index, lifecycle_step, country, impacts, is_complement
+    ):
+        if impacts:
+            self.blocks.append(
+                (example_index, lifecycle_step, country, impacts, is_complement)
+            )
+            self.row_count += len(impacts)
+
+    def build(self):
+        example_indexes = np.empty(self.row_count, dtype=np.intp)
+        lifecycle_steps = np.empty(self.row_count, dtype=object)
+        countries = np.empty(self.row_count, dtype=object)
+        impacts = np.empty(self.row_count, dtype=object)
+        values = np.empty(self.row_count, dtype="float64")
+        norm_values = np.empty(self.row_count, dtype="float64")
+
+        start = 0
+        for example_index, lifecycle_step, country, block, is_complement in self.blocks:
+            end = start + len(block)
+            example_indexes[start:end] = example_index
+            lifecycle_steps[start:end] = lifecycle_step
+            countries[start:end] = country
+            impacts[start:end] = list(block.keys())
+            block_values = np.fromiter(
+                block.values(), dtype="float64", count=len(block)
+            )
+            if is_complement:
+                values[start:end] = 0
+                norm_values[start:end] = block_values
+            else:
+                values[start:end] = block_values
+                norm_values[start:end] = (
+                    1e6
+                    * block_values
+                    * np.fromiter(
+                        (self.normalization_factors.get(k, np.nan) for k in block),
+                        dtype="float64",
+                        count=len(block),
+                    )
+                )
+            start = end
+
+        def per_example(column, dtype=object):
+            return np.asarray(self.examples[column], dtype=dtype)[example_indexes]
+
+        return pd.DataFrame(
+            {
+                "datetime": TODAY_DATETIME_STR,
+                "branch": self.branch,
+                "commit": self.commit,
+                "domain": self.domain,
+                "product_name": per_example("product_name"),
+                "id": per_example("id"),
+                "query": per_example("query"),
+                "mass": per_example("mass", dtype="float64"),
+                "elements": per_example("elements"),
+                "lifecycle_step": lifecycle_steps,
+                "lifecycle_step_country": countries,
+                "impact": impacts,
+                "value": values,
+                "norm_value_ecs": norm_values,
+            },
+            columns=SCORE_COLUMNS,
+        )
+
+
 def get_new_score(domain, examples, current_branch, last_commit):
-    simulations = []
-    normalization_factors = compute_normalization_factors()
+    builder = ScoreRowsBuilder(
+        domain, current_branch, last_commit, compute_normalization_factors()
+    )
     for example in examples:
         if domain == "food":
-            simulation_result = process_response_food(
-                current_branch,
-                example,
-                normalization_factors,
-                last_commit,
-            )
+            add_food_example(builder, example)
         elif domain == "textile":
-            simulation_result = process_response_textile(
-                current_branch, example, normalization_factors, last_commit
-            )
+            add_textile_example(builder, example)
         else:
             raise ValueError(
                 f"Invalid domain {domain}. Please use 'textile' or 'food'."
             )
-
-        simulations.append(simulation_result)
-    return pd.concat(simulations, axis=0, ignore_index=True)
+    return builder.build()
 
 
 def compute_normalization_factors():
@@ -105,139 +226,46 @@ def compute_normalization_factors():
     return normalization_factors
 
 
-def process_response_textile(branch_name, example, normalization_factors, last_commit):
+def add_textile_example(builder, example):
     """
-    Processes the simulation response for a given example, transforming it into a structured DataFrame.
+    Adds the rows of the simulation response of a textile example to the builder.
 
     Parameters:
-    - branch_name (str): The name of the branch for which the simulation was run.
-    - example (dict): The example data used in the simulation request.
-    - normalization_factors (dict): A dictionary of normalization factors for adjusting impact scores.
-
-    Returns:
-    - DataFrame: A pandas DataFrame containing the structured results of the simulation.
+    - builder (ScoreRowsBuilder): The builder of the score rows of the domain.
+    - example (dict): The example data used in the simulation request, with its response.
     """
-    # Initial preparation for DataFrame creation
     response = example["response"]
     query = example["query"]
-    df_list = []
-
-    df_list.append(
-        create_df_textile(
-            branch_name,
-            last_commit,
-            example,
-            query,
-            response,
-            normalization_factors,
-        )
-    )
-
-    # Process life cycle steps
-    life_cycle_steps = response.get("lifeCycle", [])
-    for step in life_cycle_steps:
-        df_list.append(
-            create_df_textile(
-                branch_name,
-                last_commit,
-                example,
-                query,
-                step,
-                normalization_factors,
-            )
+    example_index = builder.add_example(example, query["mass"], query["materials"])
+
+    # The total, then the life cycle steps, that have a "label"
+    for step in [response, *response.get("lifeCycle", [])]:
+        step_label = step.get("label", "Total")
+        country = step.get("country", {}).get("code", "")
+        builder.add_impacts(example_index, step_label, country, step["impacts"])
+        # In the case of a non transport step we have to store the complements
+        builder.add_complements(
+            example_index, step_label, country, step.get("complementsImpacts")
         )
 
     # Process transport, if present in the response
     transport_info = response.get("transport", None)
     if transport_info:
-        transport_df = create_df_textile(
-            branch_name,
-            last_commit,
-            example,
-            query,
-            transport_info,
-            normalization_factors,
-            is_transport=True,
+        builder.add_impacts(
+            example_index,
+            "Transport",
+            transport_info.get("country", {}).get("code", ""),
+            transport_info["impacts"],
         )
-        df_list.append(transport_df)
-
-    # Concatenate all DataFrames into a single DataFrame
-    if df_list:
-        return pd.concat(df_list, axis=0, ignore_index=True)
-    else:
-        # Return an empty DataFrame if there are no results to process
-        return pd.DataFrame()
-
-
-def create_df_textile(
-    branch,
-    commit_id,
-    example,
-    query,
-    step,
-    normalization_factors,
-    is_transport=False,
-):
-    impacts = pd.Series(step["impacts"])
-
-    # The step is either a transport step, a lifecycle step in that case we use the "label" field
-    # if it's not either one it's a "Total" step
-    step_label = "Transport" if is_transport else step.get("label", "Total")
-
-    data = {
-        "datetime": TODAY_DATETIME_STR,
-        "branch": branch,
-        "commit": commit_id,
-        "domain": "textile",
-        "product_name": example["name"],
-        "id": example["id"],
-        "query": json.dumps(query),
-        "mass": query["mass"],
-        "elements": json.dumps(query["materials"]),
-        "lifecycle_step": step_label,
-        "lifecycle_step_country": step.get("country", {}).get("code", ""),
-        "impact": impacts.index.tolist(),
-        "value": impacts.values.tolist(),
-    }
-    df = pd.DataFrame(data)
-    df["norm_value_ecs"] = 1e6 * df["value"] * df["impact"].map(normalization_factors)
-
-    # In the case of a non transport step we have to store the complements
-    if not is_transport and "complementsImpacts" in step:
-        complementsImpacts = pd.Series(step["complementsImpacts"])
-        data_complements = {
-            "datetime": TODAY_DATETIME_STR,
-            "branch": branch,
-            "commit": commit_id,
-            "domain": "textile",
-            "product_name": example["name"],
-            "id": example["id"],
-            "query": json.dumps(query),
-            "mass": query["mass"],
-            "elements": json.dumps(query["materials"]),
-            "lifecycle_step": step_label,
-            "lifecycle_step_country": step.get("country", {}).get("code", ""),
-            "impact": complementsImpacts.index.tolist(),
-            "value": 0,
-            "norm_value_ecs": complementsImpacts.values.tolist(),
-        }
-        df_complements = pd.DataFrame(data_complements)
-        df = pd.concat([df, df_complements], axis=0, ignore_index=True)
 
-    return df
 
-
-def process_response_food(branch_name, example, normalization_factors, last_commit):
+def add_food_example(builder, example):
     """
-    Processes the simulation response for a given example, transforming it into a structured DataFrame.
+    Adds the rows of the simulation response of a food example to the builder.
 
     Parameters:
-    - branch_name (str): The name of the branch for which the simulation was run.
-    - example (dict): The example data used in the simulation request.
-    - normalization_factors (dict): A dictionary of normalization factors for adjusting impact scores.
-
-    Returns:
-    - DataFrame: A pandas DataFrame containing the structured results of the simulation.
+    - builder (ScoreRowsBuilder): The builder of the score rows of the domain.
+    - example (dict): The example data used in the simulation request, with its response.
     """
 
     lifecycle_step_impact_paths = {
@@ -249,26 +277,22 @@ def process_response_food(branch_name, example, normalization_factors, last_comm
         "distribution": ["distribution", "total"],
     }
 
-    results_per_life_cycle = []
+    results = example["response"]["results"]
+    example_index = builder.add_example(
+        example, results["preparedMass"], example["query"]["ingredients"]
+    )
     for lifecycle_step, path in lifecycle_step_impact_paths.items():
-        impacts = get_nested_value(example["response"]["results"], path)
-        results_per_life_cycle.append(
-            create_df_food(
-                branch_name,
-                last_commit,
-                example,
-                lifecycle_step,
-                impacts,
-                normalization_factors,
+        impacts = get_nested_value(results, path)
+        if lifecycle_step == "ingredients":
+            builder.add_impacts(
+                example_index, lifecycle_step, "", impacts["ingredientsTotal"]
             )
-        )
-
-    # Concatenate all DataFrames into a single DataFrame
-    if results_per_life_cycle:
-        return pd.concat(results_per_life_cycle, axis=0, ignore_index=True)
-    else:
-        # Return an empty DataFrame if there are no results to process
-        return pd.DataFrame()
+            # For the ingredients we have to store the complements
+            builder.add_complements(
+                example_index, lifecycle_step, "", impacts["totalBonusImpact"]
+            )
+        else:
+            builder.add_impacts(example_index, lifecycle_step, "", impacts)
 
 
 def get_nested_value(nested_dict, keys):
@@ -287,239 +311,6 @@ def get_nested_value(nested_dict, keys):
     return current_level
 
 
-def create_df_food(
-    branch, commit_id, example, lifecycle_step, impacts, normalization_factors
-):
-    """
-    Create a pandas DataFrame with detailed information about food products based on various inputs.
-
-    Parameters:
-    - branch (str): The branch of the repository being queried.
-    - commit_id (str): The specific commit ID in the repository.
-    - example (dict): A dictionary containing details about the food product, such as name, id, and query details.
-    - lifecycle_step (str): The lifecycle step of the food product.
-    - impacts (pd.DataFrame): A DataFrame containing the impact indices and their respective values.
-    - normalization_factors (dict): A dictionary mapping impact indices to normalization factors.
-
-    Returns:
-    - pd.DataFrame: A DataFrame with columns for datetime, branch, commit, domain, product name, product ID,
-                    query, mass, elements, lifecycle step and country, impact indices, values,
-                    and normalized impact values expressed in 'ecs' units.
-    """
-    if lifecycle_step == "ingredients":
-        impacts_sr = pd.Series(impacts["ingredientsTotal"], dtype="float64")
-    else:
-        impacts_sr = pd.Series(impacts, dtype="float64")
-
-    data = {
-        "datetime": TODAY_DATETIME_STR,
-        "branch": branch,
-        "commit": commit_id,
-        "domain": "food",
-        "product_name": example["name"],
-        "id": example["id"],
-        "query": json.dumps(example["query"]),
-        "mass": example["response"]["results"]["preparedMass"],
-        "elements": json.dumps(example["query"]["ingredients"]),
-        "lifecycle_step": lifecycle_step,
-        "lifecycle_step_country": "",
-        "impact": impacts_sr.index.tolist(),
-        "value": impacts_sr.values.tolist(),
-    }
-    df = pd.DataFrame(data)
-    df["norm_value_ecs"] = 1e6 * df["value"] * df["impact"].map(normalization_factors)
-
-    # For the ingredients we have to store the complements
-    if lifecycle_step == "ingredients":
-        complementsImpacts = pd.Series(impacts["totalBonusImpact"])
-        data_complements = {
-            "datetime": TODAY_DATETIME_STR,
-            "branch": branch,
-            "commit": commit_id,
-            "domain": "food",
-            "product_name": example["name"],
-            "id": example["id"],
-            "query": json.dumps(example["query"]),
-            "mass": example["response"]["results"]["preparedMass"],
-            "elements": json.dumps(example["query"]["ingredients"]),
-            "lifecycle_step": lifecycle_step,
-            "lifecycle_step_country": "",
-            "impact": complementsImpacts.index.tolist(),
-            "value": 0,
-            "norm_value_ecs": complementsImpacts.values.tolist(),
-        }
-        df_complements = pd.DataFrame(data_complements)
-        df = pd.concat([df, df_complements], axis=0, ignore_index=True)
-    return df
-
-
-def is_new_commit(score_history_df, last_commit):
-    """if the last commit is not in the score history, we add this to the"""
-    if not score_history_df["commit"].isin([last_commit]).any():
-        return True
-    else:
-        return False
-
-
-def are_df_different(df1, df2, tolerance=0.0001):
-    """
-    Compare two dataframes with a tolerance for numerical values.
-
-    Args:
-    - df1 (pd.DataFrame): First dataframe to compare.
-    - df2 (pd.DataFrame): Second dataframe to compare.
-    - tolerance (float): Relative tolerance for numerical comparison, default is 0.01%.
-
-    Returns:
-    - bool: True if dataframes are different, False if dataframes are identical or within the tolerance.
-    """
-
-    df1 = df1.drop(["datetime", "commit"], axis=1)
-    df2 = df2.drop(["datetime", "commit"], axis=1)
-
-    df1 = df1.reset_index(drop=True)
-    df2 = df2.reset_index(drop=True)
-
-    key_columns = [
-        "domain",
-        "product_name",
-        "query",
-        "lifecycle_step",
-        "lifecycle_step_country",
-        "impact",
-    ]
-
-    value_columns = ["value", "norm_value_ecs"]
-
-    dict1 = dataframe_to_dict(df1, key_columns, value_columns)
-    dict2 = dataframe_to_dict(df2, key_columns, value_columns)
-
-    for key, (value1, norm_value1) in dict1.items():
-        if key in dict2:
-            (value2, norm_value2) = dict2[key]
-            if (
-                abs(value1 - value2) > tolerance
-                or abs(norm_value1 - norm_value2) > tolerance
-            ):
-                return True
-        else:
-            return True
-    return False
-
-
-def dataframe_to_dict(df, key_cols, value_cols):
-    """
-    Transform a DataFrame into a dictionary by concatenating multiple columns to form the key
-    and using a tuple of columns as the dictionary values.
-
-    Args:
-    df (pd.DataFrame): The source DataFrame.
-    key_cols (list): List of column names to concatenate for the key.
-    value_cols (list): List of column names to combine into a tuple for the values.
-
-    Returns:
-    dict: Dictionary with concatenated keys and tuple values.
-    """
-    # Concatenate the specified columns to form a single key column
-    df["master_key"] = df[key_cols].apply(
-        lambda row: "_".join(row.values.astype(str)), axis=1
-    )
-    df["master_value"] = df[value_cols].apply(lambda row: tuple(row), axis=1)
-
-    # Create a dictionary with the new key column and the specified value column
-    result_dict = df.set_index("master_key")["master_value"].to_dict()
-    return result_dict
-
-
-def get_previous_score(domain, score_history_df, current_branch):
-    """
-    Retrieves the most recent score from the score history dataframe for a specific branch.
-
-    Args:
-    domain (str) : textile or food
-    score_history_df (DataFrame): The DataFrame containing the score history with 'datetime' and 'branch' columns.
-    current_branch (str): The branch for which to retrieve the most recent score.
-
-    Returns:
-    tuple:
-        - bool indicating if there is no previous score on the branch.
-        - DataFrame with the most recent score details for the branch.
-    """
-    # Convert 'datetime' to datetime format only if it's not already converted
-    if not pd.api.types.is_datetime64_any_dtype(score_history_df["datetime"]):
-        score_history_df["datetime"] = pd.to_datetime(score_history_df["datetime"])
-
-    # Filter DataFrame for the current branch and current domain
-    previous_score_df = score_history_df[
-        (score_history_df["branch"] == current_branch)
-        & (score_history_df["domain"] == domain)
-    ]
-
-    # Get the most recent datetime and filter the DataFrame to this datetime
-    latest_datetime = previous_score_df["datetime"].max()
-    previous_score_df = previous_score_df[
-        previous_score_df["datetime"] == latest_datetime
-    ]
-
-    return previous_score_df
-
-
-# Database Operations
-
-
-@contextmanager
-def get_database_connection(engine):
-    """
-    Context manager for database connections that correctly implements the context management protocol.
-    Ensures that the connection is properly managed with commit or rollback and closure.
-    """
-    connection = engine.connect()
-    transaction = connection.begin()
-    try:
-        yield connection
-        transaction.commit()  # Commit the transaction if all operations were successful
-    except Exception as e:
-        transaction.rollback()  # Roll back the transaction in case of an error
-        raise e
-    finally:
-        connection.close()  # Ensure the connection is closed
-
-
-def get_score_history(engine):
-    query = text("SELECT * FROM score_history")
-    with get_database_connection(engine) as conn:
-        df = pd.read_sql(query, conn)
-        return df
-
-
-def get_row_count(engine):
-    query = text("SELECT COUNT(*) FROM score_history")
-    with get_database_connection(engine) as conn:
-        result = conn.execute(query).scalar()
-        return result
-
-
-def insert_new_score(df, engine, table_name):
-    with get_database_connection(engine) as conn:
-        df.to_sql(table_name, con=conn, if_exists="append", index=False)
-
-
-def compute_product_scores(product_params, api_url):
-    r = requests.post(api_url, json=product_params["query"])
-    return r.json()
-
-
-def compute_products_scores_for_examples(examples, api_url):
-    computed_scores = []
-
-    for example in examples:
-        product_scores = compute_product_scores(example, api_url)
-        example["response"] = product_scores
-        computed_scores.append(example)
-
-    return computed_scores
-
-
 def add_all_ingredients_as_examples(examples_input):
     """
     Add all ingredients to the list of examples. Thanks to this we can notice the evolution of impacts of all ingredients. We could add all these ingredients as food product examples but we don't as this would be overwhelming of the UI user.
@@ -548,16 +339,16 @@ if __name__ == "__main__":
     engine = create_engine(
         scalingo_postgresql_score_url, connect_args={"connect_timeout": 10}
     )
+    store = ScoreHistoryStore(engine)
+    store.create_tables()
 
-    score_history_df = get_score_history(engine)
-
-    commit_is_new = is_new_commit(score_history_df, last_commit)
-
-    if commit_is_new:
+    if store.is_new_commit(last_commit):
         logger.info(
             f"Score from commit {last_commit} hasn't been stored before. Computing score for {current_branch} and storing them if they are different"
         )
 
+        client = ScoreApiClient(api_url, data_dir=f"{PROJECT_ROOT_DIR}public/data")
+
         for domain in Domain:
             example_path = DOMAIN_DATA[domain][EXAMPLES_KEY]
             api_endpoint = DOMAIN_DATA[domain][API_ENDPOINT_KEY]
@@ -567,27 +358,13 @@ if __name__ == "__main__":
             if domain == Domain.FOOD:
                 examples_input = add_all_ingredients_as_examples(examples_input)
 
-            examples = compute_products_scores_for_examples(
-                examples_input, f"{api_url}{api_endpoint}"
-            )
+            examples = client.compute_scores_for_examples(examples_input, api_endpoint)
 
             new_score_df = get_new_score(domain, examples, current_branch, last_commit)
-            previous_score_df = get_previous_score(
-                domain, score_history_df, current_branch
-            )
-            if previous_score_df.empty or are_df_different(
-                new_score_df, previous_score_df
-            ):
-                logger.info(
-                    f"Score is different for domain {domain}. Storing new score in the db. Number of rows in the score_history table before update: {get_row_count(engine)}"
-                )
-                insert_new_score(new_score_df, engine, "score_history")
+            if store.record(current_branch, domain, last_commit, new_score_df):
                 logger.info(
                     f"Successfully appended new score ({new_score_df.shape[0]} rows) to score_history postgresql table for domain {domain}."
                 )
-                logger.info(
-                    f"Number of rows in the score_history table after update: {get_row_count(engine)}"
-                )
             else:
                 logger.info(
                     f"New score is identical to old score for domain {domain}.. Nothing was added to score history."
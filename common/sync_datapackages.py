@@ -1,18 +1,222 @@
-# Configure logger
+import argparse
+import multiprocessing
+from pathlib import Path
+from typing import Dict, List, Optional
 
 import bw2data
+import orjson
+from bw2data.backends import ActivityDataset, ExchangeDataset
+from peewee import fn
 
 from common import brightway_patch as brightway_patch
+from common.bw.workers import spawn_executor
 from config import settings
 from ecobalyse_data.logging import logger
 
-logger.info("Syncing datapackages")
+FINGERPRINTS_FILENAME = "fingerprints.json"
 
-bw2data.projects.set_current(settings.bw.project)
-for method in bw2data.methods:
-    logger.debug(f"Syncing method {method}")
+
+def _fingerprints_path() -> Path:
+    return bw2data.projects.dir / "processed" / FINGERPRINTS_FILENAME
+
+
+def load_fingerprints() -> Dict[str, dict]:
+    """The fingerprints recorded by the last sync, by datapackage file name"""
+    path = _fingerprints_path()
+    if not path.is_file():
+        return {}
+    return orjson.loads(path.read_bytes())
+
+
+def save_fingerprints(fingerprints: Dict[str, dict]):
+    path = _fingerprints_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_bytes(orjson.dumps(fingerprints, option=orjson.OPT_SORT_KEYS))
+    tmp_path.replace(path)
+
+
+def _rows(dbname: str) -> List:
+    """Number and highest id of the activities and exchanges of `dbname`"""
+    activities = (
+        ActivityDataset.select(fn.COUNT(ActivityDataset.id), fn.MAX(ActivityDataset.id))
+        .where(ActivityDataset.database == dbname)
+        .tuples()
+        .get()
+    )
+    exchanges = (
+        ExchangeDataset.select(fn.COUNT(ExchangeDataset.id), fn.MAX(ExchangeDataset.id))
+        .where(ExchangeDataset.output_database == dbname)
+        .tuples()
+        .get()
+    )
+    return [*activities, *exchanges]
+
+
+def database_fingerprint(dbname: str) -> dict:
+    """The modification time and rows of a database, and of the databases it links
+    to, whose activity ids end up in its datapackage"""
+    metadata = bw2data.databases[dbname]
+    return {
+        "modified": metadata.get("modified"),
+        "rows": _rows(dbname),
+        "depends": {
+            dependency: [bw2data.databases[dependency].get("modified")]
+            + _rows(dependency)[:2]
+            for dependency in metadata.get("depends", [])
+            if dependency in bw2data.databases
+        },
+    }
+
+
+def _intermediate_path(store) -> Path:
+    return bw2data.projects.dir / store._intermediate_dir / (store.filename + ".pickle")
+
+
+def method_fingerprint(method: tuple) -> dict:
+    stat = _intermediate_path(bw2data.Method(method)).stat()
+    return {
+        "num_cfs": bw2data.methods[method].get("num_cfs"),
+        "intermediate": [stat.st_mtime_ns, stat.st_size],
+    }
+
+
+def _processed_path(store) -> Path:
+    # Not `filepath_processed`, that processes dirty databases
+    return store.dirpath_processed() / store.filename_processed()
+
+
+def is_database_current(dbname: str, recorded: Optional[dict]) -> bool:
+    """Whether the datapackage of `dbname` is up to date with its rows.
+
+    A database modified through bw2data since the last sync is current if bw2data
+    processed it after this modification and the ones of its dependencies, like
+    `Database.write` does. Otherwise its rows must not have changed, which catches
+    the rows written behind bw2data's back."""
+    database = bw2data.Database(dbname)
+    if database.metadata.get("dirty") or not _processed_path(database).is_file():
+        return False
+    fingerprint = database_fingerprint(dbname)
+    if fingerprint == recorded:
+        return True
+    if (
+        recorded is not None
+        and recorded["modified"] == fingerprint["modified"]
+        and recorded["rows"] != fingerprint["rows"]
+    ):
+        return False
+
+    processed = database.metadata.get("processed")
+    modified = [fingerprint["modified"]] + [
+        dependency[0] for dependency in fingerprint["depends"].values()
+    ]
+    return processed is not None and all(
+        processed >= timestamp for timestamp in modified if timestamp is not None
+    )
+
+
+def is_method_current(method: tuple, recorded: Optional[dict]) -> bool:
+    """Whether the datapackage of `method` is up to date with its characterization
+    factors, that `Method.write` processes when it writes them"""
+    store = bw2data.Method(method)
+    processed_path = _processed_path(store)
+    if not processed_path.is_file():
+        return False
+    fingerprint = method_fingerprint(method)
+    return fingerprint == recorded or (
+        processed_path.stat().st_mtime_ns >= fingerprint["intermediate"][0]
+    )
+
+
+def _process_database(dbname: str) -> dict:
+    database = bw2data.Database(dbname)
+    database.process()
+    return dict(database.metadata)
+
+
+def _process_method(method: tuple):
     bw2data.Method(method).process()
 
-for database in bw2data.databases:
-    logger.info(f"Syncing database {database}")
-    bw2data.Database(database).process()
+
+def sync_datapackages(force: bool = False, max_workers: Optional[int] = None):
+    """Process the datapackages of the databases and methods that changed since
+    they were last processed, in `max_workers` worker processes.
+
+    The fingerprints of all the datapackages are recorded for the next sync."""
+    fingerprints = load_fingerprints()
+
+    stale_databases = [
+        dbname
+        for dbname in bw2data.databases
+        if force
+        or not is_database_current(
+            dbname,
+            fingerprints.get(_processed_path(bw2data.Database(dbname)).name),
+        )
+    ]
+    stale_methods = [
+        method
+        for method in bw2data.methods
+        if force
+        or not is_method_current(
+            method, fingerprints.get(_processed_path(bw2data.Method(method)).name)
+        )
+    ]
+    logger.info(
+        f"Syncing {len(stale_databases)}/{len(bw2data.databases)} databases and "
+        f"{len(stale_methods)}/{len(bw2data.methods)} methods"
+    )
+
+    if stale_databases or stale_methods:
+        with spawn_executor(max_workers) as executor:
+            method_futures = {
+                method: executor.submit(_process_method, method)
+                for method in stale_methods
+            }
+            database_futures = {
+                dbname: executor.submit(_process_database, dbname)
+                for dbname in stale_databases
+            }
+            for method, future in method_futures.items():
+                future.result()
+                logger.debug(f"-> Synced method {method}")
+            # The workers each flush their own copy of the databases metadata:
+            # gather the metadata they set, and flush it once
+            for dbname, future in database_futures.items():
+                bw2data.databases.data[dbname] = future.result()
+                logger.info(f"-> Synced database {dbname}")
+            bw2data.databases.flush()
+
+    save_fingerprints(
+        {
+            **{
+                _processed_path(bw2data.Database(dbname)).name: database_fingerprint(
+                    dbname
+                )
+                for dbname in bw2data.databases
+            },
+            **{
+                _processed_path(bw2data.Method(method)).name: method_fingerprint(method)
+                for method in bw2data.methods
+            },
+        }
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Process all the datapackages, even the ones that are up to date",
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=max(multiprocessing.cpu_count() // 2, 1),
+        help="The number of datapackages processed concurrently",
+    )
+    args = parser.parse_args()
+
+    bw2data.projects.set_current(settings.bw.project)
+    sync_datapackages(force=args.force, max_workers=args.max_workers)
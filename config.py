@@ -41,6 +41,11 @@ settings = Dynaconf(
         Validator("S3_SECRET_ACCESS_KEY", must_exist=not IS_CI),
         Validator("S3_BUCKET", must_exist=not IS_CI),
         Validator("S3_DB_PREFIX", must_exist=not IS_CI),
+        Validator(
+            "CACHE_DIR",
+            default=user_cache_path("ecobalyse"),
+            apply_default_on_none=True,
+        ),
         Validator(
             "DB_CACHE_DIR",
             default=user_cache_path("ecobalyse") / "db-cache",
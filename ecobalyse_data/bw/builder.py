@@ -0,0 +1,228 @@
+import copy
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import bw2data
+from bw2data.backends import ActivityDataset, ExchangeDataset
+
+from ecobalyse_data.logging import logger
+
+# SQLite has a limit of 999 variables per query
+QUERY_CHUNK_SIZE = 500
+
+
+def chunks(values, size=QUERY_CHUNK_SIZE):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i : i + size]
+
+
+def _key(ds: dict) -> Tuple[str, str]:
+    return (ds["database"], ds["code"])
+
+
+class ActivitiesBuilder:
+    """Build the activities of a new database in memory, then write them at once.
+
+    The activities are plain dicts in the format of `bw2data.Database.write`, with
+    their exchanges. The activities of the other databases they are built from are
+    looked up by batch, see `prefetch`, instead of one full text search each.
+
+    `Database.write` writes everything in a single transaction, and processes the
+    datapackage once, instead of a commit for each saved activity and exchange."""
+
+    def __init__(self, dbname: str):
+        self.dbname = dbname
+        self.datasets: Dict[str, dict] = {}
+        self._by_name: Dict[Tuple[str, str], List[dict]] = {}
+        self._by_code: Dict[Tuple[str, str], dict] = {}
+        self._exchanges: Dict[Tuple[str, str], List[dict]] = {}
+        self._names: Dict[Tuple[str, str], str] = {}
+
+    # Lookups
+    # =======
+
+    def prefetch(self, references: Iterable[Tuple[str, Optional[str], Optional[str]]]):
+        """Load the activities referenced by `(database, name, code)`, with one query
+        per database for the names and one for the codes"""
+        names, codes = defaultdict(set), defaultdict(set)
+        for dbname, name, code in references:
+            if dbname == self.dbname:
+                continue
+            if code:
+                if (dbname, code) not in self._by_code:
+                    codes[dbname].add(code)
+            elif (dbname, name) not in self._by_name:
+                names[dbname].add(name)
+
+        for dbname, db_names in names.items():
+            for name in db_names:
+                self._by_name[(dbname, name)] = []
+            for chunk in chunks(db_names):
+                for (data,) in self._select(dbname, ActivityDataset.name.in_(chunk)):
+                    self._by_name[(dbname, data["name"])].append(data)
+
+        for dbname, db_codes in codes.items():
+            for chunk in chunks(db_codes):
+                for (data,) in self._select(dbname, ActivityDataset.code.in_(chunk)):
+                    self._by_code[(dbname, data["code"])] = data
+
+    def _select(self, dbname, condition):
+        return (
+            ActivityDataset.select(ActivityDataset.data)
+            .where((ActivityDataset.database == dbname) & condition)
+            .tuples()
+            .iterator()
+        )
+
+    def search_one(
+        self,
+        dbname: str,
+        name: str,
+        location: Optional[str] = None,
+        code: Optional[str] = None,
+        categories: Optional[tuple] = None,
+        unit: Optional[str] = None,
+    ) -> dict:
+        """Find exactly one activity, like `ecobalyse_data.bw.search.search_one`.
+
+        The activities built so far are searched for in `self.dbname`, the
+        activities not prefetched are loaded on demand."""
+        if dbname == self.dbname:
+            candidates = list(self.datasets.values())
+        else:
+            self.prefetch([(dbname, name, code)])
+            if code:
+                found = self._by_code.get((dbname, code))
+                candidates = [found] if found is not None else []
+            else:
+                candidates = self._by_name[(dbname, name)]
+
+        if code:
+            candidates = [ds for ds in candidates if ds["code"] == code]
+            if not candidates:
+                raise ValueError(
+                    f"Activity with code {code} not found in database '{dbname}'"
+                )
+            if name and candidates[0]["name"] != name:
+                raise ValueError(
+                    f"Activity with code {code} found but name doesn't match. "
+                    f"Expected: '{name}', Got: '{candidates[0].get('name')}'"
+                )
+            return candidates[0]
+
+        matches = [
+            ds
+            for ds in candidates
+            if ds["name"] == name
+            and (location is None or ds.get("location") == location)
+            and (
+                categories is None
+                or tuple(ds.get("categories", ())) == tuple(categories)
+            )
+            and (unit is None or ds.get("unit") == unit)
+        ]
+        if len(matches) != 1:
+            search = f"{name} {location}" if location else name
+            raise ValueError(
+                f"This 'search' doesn't return one perfect match (got {len(matches)})"
+                f" in database '{dbname}': '{search}'"
+            )
+        return matches[0]
+
+    def exchanges(self, activity: dict) -> List[dict]:
+        """The exchanges of `activity`, that are only read from the database once"""
+        key = _key(activity)
+        if key[0] == self.dbname:
+            return activity["exchanges"]
+        if key not in self._exchanges:
+            self._exchanges[key] = [
+                data
+                for (data,) in ExchangeDataset.select(ExchangeDataset.data)
+                .where(
+                    (ExchangeDataset.output_database == key[0])
+                    & (ExchangeDataset.output_code == key[1])
+                )
+                .order_by(ExchangeDataset.id)
+                .tuples()
+            ]
+            self._load_names(exc["input"] for exc in self._exchanges[key])
+        return self._exchanges[key]
+
+    def _load_names(self, keys: Iterable[Tuple[str, str]]):
+        codes = defaultdict(set)
+        for dbname, code in keys:
+            if (dbname, code) not in self._names and dbname != self.dbname:
+                codes[dbname].add(code)
+        for dbname, db_codes in codes.items():
+            for chunk in chunks(db_codes):
+                query = ActivityDataset.select(
+                    ActivityDataset.code, ActivityDataset.name
+                ).where(
+                    (ActivityDataset.database == dbname)
+                    & ActivityDataset.code.in_(chunk)
+                )
+                for code, name in query.tuples():
+                    self._names[(dbname, code)] = name
+
+    def input_name(self, exchange: dict) -> str:
+        """The name of the activity `exchange` comes from"""
+        dbname, code = exchange["input"]
+        if dbname == self.dbname:
+            return self.datasets[code]["name"]
+        if (dbname, code) not in self._names:
+            self._load_names([(dbname, code)])
+        return self._names[(dbname, code)]
+
+    # Edition
+    # =======
+
+    def new_activity(self, code: str, **data) -> dict:
+        if code in self.datasets:
+            raise ValueError(f"Activity {code} already created in {self.dbname}")
+        activity = {**data, "database": self.dbname, "code": code, "exchanges": []}
+        self.datasets[code] = activity
+        return activity
+
+    def copy_activity(self, base: dict, code: str, **data) -> dict:
+        """Copy `base` and its exchanges, like `bw2data.Activity.copy`"""
+        data = {
+            **{
+                key: value
+                for key, value in base.items()
+                if key not in ("id", "exchanges")
+            },
+            **data,
+        }
+        activity = self.new_activity(
+            code,
+            **{
+                key: value
+                for key, value in data.items()
+                if key not in ("database", "code")
+            },
+        )
+        for exc in self.exchanges(base):
+            exc = copy.deepcopy(exc)
+            exc.pop("id", None)
+            exc["output"] = _key(activity)
+            if exc["input"] == _key(base):
+                exc["input"] = _key(activity)
+            activity["exchanges"].append(exc)
+        return activity
+
+    def new_exchange(self, activity: dict, input_activity: dict, **data) -> dict:
+        exchange = {"output": _key(activity), "input": _key(input_activity), **data}
+        if input_activity["database"] != self.dbname:
+            self._names[_key(input_activity)] = input_activity["name"]
+        activity["exchanges"].append(exchange)
+        return exchange
+
+    def delete_exchange(self, activity: dict, exchange: dict):
+        activity["exchanges"] = [
+            exc for exc in activity["exchanges"] if exc is not exchange
+        ]
+
+    def write(self):
+        logger.info(f"-> Writing {len(self.datasets)} activities to {self.dbname}")
+        bw2data.Database(self.dbname).write(list(self.datasets.values()))
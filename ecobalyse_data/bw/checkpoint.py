@@ -0,0 +1,71 @@
+import functools
+import hashlib
+import inspect
+import pickle
+from pathlib import Path
+from typing import Optional
+
+import orjson
+
+from ecobalyse_data.logging import logger
+
+
+def fingerprint(*parts) -> str:
+    """Digest of the `repr` of `parts`"""
+    return hashlib.blake2b(repr(parts).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def migrations_fingerprint(migrations) -> str:
+    return fingerprint(orjson.dumps(migrations, option=orjson.OPT_SORT_KEYS))
+
+
+def strategy_fingerprint(strategy) -> str:
+    """Identify a strategy by its name, arguments and source code, so that editing a
+    strategy invalidates the checkpoints made with it"""
+    if isinstance(strategy, functools.partial):
+        return fingerprint(
+            strategy_fingerprint(strategy.func),
+            strategy.args,
+            sorted(strategy.keywords.items()),
+        )
+    try:
+        source = inspect.getsource(strategy)
+    except (OSError, TypeError):
+        source = None
+    return fingerprint(strategy.__module__, strategy.__qualname__, source)
+
+
+class Checkpoints:
+    """Pickled states of an import, one per stage, stored next to the imported file.
+
+    A checkpoint is only loaded if its `key` matches, the key being a fingerprint of
+    everything the stage depends on. Only the last checkpoint of each stage is kept."""
+
+    def __init__(self, directory: Path, stem: str):
+        self.directory = Path(directory)
+        self.stem = stem
+
+    def path(self, stage: str, key: str) -> Path:
+        return self.directory / f"{self.stem}.{stage}.{key}.pickle"
+
+    def exists(self, stage: str, key: str) -> bool:
+        return self.path(stage, key).is_file()
+
+    def load(self, stage: str, key: str) -> Optional[dict]:
+        path = self.path(stage, key)
+        if not path.is_file():
+            return None
+        logger.info(f"-> Resuming after the {stage} stage from {path}")
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    def save(self, stage: str, key: str, state: dict):
+        for outdated in self.directory.glob(f"{self.stem}.{stage}.*.pickle"):
+            outdated.unlink()
+        path = self.path(stage, key)
+        logger.debug(f"-> Saving the {stage} checkpoint to {path}")
+        # Write to a temporary file first so that an interrupted save is never loaded
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        tmp_path.replace(path)
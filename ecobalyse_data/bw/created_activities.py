@@ -0,0 +1,366 @@
+import json
+from enum import StrEnum
+from itertools import chain
+
+from bw2io.utils import activity_hash
+
+from ecobalyse_data.bw.builder import ActivitiesBuilder
+from ecobalyse_data.logging import logger
+
+
+class ActivityFrom(StrEnum):
+    SCRATCH = "from_scratch"
+    EXISTING = "from_existing"
+
+
+class ExchangeType(StrEnum):
+    TECHNOSPHERE = "technosphere"
+    BIOSPHERE = "biosphere"
+
+
+def search_activity(
+    builder: ActivitiesBuilder, activity_dict: dict, default_db: str | None = None
+):
+    """Search for an activity using either a string or dict specification.
+
+    Args:
+        builder: the builder of the created activities, that looks the activities up
+        activity_dict: dict with keys:
+                  - name (required): activity name
+                  - database (optional): database name (uses default_db if not provided)
+                  - location (optional): location code
+                  - code (optional): specific activity code/UUID
+        default_db: Default database name if not specified
+
+    Returns:
+        The found activity, as a dict
+    """
+    if isinstance(activity_dict, dict):
+        db_name = activity_dict.get("database", default_db)
+        if db_name is None:
+            raise ValueError("No database specified in activity dict or default_db")
+        categories = activity_dict.get("categories")
+
+        return builder.search_one(
+            db_name,
+            activity_dict["name"],
+            location=activity_dict.get("location"),
+            code=activity_dict.get("code"),
+            categories=tuple(categories) if categories else None,
+            unit=activity_dict.get("unit"),
+        )
+    else:
+        raise ValueError("Activity must be a dict")
+
+
+def activity_references(activities_data):
+    """The `(database, name, code)` of the activities referenced in
+    `activities_to_create.json`, to look them up by batch"""
+    for activity_data in activities_data:
+        default_db = activity_data["database"]
+        replacement_plan = activity_data.get("replacementPlan", {})
+        activity_dicts = [
+            activity_data.get("existingActivity"),
+            *activity_data.get("exchanges", []),
+            *(replacement_plan.get("upstreamPath") or []),
+            *replacement_plan.get("exchanges", []),
+            *chain.from_iterable(
+                (replacement["from"], replacement["to"])
+                for replacement in replacement_plan.get("replace", [])
+            ),
+        ]
+        for activity_dict in activity_dicts:
+            if activity_dict is not None:
+                yield (
+                    activity_dict.get("database", default_db),
+                    activity_dict["name"],
+                    activity_dict.get("code"),
+                )
+
+
+def create_activity(
+    builder: ActivitiesBuilder,
+    new_activity_name,
+    base_activity=None,
+    unit="kilogram",
+    location=None,
+):
+    """Creates a new activity by copying a base activity or from nothing. Returns the created activity"""
+
+    if base_activity:
+        data = {
+            key: value
+            for key, value in base_activity.items()
+            # Id should be autogenerated or BW will throw an error
+            # `id` must be created automatically, but `id=137934742532190208` given
+            if key not in ("code", "id", "exchanges")
+        }
+        data["name"] = new_activity_name
+        data["System description"] = "Ecobalyse"
+        data["database"] = builder.dbname
+        # see https://github.com/brightway-lca/brightway2-data/blob/main/CHANGES.md#40dev57-2024-10-03
+        data["type"] = "processwithreferenceproduct"
+        if location is not None:
+            data["location"] = location
+        code = activity_hash(data)
+        new_activity = builder.copy_activity(base_activity, code, **data)
+    else:
+        data = {
+            "production amount": 1,
+            "unit": unit,
+            # see https://github.com/brightway-lca/brightway2-data/blob/main/CHANGES.md#40dev57-2024-10-03
+            "type": "processwithreferenceproduct",
+            "comment": "",
+            "name": new_activity_name,
+            "System description": "Ecobalyse",
+            "location": location,
+        }
+        code = activity_hash(data)
+        new_activity = builder.new_activity(code, **data)
+    new_activity["Process identifier"] = code
+    logger.debug(f"Created activity '{new_activity['name']}' ({code})")
+    return new_activity
+
+
+def build_created_activities(
+    created_activities_db, activities_to_create
+) -> ActivitiesBuilder:
+    """Build in memory the new activities defined in `ACTIVITIES_TO_CREATE.json`, without
+    writing them"""
+    with open(activities_to_create, "r") as f:
+        activities_data = json.load(f)
+
+    builder = ActivitiesBuilder(created_activities_db)
+    builder.prefetch(activity_references(activities_data))
+
+    for activity_data in activities_data:
+        logger.debug(
+            f"-> Creating activity {activity_data.get('activityCreationType')} '{activity_data.get('alias')}'"
+        )
+        if activity_data.get("activityCreationType") == ActivityFrom.SCRATCH:
+            add_activity_from_scratch(builder, activity_data)
+            logger.debug("-")
+        if activity_data.get("activityCreationType") == ActivityFrom.EXISTING:
+            add_activity_from_existing(builder, activity_data)
+            logger.debug("-")
+
+    return builder
+
+
+def add_activity_from_scratch(builder: ActivitiesBuilder, activity_data):
+    """Add to the database of the builder a new activity created from scratch
+
+    Example : the "diesel, B7" activity is created from scratch with the following exchanges
+    defined in activities_to_create.json
+
+    "exchanges": [
+      {
+        {
+          "name": "Carbon dioxide, fossil",
+          "code": "349b29d1-3e58-4c66-98b9-9d1a076efd2e",
+          "database": "biosphere3"
+        },
+        "amount": 2.19
+      },
+      {
+        {
+          "name": "Carbon monoxide, fossil",
+          "code": "6edcc2df-88a3-48e1-83d8-ffc38d31c35b",
+          "database": "biosphere3"
+        },
+        "amount": 0.014
+      },
+     ...
+    """
+    unit = activity_data.get("unit", "kilogram")
+    activity_from_scratch = create_activity(
+        builder,
+        f"{activity_data['newName']}",
+        unit=unit,
+        location=activity_data.get("location"),
+    )
+
+    for exchange_item in activity_data["exchanges"]:
+        amount = exchange_item["amount"]
+        activity_add = search_activity(
+            builder, exchange_item, activity_data["database"]
+        )
+        new_exchange(builder, activity_from_scratch, activity_add, amount)
+
+
+def delete_exchange(
+    builder: ActivitiesBuilder, activity, activity_to_delete, amount=False
+):
+    """Deletes an exchange from an activity."""
+    for exchange in builder.exchanges(activity):
+        if builder.input_name(exchange) == activity_to_delete["name"] and (
+            not amount or exchange["amount"] == amount
+        ):
+            builder.delete_exchange(activity, exchange)
+            logger.debug(f"Deleted exchange from '{activity_to_delete['name']}'")
+            return
+
+    raise ValueError(f"Did not find exchange {activity_to_delete}. No exchange deleted")
+
+
+def get_exchange_type(activity: dict) -> ExchangeType:
+    """Get the type of an exchange based on the activity"""
+    if activity.get("database") == "biosphere3":
+        return ExchangeType.BIOSPHERE
+    return ExchangeType.TECHNOSPHERE
+
+
+def new_exchange(
+    builder: ActivitiesBuilder,
+    activity,
+    new_activity,
+    new_amount=None,
+    activity_to_copy_from=None,
+):
+    """Create a new exchange. If an activity_to_copy_from is provided, the amount is copied from this activity. Otherwise, the amount is new_amount.
+
+    activity: the activity to which the new exchange is added
+    new_activity: the new exchange will link to this new_activity
+    new_amount: the amount of the new exchange
+    activity_to_copy_from: the activity from which the amount is copied
+    """
+    assert new_amount is not None or activity_to_copy_from is not None, (
+        "No amount or activity to copy from provided"
+    )
+    if new_amount is None and activity_to_copy_from is not None:
+        for exchange in builder.exchanges(activity):
+            if builder.input_name(exchange) == activity_to_copy_from["name"]:
+                new_amount = exchange["amount"]
+                break
+        else:
+            raise ValueError(
+                f"Exchange to duplicate from :{activity_to_copy_from} not found. No exchange added"
+            )
+
+    builder.new_exchange(
+        activity,
+        new_activity,
+        name=new_activity["name"],
+        amount=new_amount,
+        type=get_exchange_type(new_activity),
+        unit=new_activity["unit"],
+        comment="",
+    )
+    logger.debug(f"Exchange '{new_activity['name']}' added with amount: {new_amount}")
+
+
+def replace_activities(
+    builder: ActivitiesBuilder, new_activity, activity_data, base_db
+):
+    """Replace all activities in activity_data["replace"] with variants of these activities"""
+    # replace is now an array of objects: [{"from": {...}, "to": {...}}, ...]
+    for replacement in activity_data["replacementPlan"].get("replace", []):
+        activity_to_be_replaced = search_activity(builder, replacement["from"], base_db)
+        activity_replacing = search_activity(builder, replacement["to"], base_db)
+        new_exchange(
+            builder,
+            new_activity,
+            activity_replacing,
+            activity_to_copy_from=activity_to_be_replaced,
+        )
+        delete_exchange(builder, new_activity, activity_to_be_replaced)
+
+
+def add_activity_from_existing(builder: ActivitiesBuilder, activity_data):
+    """Add to the database a new activity : the variant of an activity
+
+    Example : ingredient flour-organic is not in agribalyse so it is created at this step. It's a
+    variant of activity flour
+    """
+    default_db = activity_data["database"]
+    # Example : the flour-conventional
+    # existingActivity is now an object: {"name": "...", "database": "..."}
+    existing_activity = search_activity(
+        builder, activity_data["existingActivity"], default_db
+    )
+
+    # create a new  activity
+    # Example: this is where we create the flour-organic activity
+    new_activity = create_activity(
+        builder,
+        f"{activity_data['newName']}",
+        existing_activity,
+        location=activity_data.get("location"),
+    )
+
+    if "delete" in activity_data:
+        # delete is now an array of exchange objects: [{"name": "..."}, ...]
+        for exchange_spec in activity_data["delete"]:
+            for exchange in builder.exchanges(new_activity):
+                if all(
+                    [exchange.get(spec[0]) == spec[1] for spec in exchange_spec.items()]
+                ):
+                    builder.delete_exchange(new_activity, exchange)
+                    logger.debug(f"Deleted exchange {exchange_spec}")
+
+    if "exchanges" in activity_data:
+        for exchange_item in activity_data["exchanges"]:
+            amount = exchange_item["amount"]
+            activity_add = search_activity(
+                builder, exchange_item, activity_data["database"]
+            )
+            new_exchange(builder, new_activity, activity_add, amount)
+
+    if "replacementPlan" in activity_data:
+        # if the activity has no upstream path, we can directly replace the seed activity with the seed
+        #  activity variant
+        if not activity_data["replacementPlan"]["upstreamPath"]:
+            replace_activities(
+                builder, new_activity, activity_data, activity_data["database"]
+            )
+
+        # else we have to iterate through the upstream path and create a new variant activity for each upstream activity
+
+        # Example: for flour-organic we have to dig through the upstream process `global milling process` and
+        #  replace the wheat activity with the wheat-organic activity
+        else:
+            for i, upstream_activity_data in enumerate(
+                activity_data["replacementPlan"]["upstreamPath"]
+            ):
+                upstream_activity = search_activity(
+                    builder, upstream_activity_data, default_db
+                )
+
+                # create a new upstream_activity_variant
+                upstream_activity_variant = create_activity(
+                    builder,
+                    f"{upstream_activity['name']} {{{{{activity_data['alias']}}}}}",
+                    upstream_activity,
+                )
+
+                # link the newly created upstream_activity_variant to the parent activity_variant
+                new_exchange(
+                    builder,
+                    new_activity,
+                    upstream_activity_variant,
+                    activity_to_copy_from=upstream_activity,
+                )
+                delete_exchange(builder, new_activity, upstream_activity)
+
+                # for the last upstream activity: apply replacements and add any exchanges
+                if i == len(activity_data["replacementPlan"]["upstreamPath"]) - 1:
+                    replace_activities(
+                        builder,
+                        upstream_activity_variant,
+                        activity_data,
+                        upstream_activity["database"],
+                    )
+                    if "exchanges" in activity_data["replacementPlan"]:
+                        for exchange_item in activity_data["replacementPlan"][
+                            "exchanges"
+                        ]:
+                            amount = exchange_item["amount"]
+                            activity_add = search_activity(
+                                builder, exchange_item, upstream_activity["database"]
+                            )
+                            new_exchange(
+                                builder, upstream_activity_variant, activity_add, amount
+                            )
+
+                # update the activity_variant (parent activity)
+                new_activity = upstream_activity_variant
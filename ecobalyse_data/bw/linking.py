@@ -0,0 +1,293 @@
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+import bw2data
+import orjson
+from bw2data.backends import ActivityDataset, sqlite3_lci_db
+from bw2data.backends.utils import dict_as_activitydataset
+from bw2data.search import IndexManager
+from bw2io.errors import StrategyError
+from bw2io.strategies.generic import format_nonunique_key_error
+from bw2io.utils import DEFAULT_FIELDS, activity_hash
+from bw_processing import safe_filename
+from peewee import fn
+
+from ecobalyse_data.logging import logger
+
+TECHNOSPHERE_TYPES = {"technosphere", "substitution", "production"}
+# Field sets used to link the technosphere exchanges, from the most to the least specific
+TECHNOSPHERE_FIELDS = [("name", "unit", "location"), ("name", "unit")]
+# Types of the datasets an external technosphere exchange can be linked to
+# ("processwithreferenceproduct" is the default type since bw2data 4.0.dev57)
+PROCESS_TYPES = {"process", "processwithreferenceproduct"}
+
+
+@dataclass
+class LinkStats:
+    label: str
+    fields: Tuple[str, ...]
+    unlinked: int
+    linked: int
+
+    @property
+    def remaining(self):
+        return self.unlinked - self.linked
+
+    def __str__(self):
+        return (
+            f"{self.label} by {', '.join(self.fields)}: linked {self.linked}"
+            f" of {self.unlinked} unlinked exchanges, {self.remaining} remaining"
+        )
+
+
+class HashIndex:
+    """Link candidates indexed by `activity_hash` for several field sets.
+
+    This is what `bw2io.strategies.generic.link_iterable_by_fields` builds on each
+    call: building the index once allows to reuse it between linking passes."""
+
+    def __init__(self, datasets: Iterable[dict], fields_sets: List[Tuple[str, ...]]):
+        self.candidates = {tuple(fields): {} for fields in fields_sets}
+        self.duplicates = {tuple(fields): {} for fields in fields_sets}
+        self.size = 0
+
+        for ds in datasets:
+            self.add(ds)
+
+    def add(self, ds: dict):
+        self.size += 1
+        try:
+            for fields, candidates in self.candidates.items():
+                key = activity_hash(ds, fields)
+                if key in candidates:
+                    self.duplicates[fields].setdefault(key, []).append(ds)
+                else:
+                    candidates[key] = (ds["database"], ds["code"])
+        except KeyError:
+            raise StrategyError(
+                "Not all datasets in database to be linked have "
+                "``database`` or ``code`` attributes"
+            )
+
+    def __contains__(self, ds: dict):
+        """Whether `ds` matches a candidate, for any of the field sets"""
+        return any(
+            activity_hash(ds, fields) in candidates
+            for fields, candidates in self.candidates.items()
+        )
+
+    def dumps(self, fingerprint) -> bytes:
+        return orjson.dumps(
+            {
+                "fingerprint": fingerprint,
+                "size": self.size,
+                "indexes": [
+                    {
+                        "fields": fields,
+                        "candidates": self.candidates[fields],
+                        "duplicates": self.duplicates[fields],
+                    }
+                    for fields in self.candidates
+                ],
+            }
+        )
+
+    @classmethod
+    def loads(cls, content: bytes, fingerprint) -> Optional["HashIndex"]:
+        """Load an index serialized with `dumps`, None if it is outdated"""
+        dumped = orjson.loads(content)
+        if dumped["fingerprint"] != list(fingerprint):
+            return None
+        index = cls([], [])
+        index.size = dumped["size"]
+        for dumped_index in dumped["indexes"]:
+            fields = tuple(dumped_index["fields"])
+            index.candidates[fields] = {
+                key: tuple(value) for key, value in dumped_index["candidates"].items()
+            }
+            index.duplicates[fields] = dumped_index["duplicates"]
+        return index
+
+    @classmethod
+    def from_database(
+        cls,
+        database_name: str,
+        fields_sets: List[Tuple[str, ...]],
+        types: Optional[set] = None,
+    ):
+        """Index the activities of a brightway database, reading them in a single
+        query instead of instantiating an `Activity` for each of them"""
+        query = ActivityDataset.select(ActivityDataset.data).where(
+            ActivityDataset.database == database_name
+        )
+        if types is not None:
+            query = query.where(
+                ActivityDataset.type.in_(types) | ActivityDataset.type.is_null()
+            )
+        return cls((data for (data,) in query.tuples().iterator()), fields_sets)
+
+    def link(
+        self, db: List[dict], fields: Tuple[str, ...], edge_kinds: set, label: str
+    ) -> LinkStats:
+        """Link the unlinked exchanges of kind `edge_kinds` in `db`, like
+        `link_iterable_by_fields` does"""
+        candidates, duplicates = self.candidates[fields], self.duplicates[fields]
+        stats = LinkStats(label=label, fields=fields, unlinked=0, linked=0)
+
+        for ds in db:
+            for exc in ds.get("exchanges", []):
+                if exc.get("type") not in edge_kinds or exc.get("input"):
+                    continue
+                stats.unlinked += 1
+                key = activity_hash(exc, fields)
+                if key in duplicates:
+                    raise StrategyError(
+                        format_nonunique_key_error(exc, fields, duplicates[key])
+                    )
+                elif key in candidates:
+                    exc["input"] = candidates[key]
+                    stats.linked += 1
+
+        return stats
+
+
+class LinkingPass:
+    """A brightway strategy linking exchanges with an index of the `Linker`"""
+
+    def __init__(self, linker, target: str, fields: Tuple[str, ...], edge_kinds: set):
+        self.linker = linker
+        self.target = target
+        self.fields = fields
+        self.edge_kinds = edge_kinds
+        # Used by brightway when logging the applied strategies
+        self.__name__ = f"link_{target}_by_{'_'.join(fields)}".replace(" ", "_")
+
+    def __call__(self, db):
+        index = self.linker.get_index(self.target, db)
+        stats = index.link(db, self.fields, self.edge_kinds, label=self.target)
+        logger.info(f"-> {stats}")
+        self.linker.stats.append(stats)
+        return db
+
+
+class Linker:
+    """Link the exchanges of the datasets being imported to themselves, to an
+    optional external database and to the biosphere.
+
+    Each index is built once, on first use, and reused by all the passes."""
+
+    def __init__(self, external_db_name: Optional[str] = None, biosphere=None):
+        self.external_db_name = external_db_name
+        self.biosphere = biosphere
+        self.indexes = {}
+        self.stats: List[LinkStats] = []
+
+    def get_index(self, target: str, db: List[dict]) -> HashIndex:
+        if target not in self.indexes:
+            if target == "internal":
+                # Linking only sets the `input` of exchanges, so the datasets can be
+                # indexed once for all the passes
+                self.indexes[target] = HashIndex(db, TECHNOSPHERE_FIELDS)
+            elif target == self.external_db_name:
+                self.indexes[target] = HashIndex.from_database(
+                    target, TECHNOSPHERE_FIELDS, types=PROCESS_TYPES
+                )
+            elif target == self.biosphere:
+                # Shared by all the imports, and persisted between them
+                self.indexes[target] = load_database_index(target, [DEFAULT_FIELDS])
+            else:
+                raise ValueError(f"Unknown linking target {target}")
+            logger.debug(
+                f"-> Indexed {self.indexes[target].size} datasets of {target} for linking"
+            )
+        return self.indexes[target]
+
+    def strategies(self):
+        """The linking passes, to be applied in order"""
+        passes = [
+            LinkingPass(self, "internal", fields, TECHNOSPHERE_TYPES)
+            for fields in TECHNOSPHERE_FIELDS
+        ]
+        if self.external_db_name is not None:
+            passes += [
+                LinkingPass(self, self.external_db_name, fields, TECHNOSPHERE_TYPES)
+                for fields in TECHNOSPHERE_FIELDS
+            ]
+        if self.biosphere is not None:
+            passes.append(
+                LinkingPass(self, self.biosphere, DEFAULT_FIELDS, {"biosphere"})
+            )
+        return passes
+
+
+# Persistent indexes
+# ==================
+#
+# The biosphere is shared by all the imported databases, and only grows by a few flows
+# per import: its index is kept in the brightway project directory and only rebuilt
+# when the database was modified by something else than `append_activities`.
+
+
+def database_fingerprint(database_name: str) -> Tuple[int, Optional[int]]:
+    """Number of activities and highest id: any write or deletion changes it"""
+    return tuple(
+        ActivityDataset.select(fn.COUNT(ActivityDataset.id), fn.MAX(ActivityDataset.id))
+        .where(ActivityDataset.database == database_name)
+        .tuples()
+        .get()
+    )
+
+
+def database_index_path(database_name: str) -> Path:
+    return (
+        Path(bw2data.projects.dir)
+        / "hash-indexes"
+        / f"{safe_filename(database_name)}.json"
+    )
+
+
+def load_database_index(
+    database_name: str, fields_sets: List[Tuple[str, ...]]
+) -> HashIndex:
+    """Load the persisted index of `database_name`, or build and persist it"""
+    path = database_index_path(database_name)
+    fingerprint = database_fingerprint(database_name)
+    if path.is_file():
+        index = HashIndex.loads(path.read_bytes(), fingerprint)
+        if index is not None and set(index.candidates) == set(map(tuple, fields_sets)):
+            logger.debug(f"-> Loaded the hash index of {database_name} from {path}")
+            return index
+
+    index = HashIndex.from_database(database_name, fields_sets)
+    save_database_index(database_name, index)
+    return index
+
+
+def save_database_index(database_name: str, index: HashIndex):
+    path = database_index_path(database_name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(index.dumps(database_fingerprint(database_name)))
+
+
+def append_activities(database_name: str, datasets: List[dict]):
+    """Insert new activities, without exchanges, in an existing database.
+
+    Unlike `Database.write`, the existing activities are neither deleted nor
+    rewritten. The datasets are inserted in a single transaction, and the database
+    is marked as dirty so that its datapackage is processed once, when needed."""
+    with sqlite3_lci_db.atomic():
+        # SQLite has a limit of 999 variables per query, 8 fields * 100 is under it
+        for i in range(0, len(datasets), 100):
+            ActivityDataset.insert_many(
+                [
+                    dict_as_activitydataset(ds, add_snowflake_id=True)
+                    for ds in datasets[i : i + 100]
+                ]
+            ).execute()
+
+    metadata = bw2data.databases[database_name]
+    metadata["number"] = metadata.get("number", 0) + len(datasets)
+    if metadata.get("searchable"):
+        IndexManager(bw2data.Database(database_name).filename).add_datasets(datasets)
+    bw2data.databases.set_dirty(database_name)
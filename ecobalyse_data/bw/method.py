@@ -0,0 +1,89 @@
+import warnings
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+from bw2data import Method, methods
+from bw2data.backends import ActivityDataset, sqlite3_lci_db
+from bw2data.errors import UnknownObject
+
+from ecobalyse_data.bw.builder import chunks
+from ecobalyse_data.logging import logger
+
+
+def node_ids(keys: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], int]:
+    """The ids of the nodes of `keys`, with one query per database and chunk of codes
+    instead of one `get_node` per key"""
+    codes = defaultdict(set)
+    for dbname, code in keys:
+        codes[dbname].add(code)
+
+    ids = {}
+    for dbname, db_codes in codes.items():
+        for chunk in chunks(db_codes):
+            query = ActivityDataset.select(
+                ActivityDataset.code, ActivityDataset.id
+            ).where(
+                (ActivityDataset.database == dbname) & ActivityDataset.code.in_(chunk)
+            )
+            for code, id_ in query.tuples():
+                ids[(dbname, code)] = id_
+        for code in db_codes:
+            if (dbname, code) not in ids:
+                raise UnknownObject(f"Node {(dbname, code)} not found")
+    return ids
+
+
+def dedup_cfs(cfs: List[dict]) -> List[dict]:
+    """Remove the duplicated characterization factors, keeping the first one"""
+    seen = set()
+    deduped = []
+    for cf in cfs:
+        key = tuple(sorted(cf.items()))
+        if key not in seen:
+            seen.add(key)
+            deduped.append(cf)
+    return deduped
+
+
+def write_methods(methods_data: List[dict], overwrite: bool = False):
+    """Write the methods of a bw2io LCIA importer, like its `write_methods`.
+
+    The biosphere keys of all the characterization factors are resolved to ids at
+    once, in a single transaction, and each method is processed once when written
+    (bw2io processes it a second time)."""
+    unlinked = sum(
+        1 for ds in methods_data for cf in ds["exchanges"] if not cf.get("input")
+    )
+    if unlinked:
+        raise ValueError(f"Can't write unlinked methods ({unlinked} unlinked cfs)")
+
+    with sqlite3_lci_db.transaction():
+        ids = node_ids(
+            tuple(cf["input"]) for ds in methods_data for cf in ds["exchanges"]
+        )
+
+    for ds in methods_data:
+        if ds["name"] in methods:
+            if not overwrite:
+                raise ValueError(
+                    f"Method {ds['name']} already exists. Use ``overwrite=True`` to"
+                    " overwrite existing methods"
+                )
+            del methods[ds["name"]]
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            method = Method(ds["name"])
+            method.register(
+                description=ds["description"],
+                filename=ds["filename"],
+                unit=ds["unit"],
+            )
+            method.write(
+                [(ids[tuple(cf["input"])], cf["amount"]) for cf in ds["exchanges"]]
+            )
+
+    logger.info(
+        f"-> Wrote {len(methods_data)} LCIA methods with "
+        f"{sum(len(ds['exchanges']) for ds in methods_data)} characterization factors"
+    )
@@ -0,0 +1,203 @@
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import bw2calc
+import bw2data
+import bw_processing as bwp
+from bw2data import Database, Method, labels
+from bw2data.backends import ActivityDataset
+from bw2data.errors import UnknownObject
+from bw2data.utils import as_uncertainty_dict
+from peewee import fn
+
+from ecobalyse_data.bw.builder import ActivitiesBuilder, chunks
+from ecobalyse_data.bw.created_activities import build_created_activities
+from ecobalyse_data.logging import logger
+
+
+class OverlayActivity(dict):
+    """A node of a `MatrixOverlay`, that can be used where the computation expects a
+    brightway `Activity`"""
+
+    def __init__(self, overlay: "MatrixOverlay", dataset: dict):
+        super().__init__(
+            (key, value) for key, value in dataset.items() if key != "exchanges"
+        )
+        self.overlay = overlay
+
+    @property
+    def id(self) -> int:
+        return self.overlay.ids[self.key]
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return (self["database"], self["code"])
+
+    @property
+    def _data(self) -> dict:
+        return self
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __eq__(self, other):
+        return isinstance(other, OverlayActivity) and self.key == other.key
+
+    def __str__(self):
+        return (
+            f"'{self.get('name')}' ({self.get('unit')}, {self.get('location')}, None)"
+        )
+
+
+class MatrixOverlay:
+    """Activities built in memory, compiled into a datapackage that is stacked on the
+    datapackages of the databases they use.
+
+    The activities get new matrix ids, after the ones of the project, so that their
+    rows and columns are added to the base matrices: nothing is written to SQLite,
+    and recomputing an edited activity doesn't need to rebuild its database."""
+
+    def __init__(self, builder: ActivitiesBuilder):
+        self.builder = builder
+        self.dbname = builder.dbname
+
+        first_id = (
+            ActivityDataset.select(fn.MAX(ActivityDataset.id)).scalar() or 0
+        ) + 1
+        self.ids: Dict[Tuple[str, str], int] = {
+            (self.dbname, code): first_id + i for i, code in enumerate(builder.datasets)
+        }
+        self.dependencies = set()
+        self._load_input_ids()
+        self.datapackage = self._datapackage()
+        logger.info(
+            f"-> Compiled {len(self.ids)} activities of {self.dbname} into a matrix overlay"
+        )
+
+    @classmethod
+    def from_file(cls, dbname: str, activities_to_create) -> "MatrixOverlay":
+        """Compile an `activities_to_create.json` file"""
+        return cls(build_created_activities(dbname, activities_to_create))
+
+    def _exchanges(self) -> Iterable[Tuple[dict, dict]]:
+        for ds in self.builder.datasets.values():
+            for exc in ds["exchanges"]:
+                yield ds, exc
+
+    def _load_input_ids(self):
+        codes = defaultdict(set)
+        for _, exc in self._exchanges():
+            dbname, code = exc["input"]
+            if dbname != self.dbname:
+                codes[dbname].add(code)
+        self.dependencies = set(codes)
+        for dbname, db_codes in codes.items():
+            for chunk in chunks(db_codes):
+                query = ActivityDataset.select(
+                    ActivityDataset.code, ActivityDataset.id
+                ).where(
+                    (ActivityDataset.database == dbname)
+                    & ActivityDataset.code.in_(chunk)
+                )
+                for code, id_ in query.tuples():
+                    self.ids[(dbname, code)] = id_
+
+    def _datapackage(self) -> bwp.Datapackage:
+        technosphere, biosphere = [], []
+        produced = set()
+        for ds, exc in self._exchanges():
+            if exc["input"] not in self.ids:
+                raise UnknownObject(
+                    f"Exchange between {exc['input']} and {exc['output']} is invalid"
+                    " - the input doesn't exist"
+                )
+            row = {
+                **as_uncertainty_dict(exc),
+                "row": self.ids[exc["input"]],
+                "col": self.ids[exc["output"]],
+            }
+            if exc["type"] in labels.biosphere_edge_types:
+                biosphere.append({**row, "flip": False})
+            elif exc["type"] in labels.technosphere_negative_edge_types:
+                technosphere.append({**row, "flip": True})
+            elif exc["type"] in labels.technosphere_positive_edge_types:
+                technosphere.append({**row, "flip": False})
+                produced.add(exc["output"])
+
+        # Like `Database.process`, activities without production exchange produce 1
+        for ds in self.builder.datasets.values():
+            key = (ds["database"], ds["code"])
+            if (
+                key not in produced
+                and ds.get("type") in labels.implicit_production_allowed_node_types
+            ):
+                technosphere.append(
+                    {"row": self.ids[key], "col": self.ids[key], "amount": 1}
+                )
+
+        dp = bwp.create_datapackage(
+            name=bwp.clean_datapackage_name(f"{self.dbname} overlay"),
+            sum_intra_duplicates=True,
+            sum_inter_duplicates=False,
+        )
+        for matrix, rows in (
+            ("technosphere_matrix", technosphere),
+            ("biosphere_matrix", biosphere),
+        ):
+            if rows:
+                dp.add_persistent_vector_from_iterator(
+                    matrix=matrix,
+                    name=bwp.clean_datapackage_name(f"{self.dbname} overlay {matrix}"),
+                    dict_iterator=rows,
+                )
+        return dp
+
+    def search_one(
+        self,
+        name: str,
+        location: Optional[str] = None,
+        code: Optional[str] = None,
+        categories: Optional[tuple] = None,
+        unit: Optional[str] = None,
+    ) -> OverlayActivity:
+        return OverlayActivity(
+            self,
+            self.builder.search_one(
+                self.dbname,
+                name,
+                location=location,
+                code=code,
+                categories=categories,
+                unit=unit,
+            ),
+        )
+
+    def get_multilca_data_objs(
+        self, functional_units: Dict[str, dict], method_config: dict
+    ) -> List[bwp.DatapackageBase]:
+        """Like `bw2data.get_multilca_data_objs`, for functional units that can
+        include overlay nodes"""
+        overlay_ids = {self.ids[(self.dbname, code)] for code in self.builder.datasets}
+        database_names = set(self.dependencies)
+        for functional_unit in functional_units.values():
+            for id_ in functional_unit:
+                if id_ not in overlay_ids:
+                    database_names.add(bw2data.get_node(id=id_)["database"])
+
+        complete_database_names = set().union(
+            *[Database(name).find_graph_dependents() for name in database_names]
+        )
+        return (
+            [Database(name).datapackage() for name in sorted(complete_database_names)]
+            + [
+                Method(method).datapackage()
+                for method in method_config.get("impact_categories", [])
+            ]
+            + [self.datapackage]
+        )
+
+    def lca(self, demand: Dict[int, float]) -> bw2calc.LCA:
+        """An LCA of `demand`, a dict of node ids, without characterization: use
+        `switch_method` to characterize it"""
+        data_objs = self.get_multilca_data_objs({"demand": demand}, {})
+        return bw2calc.LCA(demand, data_objs=data_objs)
@@ -0,0 +1,131 @@
+import functools
+from multiprocessing import Pool
+
+from bw2io.strategies import (
+    assign_only_product_as_production,
+    change_electricity_unit_mj_to_kwh,
+    convert_activity_parameters_to_list,
+    drop_unspecified_subcategories,
+    fix_zero_allocation_products,
+    normalize_simapro_biosphere_categories,
+    normalize_simapro_biosphere_names,
+    normalize_units,
+    set_code_by_activity_hash,
+    sp_allocate_products,
+    split_simapro_name_geo,
+    strip_biosphere_exc_locations,
+    update_ecoinvent_locations,
+)
+from bw2io.strategies.simapro import set_lognormal_loc_value_uncertainty_safe
+from tqdm import tqdm
+
+from ecobalyse_data.bw.strategy import (
+    FusedStrategy,
+    fuse_strategies,
+    is_dataset_strategy,
+)
+
+# Brightway strategies that only look at one dataset at a time, without any access
+# to the brightway project (no migration, no linking to other databases, …): they
+# can be applied independently on each shard of the datasets.
+DATASET_LOCAL_STRATEGIES = {
+    assign_only_product_as_production,
+    change_electricity_unit_mj_to_kwh,
+    convert_activity_parameters_to_list,
+    drop_unspecified_subcategories,
+    fix_zero_allocation_products,
+    normalize_simapro_biosphere_categories,
+    normalize_simapro_biosphere_names,
+    normalize_units,
+    set_code_by_activity_hash,
+    set_lognormal_loc_value_uncertainty_safe,
+    sp_allocate_products,
+    split_simapro_name_geo,
+    strip_biosphere_exc_locations,
+    update_ecoinvent_locations,
+}
+
+# Number of shards per process, to even out the load between processes
+SHARDS_PER_PROCESS = 4
+
+
+def is_dataset_local(strategy):
+    if isinstance(strategy, FusedStrategy) or is_dataset_strategy(strategy):
+        return True
+    if isinstance(strategy, functools.partial):
+        strategy = strategy.func
+    return strategy in DATASET_LOCAL_STRATEGIES
+
+
+def _apply_serially(args):
+    strategies, shard = args
+    for strategy in strategies:
+        shard = strategy(shard)
+    return shard
+
+
+def _strategy_name(strategy):
+    try:
+        return strategy.__name__
+    except AttributeError:  # functools.partial
+        return strategy.func.__name__
+
+
+class ShardedStrategy:
+    """Dataset-local strategies applied on shards of the datasets by a process pool.
+
+    The shards are reassembled in their original order, so the result is identical
+    to applying the strategies one after another."""
+
+    def __init__(self, strategies, cpu_count):
+        self.strategies = fuse_strategies(list(strategies))
+        self.cpu_count = cpu_count
+        # Used by brightway when logging the applied strategies
+        self.__name__ = "+".join(_strategy_name(s) for s in self.strategies)
+
+    def __call__(self, db):
+        db = list(db)
+        shard_size = max(-(-len(db) // (self.cpu_count * SHARDS_PER_PROCESS)), 1)
+        shards = [db[i : i + shard_size] for i in range(0, len(db), shard_size)]
+
+        if len(shards) <= 1:
+            return _apply_serially((self.strategies, db))
+
+        with Pool(self.cpu_count) as pool:
+            results = list(
+                tqdm(
+                    pool.imap(_apply_serially, [(self.strategies, s) for s in shards]),
+                    total=len(shards),
+                    desc=f"{len(db)} datasets in {len(shards)} shards",
+                )
+            )
+
+        return [ds for shard in results for ds in shard]
+
+
+def parallelize_strategies(strategies, cpu_count=1):
+    """Group each run of consecutive dataset-local strategies into a
+    `ShardedStrategy` using `cpu_count` processes.
+
+    The other strategies (migrations, linking, …) are kept as is and applied
+    serially. With a single CPU, dataset strategies are only fused."""
+    if cpu_count <= 1:
+        return fuse_strategies(strategies)
+
+    parallelized = []
+    run = []
+
+    def flush():
+        if run:
+            parallelized.append(ShardedStrategy(run, cpu_count))
+        run.clear()
+
+    for strategy in strategies:
+        if is_dataset_local(strategy):
+            run.append(strategy)
+        else:
+            flush()
+            parallelized.append(strategy)
+    flush()
+
+    return parallelized
@@ -0,0 +1,160 @@
+import os
+import platform
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import orjson
+import psutil
+
+from ecobalyse_data.bw.parallel import _strategy_name
+from ecobalyse_data.logging import logger
+
+# Seconds between two measures of the memory used by a stage
+RSS_SAMPLING_INTERVAL = 0.1
+
+
+@dataclass
+class StageProfile:
+    name: str
+    wall_time: float
+    cpu_time: float
+    # Highest resident memory of the process and its children during the stage
+    peak_rss: int
+    datasets: Optional[int] = None
+    exchanges: Optional[int] = None
+
+
+def _cpu_time(process: psutil.Process) -> float:
+    # The children are the worker processes that were joined, like the strategy pools
+    times = process.cpu_times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def _rss(process: psutil.Process) -> int:
+    rss = process.memory_info().rss
+    for child in process.children(recursive=True):
+        try:
+            rss += child.memory_info().rss
+        except psutil.Error:
+            pass
+    return rss
+
+
+class _RssSampler(threading.Thread):
+    def __init__(self, process: psutil.Process):
+        super().__init__(daemon=True)
+        self.process = process
+        self.peak = _rss(process)
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(RSS_SAMPLING_INTERVAL):
+            self.peak = max(self.peak, _rss(self.process))
+
+    def stop(self) -> int:
+        self._stop_event.set()
+        self.join()
+        return max(self.peak, _rss(self.process))
+
+
+class Profiler:
+    """Wall time, CPU time, peak memory and number of datasets and exchanges of the
+    stages of an import, see `stage`"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = datetime.now()
+        self.stages: List[StageProfile] = []
+        self._process = psutil.Process()
+        self._start_wall = time.perf_counter()
+        self._start_cpu = _cpu_time(self._process)
+
+    @contextmanager
+    def stage(self, name: str, data: Optional[Callable[[], list]] = None):
+        """Profile the code run in the context. `data` returns the datasets, counted
+        at the end of the stage."""
+        sampler = _RssSampler(self._process)
+        sampler.start()
+        start_wall, start_cpu = time.perf_counter(), _cpu_time(self._process)
+        succeeded = False
+        try:
+            yield
+            succeeded = True
+        finally:
+            profile = StageProfile(
+                name=name,
+                wall_time=time.perf_counter() - start_wall,
+                cpu_time=_cpu_time(self._process) - start_cpu,
+                peak_rss=sampler.stop(),
+            )
+            if data is not None and succeeded:
+                datasets = data()
+                profile.datasets = len(datasets)
+                profile.exchanges = sum(len(ds.get("exchanges", [])) for ds in datasets)
+            self.stages.append(profile)
+            logger.debug(
+                f"-> [{self.name}] {name}: {profile.wall_time:.2f}s wall,"
+                f" {profile.cpu_time:.2f}s CPU, {profile.peak_rss / 2**20:.0f} MiB"
+            )
+
+    def apply_strategies(self, importer, strategies=None, prefix="strategies"):
+        """Like `importer.apply_strategies`, profiling each strategy as a stage"""
+        for strategy in importer.strategies if strategies is None else strategies:
+            with self.stage(
+                f"{prefix}/{_strategy_name(strategy)}", data=lambda: importer.data
+            ):
+                importer.apply_strategy(strategy, verbose=False)
+
+    def report(self) -> dict:
+        return {
+            "name": self.name,
+            "started": self.started.isoformat(),
+            "host": platform.node(),
+            "cpu_count": os.cpu_count(),
+            "wall_time": time.perf_counter() - self._start_wall,
+            "cpu_time": _cpu_time(self._process) - self._start_cpu,
+            "peak_rss": max((stage.peak_rss for stage in self.stages), default=0),
+            "stages": [asdict(stage) for stage in self.stages],
+        }
+
+    def save(self, directory: Path) -> Path:
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"{self.name}.{self.started:%Y%m%dT%H%M%S}.json"
+        path.write_bytes(orjson.dumps(self.report(), option=orjson.OPT_INDENT_2))
+        logger.info(f"-> Import profile written to {path}")
+        return path
+
+
+def load_report(path: Path) -> dict:
+    return orjson.loads(Path(path).read_bytes())
+
+
+def compare_reports(before: dict, after: dict) -> List[Dict]:
+    """The stages of two reports side by side, in the order of `after`, followed by
+    the ones only in `before`"""
+    before_stages = {stage["name"]: stage for stage in before["stages"]}
+    after_stages = {stage["name"]: stage for stage in after["stages"]}
+    names = list(after_stages) + [
+        name for name in before_stages if name not in after_stages
+    ]
+    return [
+        {
+            "name": name,
+            "before": before_stages.get(name),
+            "after": after_stages.get(name),
+        }
+        for name in names
+    ] + [
+        {
+            "name": "total",
+            "before": {
+                key: before[key] for key in ("wall_time", "cpu_time", "peak_rss")
+            },
+            "after": {key: after[key] for key in ("wall_time", "cpu_time", "peak_rss")},
+        }
+    ]
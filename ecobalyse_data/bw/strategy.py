@@ -1,4 +1,4 @@
-import copy
+import functools
 import re
 
 from tqdm import tqdm
@@ -6,284 +6,379 @@ from tqdm import tqdm
 from . import agribalyse
 
 
+# Most of our strategies only look at one dataset at a time. They are written as
+# `transform(ds) -> ds | None` functions decorated with `dataset_strategy`:
+#
+# - the transform must not mutate the dataset it receives: it returns it untouched,
+#   or returns a (shallow) copy where the modified values are replaced
+#   (copy-on-write), or returns None to drop the dataset;
+# - consecutive dataset strategies can then be merged by `fuse_strategies`, so that
+#   the datasets are traversed once instead of once per strategy.
+def dataset_strategy(transform):
+    """Turn a per-dataset `transform` into a brightway strategy (a function of the
+    whole list of datasets)"""
+
+    @functools.wraps(transform)
+    def strategy(db):
+        return apply_transforms(db, (transform,), desc=transform.__name__)
+
+    strategy.transform = transform
+    return strategy
+
+
+def apply_transforms(db, transforms, desc=None):
+    """Apply the per-dataset `transforms` in order to each dataset of `db`, in one pass"""
+    new_db = []
+    for ds in tqdm(db, desc=desc):
+        for transform in transforms:
+            ds = transform(ds)
+            if ds is None:
+                break
+        else:
+            new_db.append(ds)
+    return new_db
+
+
+def is_dataset_strategy(strategy):
+    return hasattr(strategy, "transform")
+
+
+class FusedStrategy:
+    """Several dataset strategies applied in a single pass over the datasets.
+
+    The result is identical to applying the strategies one after another."""
+
+    def __init__(self, strategies):
+        self.strategies = list(strategies)
+        # Used by brightway when logging the applied strategies
+        self.__name__ = "+".join(strategy.__name__ for strategy in self.strategies)
+
+    # Not stored, so that the strategy can be pickled and sent to other processes
+    @property
+    def transforms(self):
+        return tuple(strategy.transform for strategy in self.strategies)
+
+    def __call__(self, db):
+        return apply_transforms(db, self.transforms, desc=self.__name__)
+
+    def __repr__(self):
+        return f"FusedStrategy({self.__name__})"
+
+
+def fuse_strategies(strategies):
+    """Merge each run of consecutive dataset strategies into a `FusedStrategy`.
+
+    Other strategies (brightway ones, linking, …) are kept as is, and the order of
+    the strategies is preserved."""
+    fused = []
+    run = []
+
+    def flush():
+        if len(run) > 1:
+            fused.append(FusedStrategy(run))
+        else:
+            fused.extend(run)
+        run.clear()
+
+    for strategy in strategies:
+        if is_dataset_strategy(strategy):
+            run.append(strategy)
+        else:
+            flush()
+            fused.append(strategy)
+    flush()
+
+    return fused
+
+
+def _filter_exchanges(ds, keep):
+    """Return `ds` with only the exchanges for which `keep(exc)` is true"""
+    exchanges = [exc for exc in ds["exchanges"] if keep(exc)]
+    if len(exchanges) == len(ds["exchanges"]):
+        return ds
+    return {**ds, "exchanges": exchanges}
+
+
 # Patch for https://github.com/brightway-lca/brightway2-io/pull/283
-def lower_formula_parameters(db):
+@dataset_strategy
+def lower_formula_parameters(ds):
     """lower formula parameters"""
-    for ds in tqdm(db):
-        for k in ds.get("parameters", {}).keys():
-            if "formula" in ds["parameters"][k]:
-                ds["parameters"][k]["formula"] = ds["parameters"][k]["formula"].lower()
-    return db
+    parameters = ds.get("parameters", {})
+    if not any("formula" in parameter for parameter in parameters.values()):
+        return ds
+    return {
+        **ds,
+        "parameters": {
+            k: (
+                {**parameter, "formula": parameter["formula"].lower()}
+                if "formula" in parameter
+                else parameter
+            )
+            for k, parameter in parameters.items()
+        },
+    }
 
 
-def remove_azadirachtine(db):
+@dataset_strategy
+def remove_azadirachtine(ds):
     """Remove all exchanges with azadirachtine, except for apples"""
-    new_db = []
-    for ds in tqdm(db):
-        new_ds = copy.deepcopy(ds)
-        new_ds["exchanges"] = [
-            exc
-            for exc in ds["exchanges"]
-            if (
-                "azadirachtin" not in exc.get("name", "").lower()
-                or ds.get("name", "").lower().startswith("apple")
-            )
-        ]
-        new_db.append(new_ds)
-    return new_db
+    if ds.get("name", "").lower().startswith("apple"):
+        return ds
+    return _filter_exchanges(
+        ds, lambda exc: "azadirachtin" not in exc.get("name", "").lower()
+    )
 
 
-def remove_negative_land_use_on_tomato(db):
+@dataset_strategy
+def remove_negative_land_use_on_tomato(ds):
     """Remove transformation flows from urban on greenhouses
     that cause negative land-use on tomatoes"""
-    new_db = []
-    for ds in tqdm(db):
-        new_ds = copy.deepcopy(ds)
-        if ds.get("name", "").lower().startswith("plastic tunnel"):
-            new_ds["exchanges"] = [
-                exc
-                for exc in ds["exchanges"]
-                if not exc.get("name", "")
-                .lower()
-                .startswith("transformation, from urban")
-            ]
-        else:
-            pass
-        new_db.append(new_ds)
-    return new_db
+    if not ds.get("name", "").lower().startswith("plastic tunnel"):
+        return ds
+    return _filter_exchanges(
+        ds,
+        lambda exc: not exc.get("name", "")
+        .lower()
+        .startswith("transformation, from urban"),
+    )
 
 
-def fix_lentil_ldu(db):
+@dataset_strategy
+def fix_lentil_ldu(ds):
     """Replace 'from unspecified' with 'from annual crop'
     to avoid having negative LDU on the lentils.
     Should be removed for AGB 3.2"""
-    new_db = []
-    for ds in tqdm(db):
-        new_ds = copy.deepcopy(ds)
-        if ds.get("name", "").startswith("Lentil"):
-            for exc in new_ds["exchanges"]:
-                if exc.get("name", "").startswith("Transformation, from unspecified"):
-                    exc["name"] = "Transformation, from annual crop"
-        else:
-            pass
-        new_db.append(new_ds)
-    return new_db
+    if not ds.get("name", "").startswith("Lentil"):
+        return ds
+    return {
+        **ds,
+        "exchanges": [
+            (
+                {**exc, "name": "Transformation, from annual crop"}
+                if exc.get("name", "").startswith("Transformation, from unspecified")
+                else exc
+            )
+            for exc in ds["exchanges"]
+        ],
+    }
 
 
-def remove_some_processes(db):
+@dataset_strategy
+def remove_some_processes(ds):
     """Some processes make the whole import fail
     due to inability to parse the Input and Calculated parameters"""
-    new_db = []
-    for ds in tqdm(db):
-        new_ds = copy.deepcopy(ds)
-        if ds.get("simapro metadata", {}).get("Process identifier") not in (
-            "EI3CQUNI000025017103662",
-        ):
-            new_db.append(new_ds)
-    return new_db
+    if ds.get("simapro metadata", {}).get("Process identifier") in (
+        "EI3CQUNI000025017103662",
+    ):
+        return None
+    return ds
 
 
-def remove_creosote(db):
+@dataset_strategy
+def remove_creosote(ds):
     """Remove creosote flows from flattened system trellis (AGB, WFLDB)"""
-    new_db = []
-    for ds in tqdm(db):
-        new_ds = copy.deepcopy(ds)
-        name = ds["name"].lower()
-        if "treillis" in name or "trellis" in name:
-            new_ds["exchanges"] = [
-                exc
-                for exc in ds["exchanges"]
-                # this is for system trellis
-                if exc.get("name", "")
-                not in ("Pyrene", "Fluoranthene", "Phenanthrene", "Naphtalene")
-                # this is for unit trellis
-                and "creosote" not in exc.get("name", "").lower()
-            ]
-        new_db.append(new_ds)
-    return new_db
+    name = ds["name"].lower()
+    if "treillis" not in name and "trellis" not in name:
+        return ds
+    return _filter_exchanges(
+        ds,
+        lambda exc: (
+            # this is for system trellis
+            exc.get("name", "")
+            not in ("Pyrene", "Fluoranthene", "Phenanthrene", "Naphtalene")
+            # this is for unit trellis
+            and "creosote" not in exc.get("name", "").lower()
+        ),
+    )
 
 
-def remove_acetamiprid(db):
+@dataset_strategy
+def remove_acetamiprid(ds):
     """Remove acetamiprid in FR activities"""
-    new_db = []
-    for ds in tqdm(db):
-        new_ds = copy.deepcopy(ds)
-        if ds.get("location") == "FR":
-            new_ds["exchanges"] = [
-                exc for exc in ds["exchanges"] if exc.get("name", "") != "Acetamiprid"
-            ]
-        new_db.append(new_ds)
-    return new_db
+    if ds.get("location") != "FR":
+        return ds
+    return _filter_exchanges(ds, lambda exc: exc.get("name", "") != "Acetamiprid")
 
 
-def use_unit_processes(db):
+def _unit_process_name(name):
+    name = name.replace(" | Cut-off, S", "")
+    return re.sub(r" \{([A-Za-z]{2,3})\}\| ", r"//[\1] ", name)
+
+
+@dataset_strategy
+def use_unit_processes(ds):
     """the woolmark dataset comes with dependent processes
     which are set as system processes.
     Ecoinvent has these processes but as unit processes.
     So we change the name so that the linking be done"""
-    for ds in tqdm(db):
-        for exc in ds["exchanges"]:
-            if exc["name"].endswith(" | Cut-off, S"):
-                exc["name"] = exc["name"].replace(" | Cut-off, S", "")
-                exc["name"] = re.sub(
-                    r" \{([A-Za-z]{2,3})\}\| ", r"//[\1] ", exc["name"]
-                )
-    return db
+    if not any(exc["name"].endswith(" | Cut-off, S") for exc in ds["exchanges"]):
+        return ds
+    return {
+        **ds,
+        "exchanges": [
+            (
+                {**exc, "name": _unit_process_name(exc["name"])}
+                if exc["name"].endswith(" | Cut-off, S")
+                else exc
+            )
+            for exc in ds["exchanges"]
+        ],
+    }
 
 
-def uraniumFRU(db):
+@dataset_strategy
+def uraniumFRU(method):
     """reduce the FRU of Uranium"""
-    new_db = []
-    for method in tqdm(db):
-        new_method = copy.deepcopy(method)
-        if new_method["name"][1] == "Resource use, fossils":
-            for k, v in new_method.items():
-                if k == "exchanges":
-                    for cf in v:
-                        if cf["name"].startswith("Uranium"):
-                            # lower by 40%
-                            cf["amount"] *= 1 - 0.4
-        new_db.append(new_method)
-    return new_db
+    if method["name"][1] != "Resource use, fossils":
+        return method
+    return {
+        **method,
+        "exchanges": [
+            # lower by 40%
+            {**cf, "amount": cf["amount"] * (1 - 0.4)}
+            if cf["name"].startswith("Uranium")
+            else cf
+            for cf in method["exchanges"]
+        ],
+    }
+
+
+@dataset_strategy
+def noLT(method):
+    """exclude long term impacts"""
+    return {
+        **method,
+        "exchanges": [
+            {**cf, "amount": 0}
+            if any(["long-term" in cat for cat in cf["categories"]])
+            else cf
+            for cf in method["exchanges"]
+        ],
+    }
 
 
-def noLT(db):
-    """exclude long term impacts"""
-    new_db = []
-    for method in tqdm(db):
-        new_method = copy.deepcopy(method)
-        for k, v in new_method.items():
-            if k == "exchanges":
-                for cf in v:
-                    if any(["long-term" in cat for cat in cf["categories"]]):
-                        cf["amount"] = 0
-        new_db.append(new_method)
-    return new_db
+NAME_LOCATION_PRODUCT_PATTERN = re.compile(
+    r"^(?P<product>.+?)(?://\[(?P<cc1>[^\]]+)\]| \{(?P<cc2>[^}]+)\}\|)\s*(?P<activity>.+)$"
+)
 
 
-def extract_name_location_product(db):
+@dataset_strategy
+def extract_name_location_product(ds):
     """extract the product, name and location from
     ecoinvent passing in SimaPro"""
-    pattern = re.compile(
-        r"^(?P<product>.+?)(?://\[(?P<cc1>[^\]]+)\]| \{(?P<cc2>[^}]+)\}\|)\s*(?P<activity>.+)$"
-    )
-    new_db = []
-    for ds in tqdm(db):
-        s = ds["name"].strip()
-        m = pattern.match(s)
-        if not m:
-            breakpoint
-            raise ValueError(f"Unexpected activity name: {s!r}")
-
-        new_ds = copy.deepcopy(ds)
-        # pick whichever group matched
-        loc = m.group("cc1") or m.group("cc2")
-        new_ds["location"] = loc.strip()
-        new_ds["reference product"] = m.group("product").strip()
-        new_db.append(new_ds)
-
-    return new_db
-
-
-def extract_simapro_metadata(db):
-    new_db = []
-    dqr_pattern = r"The overall DQR of this product is: (?P<overall>[\d.]+) {P: (?P<P>[\d.]+), TiR: (?P<TiR>[\d.]+), GR: (?P<GR>[\d.]+), TeR: (?P<TeR>[\d.]+)}"
-    for ds in tqdm(db):
-        new_ds = copy.deepcopy(ds)
-        if "simapro metadata" in ds:
-            for sp_field, value in ds["simapro metadata"].items():
-                if value != "Unspecified":
-                    new_ds[sp_field] = value
-
-            # Getting the Data Quality Rating of the data when relevant
-            if "Comment" in ds["simapro metadata"]:
-                match = re.search(
-                    pattern=dqr_pattern, string=ds["simapro metadata"]["Comment"]
-                )
-
-                if match:
-                    new_ds["DQR"] = {
-                        "overall": float(match["overall"]),
-                        "P": float(match["P"]),
-                        "TiR": float(match["TiR"]),
-                        "GR": float(match["GR"]),
-                        "TeR": float(match["TeR"]),
-                    }
-
-            del new_ds["simapro metadata"]
-        new_db.append(new_ds)
-    return new_db
-
-
-def extract_simapro_location(db):
-    new_db = []
-    location_pattern = r"\{(?P<location>[\w ,\/\-\+]+)\}"
-    location_pattern_2 = r"\/\ *(?P<location>[\w ,\/\-]+) U$"
-    for ds in tqdm(db):
-        new_ds = copy.deepcopy(ds)
-        if ds.get("location") is None:
-            match = re.search(pattern=location_pattern, string=ds["name"])
-            if match is not None:
-                new_ds["location"] = match["location"]
-            else:
-                match = re.search(pattern=location_pattern_2, string=ds["name"])
-                if match is not None:
-                    new_ds["location"] = match["location"]
-                elif ("French production," in ds["name"]) or (
-                    "French production mix," in ds["name"]
-                ):
-                    new_ds["location"] = "FR"
-                elif "CA - adapted for maple syrup" in ds["name"]:
-                    new_ds["location"] = "CA"
-                elif ", IT" in ds["name"]:
-                    new_ds["location"] = "IT"
-                elif ", TR" in ds["name"]:
-                    new_ds["location"] = "TR"
-                elif "/GLO" in ds["name"]:
-                    new_ds["location"] = "GLO"
-        new_db.append(new_ds)
-    return new_db
-
-
-def extract_ciqual(db):
-    new_db = []
-    ciqual_pattern = r"\[Ciqual code: (?P<ciqual>[\d_]+)\]"
-    for ds in tqdm(db):
-        new_ds = copy.deepcopy(ds)
-        # Getting products CIQUAL code when relevant
-        if "ciqual" in ds["name"].lower():
-            match = re.search(pattern=ciqual_pattern, string=ds["name"])
-            new_ds["ciqual_code"] = match["ciqual"] if match is not None else ""
-        new_db.append(new_ds)
-    return new_db
-
-
-def extract_tags(db):
-    new_db = []
-    for ds in tqdm(db):
-        new_ds = copy.deepcopy(ds)
-        # Getting activity tags
-        name_without_spaces = ds["name"].replace(" ", "")
-        for packaging in agribalyse.PACKAGINGS:
-            if f"|{packaging.replace(' ', '')}|" in name_without_spaces:
-                new_ds["packaging"] = packaging
-
-        for stage in agribalyse.STAGES:
-            if f"|{stage.replace(' ', '')}" in name_without_spaces:
-                new_ds["stage"] = stage
-
-        for transport_type in agribalyse.TRANSPORT_TYPES:
-            if f"|{transport_type.replace(' ', '')}|" in name_without_spaces:
-                new_ds["transport_type"] = transport_type
-
-        for preparation_mode in agribalyse.PREPARATION_MODES:
-            if f"|{preparation_mode.replace(' ', '')}|" in name_without_spaces:
-                new_ds["preparation_mode"] = preparation_mode
-
-        if "simapro name" in ds:
-            del new_ds["simapro name"]
-
-        if "filename" in ds:
-            del new_ds["filename"]
-        new_db.append(new_ds)
-    return new_db
+    s = ds["name"].strip()
+    m = NAME_LOCATION_PRODUCT_PATTERN.match(s)
+    if not m:
+        raise ValueError(f"Unexpected activity name: {s!r}")
+
+    # pick whichever group matched
+    loc = m.group("cc1") or m.group("cc2")
+    return {
+        **ds,
+        "location": loc.strip(),
+        "reference product": m.group("product").strip(),
+    }
+
+
+DQR_PATTERN = re.compile(
+    r"The overall DQR of this product is: (?P<overall>[\d.]+) {P: (?P<P>[\d.]+), TiR: (?P<TiR>[\d.]+), GR: (?P<GR>[\d.]+), TeR: (?P<TeR>[\d.]+)}"
+)
+
+
+@dataset_strategy
+def extract_simapro_metadata(ds):
+    if "simapro metadata" not in ds:
+        return ds
+
+    new_ds = dict(ds)
+    for sp_field, value in ds["simapro metadata"].items():
+        if value != "Unspecified":
+            new_ds[sp_field] = value
+
+    # Getting the Data Quality Rating of the data when relevant
+    if "Comment" in ds["simapro metadata"]:
+        match = DQR_PATTERN.search(ds["simapro metadata"]["Comment"])
+
+        if match:
+            new_ds["DQR"] = {
+                "overall": float(match["overall"]),
+                "P": float(match["P"]),
+                "TiR": float(match["TiR"]),
+                "GR": float(match["GR"]),
+                "TeR": float(match["TeR"]),
+            }
+
+    del new_ds["simapro metadata"]
+    return new_ds
+
+
+LOCATION_PATTERN = re.compile(r"\{(?P<location>[\w ,\/\-\+]+)\}")
+LOCATION_PATTERN_2 = re.compile(r"\/\ *(?P<location>[\w ,\/\-]+) U$")
+
+
+def _simapro_location(name):
+    match = LOCATION_PATTERN.search(name)
+    if match is not None:
+        return match["location"]
+    match = LOCATION_PATTERN_2.search(name)
+    if match is not None:
+        return match["location"]
+    elif ("French production," in name) or ("French production mix," in name):
+        return "FR"
+    elif "CA - adapted for maple syrup" in name:
+        return "CA"
+    elif ", IT" in name:
+        return "IT"
+    elif ", TR" in name:
+        return "TR"
+    elif "/GLO" in name:
+        return "GLO"
+    return None
+
+
+@dataset_strategy
+def extract_simapro_location(ds):
+    if ds.get("location") is not None:
+        return ds
+    location = _simapro_location(ds["name"])
+    if location is None:
+        return ds
+    return {**ds, "location": location}
+
+
+CIQUAL_PATTERN = re.compile(r"\[Ciqual code: (?P<ciqual>[\d_]+)\]")
+
+
+@dataset_strategy
+def extract_ciqual(ds):
+    # Getting products CIQUAL code when relevant
+    if "ciqual" not in ds["name"].lower():
+        return ds
+    match = CIQUAL_PATTERN.search(ds["name"])
+    return {**ds, "ciqual_code": match["ciqual"] if match is not None else ""}
+
+
+@dataset_strategy
+def extract_tags(ds):
+    new_ds = dict(ds)
+    # Getting activity tags
+    name_without_spaces = ds["name"].replace(" ", "")
+    for packaging in agribalyse.PACKAGINGS:
+        if f"|{packaging.replace(' ', '')}|" in name_without_spaces:
+            new_ds["packaging"] = packaging
+
+    for stage in agribalyse.STAGES:
+        if f"|{stage.replace(' ', '')}" in name_without_spaces:
+            new_ds["stage"] = stage
+
+    for transport_type in agribalyse.TRANSPORT_TYPES:
+        if f"|{transport_type.replace(' ', '')}|" in name_without_spaces:
+            new_ds["transport_type"] = transport_type
+
+    for preparation_mode in agribalyse.PREPARATION_MODES:
+        if f"|{preparation_mode.replace(' ', '')}|" in name_without_spaces:
+            new_ds["preparation_mode"] = preparation_mode
+
+    new_ds.pop("simapro name", None)
+    new_ds.pop("filename", None)
+    return new_ds
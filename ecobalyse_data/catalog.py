@@ -0,0 +1,135 @@
+import functools
+import hashlib
+from multiprocessing import Pool
+from pathlib import Path
+from typing import List, Optional
+
+import fastjsonschema
+import orjson
+
+from config import PROJECT_ROOT_DIR, settings
+from ecobalyse_data.logging import logger
+
+LCI_SCHEMA_PATH = PROJECT_ROOT_DIR / "schemas" / "lci-schema.json"
+VALIDATION_CACHE_PATH = Path(settings.CACHE_DIR) / "lci-catalog-validation.json"
+
+# `uuid` is not one of the formats fastjsonschema knows about
+SCHEMA_FORMATS = {
+    "uuid": r"^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$",
+}
+
+
+class CatalogValidationError(ValueError):
+    """Raised once for all the lci_catalog files that don't match the schema."""
+
+    def __init__(self, errors: dict[str, str]):
+        self.errors = errors
+        lines = [f"  - {path}: {message}" for path, message in sorted(errors.items())]
+        super().__init__(
+            f"{len(errors)} lci_catalog file(s) don't match {LCI_SCHEMA_PATH.name}:\n"
+            + "\n".join(lines)
+        )
+
+
+def _digest(content: bytes) -> str:
+    return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+
+@functools.cache
+def _schema_digest(schema_path: Path = LCI_SCHEMA_PATH) -> str:
+    return _digest(schema_path.read_bytes())
+
+
+@functools.cache
+def get_validator(schema_path: Path = LCI_SCHEMA_PATH):
+    """Compile the lci schema once per process."""
+    return fastjsonschema.compile(
+        orjson.loads(schema_path.read_bytes()), formats=SCHEMA_FORMATS
+    )
+
+
+def validate_content(content: bytes) -> Optional[str]:
+    """Return the validation error message for a catalog file, or None if it is valid."""
+    try:
+        get_validator()(orjson.loads(content))
+    except orjson.JSONDecodeError as e:
+        return f"invalid JSON ({e})"
+    except fastjsonschema.JsonSchemaValueException as e:
+        return e.message
+    return None
+
+
+def _validate_file(args: tuple[str, bytes]) -> tuple[str, Optional[str]]:
+    path, content = args
+    return (path, validate_content(content))
+
+
+def _load_validation_cache(cache_path: Path) -> set[str]:
+    if not cache_path.is_file():
+        return set()
+    try:
+        cache = orjson.loads(cache_path.read_bytes())
+    except orjson.JSONDecodeError:
+        logger.warning(f"-> Ignoring corrupted validation cache {cache_path}")
+        return set()
+    if cache.get("schema") != _schema_digest():
+        return set()
+    return set(cache.get("valid", []))
+
+
+def _write_validation_cache(cache_path: Path, digests: set[str]):
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    cache_path.write_bytes(
+        orjson.dumps({"schema": _schema_digest(), "valid": sorted(digests)})
+    )
+
+
+def load_catalog(
+    catalog_dirs: List[Path],
+    cpu_count: int = 1,
+    cache_path: Optional[Path] = VALIDATION_CACHE_PATH,
+) -> List[dict]:
+    """Load and validate every `*/*.json` activity of the given lci_catalog directories.
+
+    Files are validated against `schemas/lci-schema.json`. The digest of each valid
+    file is kept in `cache_path` so that only new or modified files are validated
+    on the next run (pass `cache_path=None` to validate everything). Invalid files
+    are all reported at once through a `CatalogValidationError`.
+    """
+    contents = {}
+    for catalog_dir in catalog_dirs:
+        logger.debug(f"-> Loading lci_catalog {catalog_dir}")
+        for lci_path in sorted(Path(catalog_dir).glob("*/*.json")):
+            if lci_path.is_file():
+                contents[str(lci_path)] = lci_path.read_bytes()
+
+    digests = {path: _digest(content) for path, content in contents.items()}
+    validated = _load_validation_cache(cache_path) if cache_path else set()
+    to_validate = [
+        (path, content)
+        for path, content in contents.items()
+        if digests[path] not in validated
+    ]
+
+    if to_validate:
+        logger.debug(
+            f"-> Validating {len(to_validate)}/{len(contents)} lci_catalog files"
+        )
+        if cpu_count > 1 and len(to_validate) > 1:
+            with Pool(cpu_count) as pool:
+                results = pool.map(
+                    _validate_file,
+                    to_validate,
+                    chunksize=max(len(to_validate) // (cpu_count * 4), 1),
+                )
+        else:
+            results = [_validate_file(args) for args in to_validate]
+
+        errors = {path: message for path, message in results if message is not None}
+        if errors:
+            raise CatalogValidationError(errors)
+
+        if cache_path:
+            _write_validation_cache(cache_path, validated | set(digests.values()))
+
+    return [orjson.loads(content) for content in contents.values()]
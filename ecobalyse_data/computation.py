@@ -19,9 +19,10 @@ from common import (
     with_subimpacts,
 )
 from config import settings
+from ecobalyse_data.bw.overlay import MatrixOverlay, OverlayActivity
 from ecobalyse_data.bw.search import cached_search_one
 from ecobalyse_data.logging import logger
-from models.process import ComputedBy, Impacts, Process
+from models.process import ActivityRef, ComputedBy, Impacts, Process
 
 # Init BW project
 projects.set_current(settings.bw.project)
@@ -182,9 +183,15 @@ def compute_brightway_impacts_batch(
         chunk_amts = demand_amounts[i : i + chunk_size]
         # Use the bw_activity id as the demand key (string).
         demands = {str(a.id): {a.id: amt} for a, amt in zip(chunk_acts, chunk_amts)}
-        data_objs = get_multilca_data_objs(
-            functional_units=demands, method_config=method_config
+        overlay = next(
+            (a.overlay for a in chunk_acts if isinstance(a, OverlayActivity)), None
         )
+        if overlay is not None:
+            data_objs = overlay.get_multilca_data_objs(demands, method_config)
+        else:
+            data_objs = get_multilca_data_objs(
+                functional_units=demands, method_config=method_config
+            )
         mlca = bw2calc.MultiLCA(
             demands=demands, method_config=method_config, data_objs=data_objs
         )
@@ -207,7 +214,12 @@ def compute_processes_for_activities(
     impacts_json,
     factors,
     simapro=False,
+    overlay: Optional[MatrixOverlay] = None,
 ) -> List[Process]:
+    """Compute the processes of the catalog `activities`.
+
+    With an `overlay`, the activities of its database are found and computed in the
+    overlay instead of the brightway database."""
     # Check for duplicate activities before processing
     check_duplicate_activities(activities)
 
@@ -229,11 +241,17 @@ def compute_processes_for_activities(
         if not eco_activity.get(
             "impacts"
         ):  # Only need to search if impacts aren't hardcoded
-            bw_activity = cached_search_one(
-                eco_activity["source"],
-                eco_activity["activityName"],
-                location=eco_activity.get("location"),
-            )
+            if overlay is not None and eco_activity["source"] == overlay.dbname:
+                bw_activity = overlay.search_one(
+                    eco_activity["activityName"],
+                    location=eco_activity.get("location"),
+                )
+            else:
+                bw_activity = cached_search_one(
+                    eco_activity["source"],
+                    eco_activity["activityName"],
+                    location=eco_activity.get("location"),
+                )
 
         computation_parameters.append(
             # Parameters of the `get_process_with_impacts` function
@@ -375,7 +393,10 @@ def compute_brightway_impacts(activity, method, impacts_py, demand_amount=None):
         demand_amount = (activity["production amount"] > 0) - (
             activity["production amount"] < 0
         )
-    lca = bw2calc.LCA({activity: demand_amount})
+    if isinstance(activity, OverlayActivity):
+        lca = activity.overlay.lca({activity.id: demand_amount})
+    else:
+        lca = bw2calc.LCA({activity: demand_amount})
     lca.lci()
     for key, method in impacts_py.items():
         lca.switch_method(method)
@@ -452,13 +473,33 @@ def get_mass_per_unit(eco_activity: dict, bw_activity) -> Optional[float]:
     return None
 
 
+def activity_ref(bw_activity, unit: Optional[str] = None) -> Optional[ActivityRef]:
+    """What a process keeps of its Brightway activity, None for the hardcoded ones"""
+    if not bw_activity:
+        return None
+    return ActivityRef(
+        database=bw_activity.get("database"),
+        code=bw_activity.get("code"),
+        name=bw_activity.get("name"),
+        location=bw_activity.get("location"),
+        unit=unit,
+    )
+
+
+def resolve_activity(ref: ActivityRef, overlay: Optional[MatrixOverlay] = None):
+    """The Brightway activity of a process, looked up again from its reference"""
+    if overlay is not None and ref.database == overlay.dbname:
+        return overlay.search_one(ref.name, location=ref.location, code=ref.code)
+    return bw2data.get_activity(ref.key)
+
+
 def activity_to_process_with_impacts(
-    eco_activity, impacts, computed_by: ComputedBy | None, bw_activity={}
+    eco_activity, impacts, computed_by: ComputedBy | None, bw_activity=None
 ) -> Process:
+    # The activity can be a proxy shared through `cached_search_one`, don't mutate it
+    bw_activity = bw_activity or {}
     unit = fix_unit(bw_activity.get("unit"))
 
-    bw_activity["unit"] = unit
-
     # Some hardcoded activities (when source = Custom) don't have a bw_activity, in that case take the ecobalyse displayName
 
     # Get comment with consistent fallback logic:
@@ -471,7 +512,9 @@ def activity_to_process_with_impacts(
         activity_name=bw_activity.get(
             "name", "This process is not linked to a Brightway activity"
         ),
-        bw_activity=bw_activity,
+        # Only keep a reference to the activity, the proxy is dropped with the
+        # computation parameters
+        bw_activity=activity_ref(bw_activity, unit),
         categories=eco_activity.get("categories", bw_activity.get("categories", [])),
         comment=comment,
         computed_by=computed_by,
@@ -485,6 +528,6 @@ def activity_to_process_with_impacts(
         mass_per_unit=get_mass_per_unit(eco_activity, bw_activity),
         scopes=eco_activity.get("scopes", []),
         source=eco_activity.get("source"),
-        unit=eco_activity.get("unit", bw_activity.get("unit")),
+        unit=eco_activity.get("unit", unit),
         waste=eco_activity.get("waste", bw_activity.get("waste", 0)),
     )
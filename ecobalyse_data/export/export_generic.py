@@ -6,7 +6,11 @@ from typing import List, Optional
 import bw2data
 import orjson
 
-from common import activities_processes_sort_key, remove_detailed_impacts
+from common import (
+    activities_processes_sort_key,
+    format_numbers,
+    remove_detailed_impacts,
+)
 from common.export import export_json
 from ecobalyse_data.bw.search import cached_search_one
 from ecobalyse_data.export.land_occupation import compute_land_occupation
@@ -17,6 +21,7 @@ from models.process import (
     IngredientMetadata,
     ProcessGeneric,
     Scope,
+    serialize_all,
 )
 
 
@@ -26,6 +31,21 @@ def _init_worker(project_name: str, base_dir: str):
     bw2data.projects.set_current(project_name)
 
 
+def ingredient_metadata_record(food_variant: dict, activity: dict) -> dict:
+    """The fields of the `IngredientMetadata` of a food variant"""
+    return dict(
+        crop_group=food_variant.get("cropGroup"),
+        default_origin=food_variant["defaultOrigin"],
+        density=food_variant["ingredientDensity"],
+        inedible_part=food_variant["inediblePart"],
+        raw_to_cooked_ratio=food_variant["rawToCookedRatio"],
+        scenario=food_variant.get("scenario"),
+        transport_cooling=food_variant["transportCooling"],
+        visible=food_variant["visible"],
+        process_id=activity["id"],
+    )
+
+
 def _build_variant_metadata(
     variant: dict,
     activity: dict,
@@ -52,17 +72,8 @@ def _build_variant_metadata(
         )
 
     if food_variant is not None:
-        metadata["ingredient"] = IngredientMetadata(
-            crop_group=food_variant.get("cropGroup"),
-            default_origin=food_variant["defaultOrigin"],
-            density=food_variant["ingredientDensity"],
-            inedible_part=food_variant["inediblePart"],
-            raw_to_cooked_ratio=food_variant["rawToCookedRatio"],
-            scenario=food_variant.get("scenario"),
-            transport_cooling=food_variant["transportCooling"],
-            visible=food_variant["visible"],
-            process_id=activity["id"],
-        ).model_dump(by_alias=True)
+        # Validated by the caller, with the ones of the other variants
+        metadata["ingredient"] = ingredient_metadata_record(food_variant, activity)
 
         ecs = ecs_by_alias.get(food_variant["alias"])
         if ecs:
@@ -80,6 +91,34 @@ def _build_variant_metadata(
     return metadata or None
 
 
+def process_generic_record(
+    process: dict, activity: dict, variant: dict, land_occupation: Optional[float]
+) -> dict:
+    """The fields of the `ProcessGeneric` of a variant of an activity, see
+    `serialize_all`"""
+    return dict(
+        activity_name=process["activityName"],
+        alias=variant.get("alias"),
+        categories=process["categories"],
+        comment=process.get("comment", ""),
+        display_name=variant.get("displayName", activity.get("displayName", "")),
+        elec_mj=process.get("elecMJ", 0),
+        heat_mj=process.get("heatMJ", 0),
+        id=variant["id"],
+        impacts=process["impacts"],
+        land_occupation=land_occupation,
+        location=process.get("location"),
+        mass_per_unit=process.get("massPerUnit"),
+        metadata=None,
+        scopes=[
+            Scope(s) for s in variant.get("scopes", []) if Scope(s) in GENERIC_SCOPES
+        ],
+        source=process["source"],
+        unit=process.get("unit"),
+        waste=process.get("waste", 0),
+    )
+
+
 def compute_processes_generic(
     activities: List[dict],
     processes_impacts_path: str,
@@ -87,22 +126,28 @@ def compute_processes_generic(
     ecosystemic_factors_path: Optional[str] = None,
     feed_file_path: Optional[str] = None,
     raw_to_transformed_file_path: Optional[str] = None,
+    processes: Optional[List[dict]] = None,
 ) -> List[dict]:
     """Compute ProcessGeneric dicts with metadata enrichment.
 
     Merges process impacts with forest complement metadata and, for food
     ingredients, ingredient-specific metadata + ecosystemic service complements.
 
-    Reads from processes_impacts_full.json (unfiltered) generated by `export.processes()`.
+    Reads from processes_impacts_full.json (unfiltered) generated by `export.processes()`,
+    unless these `processes` are given, as returned by `activities_to_processes`.
     """
-    if not os.path.exists(processes_impacts_path):
-        raise FileNotFoundError(
-            f"{processes_impacts_path} not found. "
-            "Run 'just export-all' first to generate it."
-        )
+    if processes is not None:
+        # Formatted like the processes read back from the json file
+        processes_list = format_numbers(processes)
+    else:
+        if not os.path.exists(processes_impacts_path):
+            raise FileNotFoundError(
+                f"{processes_impacts_path} not found. "
+                "Run 'just export-all' first to generate it."
+            )
 
-    with open(processes_impacts_path, "rb") as f:
-        processes_list = orjson.loads(f.read())
+        with open(processes_impacts_path, "rb") as f:
+            processes_list = orjson.loads(f.read())
     processes_by_id = {p["id"]: p for p in processes_list}
 
     food_activities = [a for a in activities if get_metadata_for_scope(a, "food")]
@@ -158,7 +203,8 @@ def compute_processes_generic(
         land_by_id = {a["id"]: a for a in activities_needing_land}
         activities = [land_by_id.get(a["id"], a) for a in activities]
 
-    generic_dicts = []
+    records = []
+    metadata = []
     for activity in activities:
         process = processes_by_id.get(activity["id"])
         if not process:
@@ -187,34 +233,21 @@ def compute_processes_generic(
                 else activity.get("landOccupation")
             )
 
-            entry = ProcessGeneric(
-                activity_name=process["activityName"],
-                alias=variant.get("alias"),
-                categories=process["categories"],
-                comment=process.get("comment", ""),
-                display_name=variant.get(
-                    "displayName", activity.get("displayName", "")
-                ),
-                elec_mj=process.get("elecMJ", 0),
-                heat_mj=process.get("heatMJ", 0),
-                id=variant["id"],
-                impacts=process["impacts"],
-                land_occupation=land_occupation,
-                location=process.get("location"),
-                mass_per_unit=process.get("massPerUnit"),
-                metadata=None,
-                scopes=[
-                    Scope(s)
-                    for s in variant.get("scopes", [])
-                    if Scope(s) in GENERIC_SCOPES
-                ],
-                source=process["source"],
-                unit=process.get("unit"),
-                waste=process.get("waste", 0),
+            records.append(
+                process_generic_record(process, activity, variant, land_occupation)
             )
-            entry_dict = entry.model_dump(by_alias=True)
-            entry_dict["metadata"] = metadata_out
-            generic_dicts.append(entry_dict)
+            metadata.append(metadata_out)
+
+    ingredients = [m for m in metadata if m is not None and "ingredient" in m]
+    for metadata_out, ingredient in zip(
+        ingredients,
+        serialize_all(IngredientMetadata, [m["ingredient"] for m in ingredients]),
+    ):
+        metadata_out["ingredient"] = ingredient
+
+    generic_dicts = serialize_all(ProcessGeneric, records)
+    for entry_dict, metadata_out in zip(generic_dicts, metadata):
+        entry_dict["metadata"] = metadata_out
 
     generic_dicts.sort(key=activities_processes_sort_key)
 
@@ -230,6 +263,7 @@ def activities_to_processes_generic_json(
     ecosystemic_factors_path: Optional[str] = None,
     feed_file_path: Optional[str] = None,
     raw_to_transformed_file_path: Optional[str] = None,
+    processes: Optional[List[dict]] = None,
 ) -> List[dict]:
     """Export object processes to ProcessGeneric json files."""
     generic_dicts = compute_processes_generic(
@@ -239,6 +273,7 @@ def activities_to_processes_generic_json(
         ecosystemic_factors_path=ecosystemic_factors_path,
         feed_file_path=feed_file_path,
         raw_to_transformed_file_path=raw_to_transformed_file_path,
+        processes=processes,
     )
 
     for path in impacts_output_paths:
@@ -286,6 +321,9 @@ def add_land_occupation(activity: dict) -> dict:
 
 def add_land_occupations(activities: List[dict], cpu_count: int) -> List[dict]:
     """Add land occupation to all activities using multiprocessing."""
+    if all("landOccupation" in activity for activity in activities):
+        return activities
+
     project_name = bw2data.projects.current
     base_dir = str(bw2data.projects._base_data_dir)
 
@@ -1,21 +1,26 @@
 import csv
 import json
 from enum import StrEnum
+from graphlib import CycleError, TopologicalSorter
 from multiprocessing import Pool
 from typing import List, Optional
 
 import matplotlib.pyplot as plt
+import numpy as np
+import orjson
+from scipy.sparse import csr_matrix
 
 import config
 from common.export import (
     export_json,
 )
 from config import settings
+from ecobalyse_data.bw.checkpoint import fingerprint
 from ecobalyse_data.bw.search import cached_search_one
 from ecobalyse_data.export.land_occupation import compute_land_occupation
 from ecobalyse_data.export.utils import get_metadata_for_scope
 from ecobalyse_data.logging import logger
-from models.process import EcosystemicServices, Ingredient
+from models.process import Ingredient, serialize_all
 
 
 class Scenario(StrEnum):
@@ -49,6 +54,13 @@ TRANSFORM = {
 }
 
 
+# The metadata of the ingredients that their ecosystemic services depend on
+ES_METADATA_FIELDS = ["alias", "landOccupation", "cropGroup", "scenario"]
+
+# Ecosystemic services by fingerprint of the inputs of `compute_es_for_ingredients`
+_ES_CACHE: dict[str, dict[str, dict]] = {}
+
+
 def es_transform(eco_service, value):
     if value is None:
         raise ValueError(f"No input value defined for complement {eco_service}")
@@ -123,126 +135,236 @@ def build_transformed_to_raw(raw_to_transformed):
     return transformed_to_raw
 
 
+def _is_vegetal(food_metadata) -> bool:
+    return all(
+        food_metadata.get(key) for key in ["landOccupation", "cropGroup", "scenario"]
+    )
+
+
+def compile_ecosystemic_factors(ecosystemic_factors) -> tuple:
+    """The factors as a `(crop groups, services, scenarios)` array, with NaN for the
+    missing ones, and the index of each crop group and scenario in it"""
+    groups = {group: index for index, group in enumerate(ecosystemic_factors)}
+    scenarios = {scenario: index for index, scenario in enumerate(Scenario)}
+    factors = np.full(
+        (len(groups), len(config.ecosystemic_services_list), len(scenarios)), np.nan
+    )
+    for group, group_index in groups.items():
+        for es_index, eco_service in enumerate(config.ecosystemic_services_list):
+            for scenario, value in ecosystemic_factors[group][eco_service].items():
+                if value is not None:
+                    factors[group_index, es_index, scenarios[scenario]] = value
+    return factors, groups, scenarios
+
+
+def compute_vegetal_ecosystemic_services(
+    vegetal_metadata: List[dict], ecosystemic_factors
+) -> np.ndarray:
+    """The services of the vegetal ingredients, as an (ingredients × services)
+    array of rounded values"""
+    factors, groups, scenarios = compile_ecosystemic_factors(ecosystemic_factors)
+    raw = factors[
+        [groups[food_metadata["cropGroup"]] for food_metadata in vegetal_metadata],
+        :,
+        [scenarios[food_metadata["scenario"]] for food_metadata in vegetal_metadata],
+    ].reshape(len(vegetal_metadata), len(config.ecosystemic_services_list))
+
+    # don't multiply by landOccupation for grazed grass as unit is already in m2.year
+    land_occupation = np.array(
+        [
+            1.0
+            if food_metadata["alias"]
+            in (
+                settings.scopes.food.grazed_grass_permanent_key,
+                settings.scopes.food.grazed_grass_temporary_key,
+            )
+            else food_metadata["landOccupation"]
+            for food_metadata in vegetal_metadata
+        ],
+        dtype=float,
+    )
+
+    services = np.empty_like(raw)
+    for es_index, eco_service in enumerate(config.ecosystemic_services_list):
+        values = raw[:, es_index]
+        if np.isnan(values).any():
+            raise ValueError(f"No input value defined for complement {eco_service}")
+        if (values < 0).any():
+            raise ValueError(
+                f"complement {eco_service} input value can't be lower than 0"
+            )
+        threshold, func_below, func_above = TRANSFORM[eco_service]
+        # The constant branches return ints, kept as such so that the signs of the
+        # zeros are the same as with `es_transform`
+        services[:, es_index] = np.where(
+            values < threshold,
+            -1 * func_below(values) * land_occupation,
+            -1 * func_above(values) * land_occupation,
+        )
+    return _round(services)
+
+
+def _round(values: np.ndarray) -> np.ndarray:
+    return np.array(
+        [[number_format_ecosystemic_service(value) for value in row] for row in values],
+        dtype=float,
+    ).reshape(values.shape)
+
+
 def compute_es_for_ingredients(
     activities: List[dict],
     ecosystemic_factors,
     feed_file_content,
     raw_to_transformed,
 ) -> dict[str, dict]:
-    es_for_ingredients = {}
+    """The ecosystemic services of the food ingredients, by alias.
+
+    The results are cached by the fingerprint of the inputs, as both the food and
+    the generic exports compute them for the same activities."""
+    metadata = [
+        food_metadata
+        for activity in activities
+        for food_metadata in get_metadata_for_scope(activity, "food")
+    ]
+    key = fingerprint(
+        orjson.dumps(
+            [
+                [
+                    [food_metadata.get(field) for field in ES_METADATA_FIELDS]
+                    for food_metadata in metadata
+                ],
+                ecosystemic_factors,
+                feed_file_content,
+                raw_to_transformed,
+            ],
+            option=orjson.OPT_SORT_KEYS,
+        )
+    )
+    if key not in _ES_CACHE:
+        _ES_CACHE[key] = _compute_es_for_ingredients(
+            activities, ecosystemic_factors, feed_file_content, raw_to_transformed
+        )
+    return {alias: dict(services) for alias, services in _ES_CACHE[key].items()}
+
+
+def _compute_es_for_ingredients(
+    activities: List[dict],
+    ecosystemic_factors,
+    feed_file_content,
+    raw_to_transformed,
+) -> dict[str, dict]:
     transformed_to_raw = build_transformed_to_raw(raw_to_transformed)
 
     metadata_by_alias = {}
     for activity in activities:
         for food_metadata in get_metadata_for_scope(activity, "food"):
-            metadata_by_alias[food_metadata["alias"]] = food_metadata
+            metadata_by_alias.setdefault(food_metadata["alias"], food_metadata)
 
+    feeds = {}
     for activity in activities:
         for food_metadata in get_metadata_for_scope(activity, "food"):
             alias = food_metadata["alias"]
-            if alias in es_for_ingredients:
-                # The ES for this ingredient was already computed (a dependency of an animal activity)
-                # skip it
+            if alias in feeds or _is_vegetal(food_metadata):
                 continue
-            # If it’s a vegetal ingredient
-            if all(
-                food_metadata.get(key)
-                for key in ["landOccupation", "cropGroup", "scenario"]
-            ):
-                services = compute_vegetal_ecosystemic_services(
-                    food_metadata, ecosystemic_factors
+            feed_quantities = resolve_feed(alias, feed_file_content, transformed_to_raw)
+            if feed_quantities is None:
+                displayName = activity["displayName"]
+                logger.warning(
+                    f"{alias} - {displayName} doesn’t have any food complements associated"
                 )
-                es_for_ingredients[alias] = services
+                continue
+            feeds[alias] = feed_quantities
 
-            # If it’s an animal ingredient
-            else:
-                feed_quantities = resolve_feed(
-                    alias, feed_file_content, transformed_to_raw
+    # The vegetal ingredients, and the feeds that are not animals themselves
+    vegetals = [
+        alias
+        for alias, food_metadata in metadata_by_alias.items()
+        if alias not in feeds and _is_vegetal(food_metadata)
+    ]
+    for feed_quantities in feeds.values():
+        for feed_alias in feed_quantities:
+            if feed_alias not in metadata_by_alias:
+                raise ValueError(
+                    f"-> animal feed: {feed_alias} not in activities list, can’t compute ES"
                 )
-                if feed_quantities is None:
-                    displayName = activity["displayName"]
-                    logger.warning(
-                        f"{alias} - {displayName} doesn’t have any food complements associated"
+            if feed_alias not in feeds and feed_alias not in vegetals:
+                vegetals.append(feed_alias)
+
+    # One row per ingredient: the vegetals first, then the animals by levels of
+    # feed dependencies, so that the feeds of an animal are computed before it
+    levels = _animal_levels(feeds)
+    animals = [alias for level in levels for alias in level]
+    rows = {alias: index for index, alias in enumerate(vegetals + animals)}
+
+    services = np.zeros((len(rows), len(config.ecosystemic_services_list)))
+    if vegetals:
+        services[: len(vegetals)] = compute_vegetal_ecosystemic_services(
+            [metadata_by_alias[alias] for alias in vegetals], ecosystemic_factors
+        )
+
+    # The (animals × ingredients) feed quantities, in the order of the feeds of each
+    # animal so that the sums are done in the same order as a loop over them
+    indptr, indices, data = [0], [], []
+    for alias in animals:
+        for feed_alias, quantity in feeds[alias].items():
+            indices.append(rows[feed_alias])
+            data.append(quantity)
+        indptr.append(len(indices))
+    quantities = csr_matrix(
+        (np.array(data, dtype=float), indices, indptr),
+        shape=(len(animals), len(rows)),
+    )
+
+    start = len(vegetals)
+    for level in levels:
+        end = start + len(level)
+        services[start:end] = _round(
+            quantities[start - len(vegetals) : end - len(vegetals)] @ services
+        )
+        start = end
+
+    es_for_ingredients = {}
+    for alias, index in rows.items():
+        es_for_ingredients[alias] = dict(
+            zip(config.ecosystemic_services_list, services[index].tolist())
+        )
+        if alias in feeds:
+            es_for_ingredients[alias]["permanentPasture"] = (
+                number_format_ecosystemic_service(
+                    -1
+                    * feeds[alias].get(
+                        settings.scopes.food.grazed_grass_permanent_key, 0
                     )
-                    continue
-
-                # First, compute any missing feed activities
-                for feed_activity_alias in feed_quantities.keys():
-                    if feed_activity_alias not in es_for_ingredients:
-                        if feed_activity_alias not in metadata_by_alias:
-                            raise ValueError(
-                                f"-> animal feed: {feed_activity_alias} not in activities list, can’t compute ES"
-                            )
-                        feed_services = compute_vegetal_ecosystemic_services(
-                            metadata_by_alias[feed_activity_alias],
-                            ecosystemic_factors,
-                        )
-                        es_for_ingredients[feed_activity_alias] = feed_services
-
-                # Now compute animal services with all dependencies available
-                services = compute_animal_ecosystemic_services(
-                    food_metadata,
-                    es_for_ingredients,
-                    ecosystemic_factors,
-                    feed_quantities,
                 )
-                es_for_ingredients[alias] = services
-
+            )
     return es_for_ingredients
 
 
-def compute_vegetal_ecosystemic_services(food_metadata, ecosystemic_factors) -> dict:
-    services = {}
-    for eco_service in config.ecosystemic_services_list:
-        factor_raw = ecosystemic_factors[food_metadata["cropGroup"]][eco_service][
-            food_metadata["scenario"]
-        ]
-        factor_transformed = es_transform(eco_service, factor_raw)
-        if food_metadata["alias"] in (
-            settings.scopes.food.grazed_grass_permanent_key,
-            settings.scopes.food.grazed_grass_temporary_key,
-        ):
-            # don't multiply by landOccupation for grazed grass as unit is already in m2.year
-            factor_final = -1 * factor_transformed
-        else:
-            factor_final = -1 * factor_transformed * food_metadata["landOccupation"]
-        services[eco_service] = number_format_ecosystemic_service(factor_final)
-
-    return services
+def _animal_levels(feeds: dict) -> List[List[str]]:
+    """The animals in topological order of their feeds, grouped in levels that only
+    depend on the previous ones"""
+    sorter = TopologicalSorter(
+        {
+            alias: [feed_alias for feed_alias in feed_quantities if feed_alias in feeds]
+            for alias, feed_quantities in feeds.items()
+        }
+    )
+    try:
+        sorter.prepare()
+    except CycleError as e:
+        raise ValueError(f"-> animal feeds form a cycle: {e.args[1]}") from e
+    levels = []
+    while sorter.is_active():
+        level = list(sorter.get_ready())
+        levels.append(level)
+        sorter.done(*level)
+    return levels
 
 
 def number_format_ecosystemic_service(value):
     return float("{:.3g}".format(value))
 
 
-def compute_animal_ecosystemic_services(
-    food_metadata,
-    es_for_activities,
-    ecosystemic_factors,
-    feed_quantities,
-) -> dict:
-    services = {}
-
-    hedges = 0
-    plotSize = 0
-    cropDiversity = 0
-
-    for feed_activity_alias, quantity in feed_quantities.items():
-        feed_services = es_for_activities[feed_activity_alias]
-        hedges += quantity * feed_services["hedges"]
-        plotSize += quantity * feed_services["plotSize"]
-        cropDiversity += quantity * feed_services["cropDiversity"]
-
-    services["hedges"] = number_format_ecosystemic_service(hedges)
-    services["plotSize"] = number_format_ecosystemic_service(plotSize)
-    services["cropDiversity"] = number_format_ecosystemic_service(cropDiversity)
-
-    services["permanentPasture"] = number_format_ecosystemic_service(
-        -1 * feed_quantities.get(settings.scopes.food.grazed_grass_permanent_key, 0)
-    )
-    return services
-
-
 def activities_to_ingredients_json(
     activities: List[dict],
     ingredients_paths: List[str],
@@ -261,17 +383,16 @@ def activities_to_ingredients_json(
 
     activities_with_land_occupation = add_land_occupations(activities, cpu_count)
 
-    ingredients = activities_to_ingredients(
-        activities_with_land_occupation,
-        ecosystemic_factors,
-        feed_file_content,
-        raw_to_transformed,
+    ingredients_dicts = serialize_all(
+        Ingredient,
+        activities_to_ingredient_records(
+            activities_with_land_occupation,
+            ecosystemic_factors,
+            feed_file_content,
+            raw_to_transformed,
+        ),
     )
 
-    ingredients_dicts = [
-        ingredient.model_dump(by_alias=True) for ingredient in ingredients
-    ]
-
     ingredients_dicts.sort(key=lambda x: x["id"])
 
     exported_files = []
@@ -332,16 +453,24 @@ def add_land_occupation(activity: dict) -> dict:
 
 
 def add_land_occupations(activities: List[dict], cpu_count) -> List[dict]:
+    if all(
+        "landOccupation" in food_metadata
+        for activity in activities
+        for food_metadata in get_metadata_for_scope(activity, "food")
+    ):
+        # Already added, by a previous stage of the export
+        return activities
+
     with Pool(cpu_count) as pool:
         return pool.map(add_land_occupation, activities)
 
 
-def activities_to_ingredients(
+def activities_to_ingredient_records(
     activities: List[dict],
     ecosystemic_factors,
     feed_file_content,
     raw_to_transformed,
-) -> List[Ingredient]:
+) -> List[dict]:
     es_by_alias = compute_es_for_ingredients(
         activities,
         ecosystemic_factors,
@@ -349,21 +478,27 @@ def activities_to_ingredients(
         raw_to_transformed,
     )
 
-    ingredients = []
+    records = []
     for activity in activities:
-        ingredients.extend(activity_to_ingredients(activity, es_by_alias))
-
-    return ingredients
+        records.extend(activity_to_ingredient_records(activity, es_by_alias))
 
+    return records
 
-def activity_to_ingredients(eco_activity: dict, es_by_alias: dict) -> List[Ingredient]:
-    ingredients = []
 
+def activity_to_ingredient_records(eco_activity: dict, es_by_alias: dict) -> List[dict]:
+    """The fields of the `Ingredient`s of an activity, see `serialize_all`"""
     bw_activity = cached_search_one(
         eco_activity.get("source"),
         eco_activity.get("activityName"),
         location=eco_activity.get("location"),
     )
+    return ingredient_records(eco_activity, es_by_alias, bw_activity.get("location"))
+
+
+def ingredient_records(
+    eco_activity: dict, es_by_alias: dict, location: Optional[str]
+) -> List[dict]:
+    records = []
 
     for food_metadata in get_metadata_for_scope(eco_activity, "food"):
         land_occupation = food_metadata.get("landOccupation")
@@ -378,15 +513,15 @@ def activity_to_ingredients(eco_activity: dict, es_by_alias: dict) -> List[Ingre
                 value = es.get(key)
                 return -value if value is not None else None
 
-            ecosystemic_services = EcosystemicServices(
+            ecosystemic_services = dict(
                 crop_diversity=_neg("cropDiversity"),
                 hedges=_neg("hedges"),
                 permanent_pasture=_neg("permanentPasture"),
                 plot_size=_neg("plotSize"),
             )
 
-        ingredients.append(
-            Ingredient(
+        records.append(
+            dict(
                 alias=food_metadata["alias"],
                 categories=food_metadata.get("ingredientCategories", []),
                 crop_group=food_metadata.get("cropGroup"),
@@ -396,7 +531,7 @@ def activity_to_ingredients(eco_activity: dict, es_by_alias: dict) -> List[Ingre
                 id=food_metadata["id"],
                 inedible_part=food_metadata["inediblePart"],
                 land_occupation=land_occupation,
-                location=bw_activity.get("location"),
+                location=location,
                 name=food_metadata["displayName"],
                 raw_to_cooked_ratio=food_metadata["rawToCookedRatio"],
                 scenario=food_metadata.get("scenario"),
@@ -406,7 +541,7 @@ def activity_to_ingredients(eco_activity: dict, es_by_alias: dict) -> List[Ingre
                 process_id=eco_activity["id"],
             )
         )
-    return ingredients
+    return records
 
 
 def plot_es_transformations(save_path=None):
@@ -1,5 +1,5 @@
 import os
-from typing import List
+from typing import List, Optional
 
 from common import (
     get_normalization_weighting_factors,
@@ -12,9 +12,14 @@ from common.export import (
 )
 from common.impacts import impacts as impacts_py
 from common.impacts import main_method
-from ecobalyse_data.computation import compute_impacts, compute_processes_for_activities
+from ecobalyse_data.bw.overlay import MatrixOverlay
+from ecobalyse_data.computation import (
+    compute_impacts,
+    compute_processes_for_activities,
+    resolve_activity,
+)
 from ecobalyse_data.logging import logger
-from models.process import ComputedBy, Process, Scope
+from models.process import ComputedBy, Process, Scope, dump_all
 
 
 def activities_to_processes(
@@ -28,7 +33,10 @@ def activities_to_processes(
     simapro: bool = False,
     merge: bool = False,
     scopes: list[Scope] = None,
-):
+    overlay: Optional[MatrixOverlay] = None,
+) -> List[dict]:
+    """Compute and export the processes of `activities`, and return them as
+    exported, before the generic processes are filtered out"""
     factors = get_normalization_weighting_factors(IMPACTS_JSON)
 
     processes: List[Process] = compute_processes_for_activities(
@@ -38,6 +46,7 @@ def activities_to_processes(
         IMPACTS_JSON,
         factors,
         simapro=simapro,
+        overlay=overlay,
     )
 
     index = 1
@@ -63,7 +72,7 @@ def activities_to_processes(
                 impacts_simapro = process.impacts.model_dump(exclude={"ecs"})
 
                 (computed_by, impacts_bw) = compute_impacts(
-                    process.bw_activity,
+                    resolve_activity(process.bw_activity, overlay),
                     main_method,
                     impacts_py,
                     IMPACTS_JSON,
@@ -75,7 +84,7 @@ def activities_to_processes(
                 impacts_bw = process.impacts.model_dump(exclude={"ecs"})
 
                 (computed_by, impacts_simapro) = compute_impacts(
-                    process.bw_activity,
+                    resolve_activity(process.bw_activity, overlay),
                     main_method,
                     impacts_py,
                     IMPACTS_JSON,
@@ -98,10 +107,9 @@ def activities_to_processes(
             )
 
     # Convert objects to dicts
-    dumped_processes = [
-        process.model_dump(by_alias=True, exclude={"bw_activity", "computed_by"})
-        for process in processes
-    ]
+    dumped_processes = dump_all(
+        Process, processes, exclude={"bw_activity", "computed_by"}
+    )
 
     if display_changes:
         display_changes_from_json(
@@ -121,3 +129,5 @@ def activities_to_processes(
     )
 
     logger.info("Export completed successfully.")
+
+    return dumped_processes
@@ -3,15 +3,15 @@ from typing import List
 from common.export import export_json
 from ecobalyse_data.export.utils import get_metadata_for_scope
 from ecobalyse_data.logging import logger
-from models.process import Cff, Material
+from models.process import Material, serialize_all
 
 
 def activities_to_materials_json(
     activities: List[dict], materials_paths: List[str]
 ) -> List[Material]:
-    materials = activities_to_materials_list(activities)
-
-    materials_dicts = [material.model_dump(by_alias=True) for material in materials]
+    materials_dicts = serialize_all(
+        Material, activities_to_material_records(activities)
+    )
 
     materials_dicts.sort(key=lambda x: x["id"])
 
@@ -26,27 +26,28 @@ def activities_to_materials_json(
     return materials_dicts
 
 
-def activities_to_materials_list(activities: List[dict]) -> List[Material]:
-    materials = []
+def activities_to_material_records(activities: List[dict]) -> List[dict]:
+    records = []
     for activity in activities:
-        materials.extend(activity_to_materials(activity))
-    return materials
+        records.extend(activity_to_material_records(activity))
+    return records
 
 
-def activity_to_materials(eco_activity: dict) -> List[Material]:
-    materials = []
+def activity_to_material_records(eco_activity: dict) -> List[dict]:
+    """The fields of the `Material`s of an activity, see `serialize_all`"""
+    records = []
 
     for textile_metadata in get_metadata_for_scope(eco_activity, "textile"):
         cff = textile_metadata.get("cff")
 
         if cff:
-            cff = Cff(
+            cff = dict(
                 manufacturer_allocation=cff.get("manufacturerAllocation"),
                 recycled_quality_ratio=cff.get("recycledQualityRatio"),
             )
 
-        materials.append(
-            Material(
+        records.append(
+            dict(
                 alias=textile_metadata["alias"],
                 id=textile_metadata["id"],
                 process_id=eco_activity["id"],
@@ -59,4 +60,4 @@ def activity_to_materials(eco_activity: dict) -> List[Material]:
                 cff=cff,
             )
         )
-    return materials
+    return records
@@ -1,7 +1,12 @@
+import hashlib
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 from hashlib import file_digest
 from pathlib import Path, PurePosixPath
+from typing import Iterable, List, Tuple
 
 import boto3.session
+import orjson
 
 from config import settings
 from ecobalyse_data.logging import logger
@@ -9,6 +14,10 @@ from ecobalyse_data.logging import logger
 DB_CACHE_PATH = Path(settings.DB_CACHE_DIR)
 DB_CACHE_PATH.mkdir(parents=True, exist_ok=True)
 
+# Files are downloaded in parts of this size, several parts at once
+PART_SIZE = 64 * 1024 * 1024
+MAX_CONCURRENCY = 8
+
 
 class S3Client(object):
     _client = None
@@ -25,27 +34,168 @@ class S3Client(object):
         return cls._client
 
 
+def _s3_key(path: str) -> str:
+    return str(PurePosixPath(settings.S3_DB_PREFIX) / path)
+
+
+def _checksum_path(local_filepath: Path) -> Path:
+    return local_filepath.with_name(local_filepath.name + ".md5.json")
+
+
+def _parts_path(local_filepath: Path) -> Path:
+    return local_filepath.with_name(local_filepath.name + ".parts")
+
+
+def _write_checksum(local_filepath: Path, md5: str):
+    stat = local_filepath.stat()
+    _checksum_path(local_filepath).write_bytes(
+        orjson.dumps({"md5": md5, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns})
+    )
+
+
+def cached_md5(local_filepath: Path) -> str:
+    """The MD5 of `local_filepath`, read from its checksum sidecar if the size and
+    modification time of the file didn't change since it was computed"""
+    stat = local_filepath.stat()
+    try:
+        checksum = orjson.loads(_checksum_path(local_filepath).read_bytes())
+        if (checksum["size"], checksum["mtime_ns"]) == (
+            stat.st_size,
+            stat.st_mtime_ns,
+        ):
+            return checksum["md5"]
+    except (OSError, orjson.JSONDecodeError, KeyError):
+        pass
+
+    logger.debug(f"-> Computing the md5 of {local_filepath}")
+    with open(local_filepath, "rb") as f:
+        md5 = file_digest(f, "md5").hexdigest()
+    _write_checksum(local_filepath, md5)
+    return md5
+
+
+def _plan_parts(client, path: str, local_filepath: Path) -> List[Tuple]:
+    """The byte ranges of the parts of `path` to download.
+
+    The parts already downloaded are kept in the `.parts` directory next to the
+    file, unless the remote file changed since then."""
+    head = client.head_object(Bucket=settings.S3_BUCKET, Key=_s3_key(path))
+    parts_path = _parts_path(local_filepath)
+    etag_path = parts_path / "etag"
+    if parts_path.exists() and (
+        not etag_path.is_file() or etag_path.read_text() != head["ETag"]
+    ):
+        shutil.rmtree(parts_path)
+    parts_path.mkdir(parents=True, exist_ok=True)
+    etag_path.write_text(head["ETag"])
+
+    size = head["ContentLength"]
+    return [
+        (
+            _s3_key(path),
+            parts_path / f"{index:06d}",
+            start,
+            min(start + PART_SIZE, size),
+        )
+        for index, start in enumerate(range(0, size, PART_SIZE))
+    ]
+
+
+def _download_part(client, key: str, part_path: Path, start: int, end: int):
+    """Download the bytes `start` to `end` (excluded) of `key`, resuming from what
+    a previous attempt left in `part_path`"""
+    done = part_path.stat().st_size if part_path.exists() else 0
+    if done > end - start:
+        part_path.unlink()
+        done = 0
+    if done == end - start:
+        return
+    response = client.get_object(
+        Bucket=settings.S3_BUCKET, Key=key, Range=f"bytes={start + done}-{end - 1}"
+    )
+    with open(part_path, "ab") as f:
+        for chunk in response["Body"].iter_chunks(1024 * 1024):
+            f.write(chunk)
+
+
+def _assemble(local_filepath: Path, parts: List[Tuple]):
+    """Concatenate the downloaded parts into `local_filepath`, hashing them on the
+    way to write the checksum sidecar"""
+    md5 = hashlib.md5()
+    tmp_filepath = local_filepath.with_name(local_filepath.name + ".tmp")
+    with open(tmp_filepath, "wb") as f:
+        for _, part_path, _, _ in parts:
+            with open(part_path, "rb") as part:
+                while chunk := part.read(1024 * 1024):
+                    md5.update(chunk)
+                    f.write(chunk)
+    tmp_filepath.replace(local_filepath)
+    _write_checksum(local_filepath, md5.hexdigest())
+    shutil.rmtree(_parts_path(local_filepath))
+
+
+def download_files(paths: Iterable[str], max_concurrency: int = MAX_CONCURRENCY):
+    """Download the `paths` of the bucket to the cache, with `max_concurrency` parts
+    downloaded at once across all the files.
+
+    An interrupted download resumes from the parts already downloaded."""
+    client = S3Client.get_client()
+    with ThreadPoolExecutor(max_concurrency) as executor:
+        downloads = []
+        for path in paths:
+            local_filepath = DB_CACHE_PATH / path
+            local_filepath.parent.mkdir(parents=True, exist_ok=True)
+            logger.debug(
+                f"Downloading s3://{settings.S3_BUCKET}/{_s3_key(path)} to {local_filepath}"
+            )
+            parts = _plan_parts(client, path, local_filepath)
+            futures = [executor.submit(_download_part, client, *part) for part in parts]
+            downloads.append((local_filepath, parts, futures))
+
+        for local_filepath, parts, futures in downloads:
+            for future in futures:
+                future.result()
+            _assemble(local_filepath, parts)
+
+
+def _check_md5(local_filepath: Path, md5_checksum: str):
+    md5_on_disk = cached_md5(local_filepath)
+    assert md5_on_disk == md5_checksum, (
+        f"the md5 for {local_filepath} is {md5_on_disk}, which is "
+        f"different than the expected one ({md5_checksum}).\n"
+        f"⛔ This should not happen! ⛔ \n"
+        "You can remove your local copy to solve this, "
+        f"but you might want to check if the remote file was modified "
+        f"(which should not happen either!)"
+    )
+
+
 def get_file(path: str, md5_checksum: str) -> Path:
     local_filepath = DB_CACHE_PATH / path
     if not local_filepath.exists():
-        key = str(PurePosixPath(settings.S3_DB_PREFIX) / path)
-        logger.debug(f"Downloading s3://{settings.S3_BUCKET}/{key} to {local_filepath}")
-        S3Client.get_client().download_file(
-            settings.S3_BUCKET,
-            key,
-            local_filepath,
-        )
+        download_files([path])
         assert local_filepath.exists()
 
     # Check that the cached file has the expected checksum
-    with open(local_filepath, "rb") as f:
-        md5_on_disk = file_digest(f, "md5").hexdigest()
-        assert md5_on_disk == md5_checksum, (
-            f"the md5 for {local_filepath} is {md5_on_disk}, which is "
-            f"different than the expected one ({md5_checksum}).\n"
-            f"⛔ This should not happen! ⛔ \n"
-            "You can remove your local copy to solve this, "
-            f"but you might want to check if the remote file was modified "
-            f"(which should not happen either!)"
-        )
+    _check_md5(local_filepath, md5_checksum)
     return local_filepath.absolute()
+
+
+def dbfiles() -> List[Tuple[str, str]]:
+    """The `(path, md5)` of the `settings.dbfiles` entries"""
+    return [
+        (path, settings.dbfiles[f"{name}_MD5"])
+        for name, path in settings.dbfiles.items()
+        if not name.endswith("_MD5")
+    ]
+
+
+def prefetch(
+    files: List[Tuple[str, str]], max_concurrency: int = MAX_CONCURRENCY
+) -> List[Path]:
+    """Download the `(path, md5)` files that are not cached yet, concurrently, and
+    check the checksums of all of them"""
+    missing = [path for path, _ in files if not (DB_CACHE_PATH / path).exists()]
+    logger.info(f"-> Downloading {len(missing)}/{len(files)} files")
+    download_files(missing, max_concurrency=max_concurrency)
+    return [get_file(path, md5) for path, md5 in files]
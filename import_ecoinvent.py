@@ -1,9 +1,10 @@
 #!/usr/bin/env python3
 
 # from bw2io.migrations import create_core_migrations
+import argparse
 import functools
+import multiprocessing
 
-import bw2data
 from bw2io.strategies import (
     assign_only_product_as_production,
     change_electricity_unit_mj_to_kwh,
@@ -28,10 +29,8 @@ from bw2io.strategies import (
 from bw2io.strategies.simapro import set_lognormal_loc_value_uncertainty_safe
 
 from common import brightway_patch as brightway_patch
-from common.import_ import (
-    import_simapro_csv,
-    setup_project,
-)
+from common.import_ import ImportStage, setup_project
+from common.import_scheduler import DatabaseImport, import_databases
 from config import settings
 from ecobalyse_data.bw.migration import WOOLMARK_MIGRATIONS
 from ecobalyse_data.bw.strategy import (
@@ -45,7 +44,6 @@ from ecobalyse_data.bw.strategy import (
     remove_creosote,
     use_unit_processes,
 )
-from ecobalyse_data.logging import logger
 
 STRATEGIES = [
     normalize_units,
@@ -82,42 +80,52 @@ ECOINVENT_STRATEGIES = [
 
 WOOLMARK_STRATEGIES = [use_unit_processes]
 
+CPU_COUNT = max(multiprocessing.cpu_count() // 2, 1)
 
-def main():
-    setup_project()
 
-    if (db := "Ecoinvent 3.11") not in bw2data.databases:
-        import_simapro_csv(
-            settings.dbfiles.EI311,
-            settings.dbfiles.EI311_MD5,
-            db,
-            strategies=STRATEGIES + ECOINVENT_STRATEGIES,
-        )
-    else:
-        logger.info(f"{db} already imported")
+IMPORTS = [
+    DatabaseImport(
+        "Ecoinvent 3.11",
+        settings.dbfiles.EI311,
+        settings.dbfiles.EI311_MD5,
+        strategies=STRATEGIES + ECOINVENT_STRATEGIES,
+    ),
+    DatabaseImport(
+        "Ecoinvent 3.9.1",
+        settings.dbfiles.EI391,
+        settings.dbfiles.EI391_MD5,
+        strategies=STRATEGIES + ECOINVENT_STRATEGIES,
+    ),
+    DatabaseImport(
+        "Woolmark",
+        settings.dbfiles.WOOL,
+        settings.dbfiles.WOOL_MD5,
+        migrations=WOOLMARK_MIGRATIONS,
+        strategies=[lower_formula_parameters] + STRATEGIES + WOOLMARK_STRATEGIES,
+        external_db="Ecoinvent 3.9.1",
+    ),
+]
 
-    if (db := "Ecoinvent 3.9.1") not in bw2data.databases:
-        import_simapro_csv(
-            settings.dbfiles.EI391,
-            settings.dbfiles.EI391_MD5,
-            db,
-            strategies=STRATEGIES + ECOINVENT_STRATEGIES,
-        )
-    else:
-        logger.info(f"{db} already imported")
 
-    if (db := "Woolmark") not in bw2data.databases:
-        import_simapro_csv(
-            settings.dbfiles.WOOL,
-            settings.dbfiles.WOOL_MD5,
-            db,
-            migrations=WOOLMARK_MIGRATIONS,
-            strategies=[lower_formula_parameters] + STRATEGIES + WOOLMARK_STRATEGIES,
-            external_db="Ecoinvent 3.9.1",
-        )
-    else:
-        logger.info(f"{db} already imported")
+def main(from_stage=None, max_workers=None):
+    setup_project()
+    import_databases(
+        IMPORTS, cpu_count=CPU_COUNT, max_workers=max_workers, from_stage=from_stage
+    )
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--from-stage",
+        type=ImportStage,
+        choices=list(ImportStage),
+        help="Rerun the imports from this stage instead of resuming from the last checkpoint",
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        help="The number of databases prepared concurrently. Default to all of them.",
+    )
+    args = parser.parse_args()
+    main(from_stage=args.from_stage, max_workers=args.max_workers)
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 import argparse
 import functools
+import multiprocessing
 
 import bw2data
 from bw2io.strategies import (
@@ -27,10 +28,8 @@ from bw2io.strategies import (
 from bw2io.strategies.simapro import set_lognormal_loc_value_uncertainty_safe
 
 from common import brightway_patch as brightway_patch
-from common.import_ import (
-    import_simapro_csv,
-    setup_project,
-)
+from common.import_ import ImportStage, setup_project
+from common.import_scheduler import DatabaseImport, import_databases
 from config import settings
 from ecobalyse_data.bw.migration import (
     AGRIBALYSE_MIGRATIONS,
@@ -49,7 +48,6 @@ from ecobalyse_data.bw.strategy import (
     remove_creosote,
     remove_negative_land_use_on_tomato,
 )
-from ecobalyse_data.logging import logger
 
 PROJECT = "ecobalyse"
 BIOSPHERE = "biosphere3"
@@ -107,6 +105,44 @@ WFLDB_STRATEGIES = [
     remove_acetamiprid,
 ]
 
+IMPORTS = [
+    DatabaseImport(
+        settings.bw.agribalyse,
+        settings.dbfiles.AGRIBALYSE,
+        settings.dbfiles.AGRIBALYSE_MD5,
+        migrations=AGRIBALYSE_MIGRATIONS,
+        strategies=[lower_formula_parameters] + STRATEGIES + AGB_STRATEGIES,
+    ),
+    DatabaseImport(
+        "PastoEco",
+        settings.dbfiles.PASTOECO,
+        settings.dbfiles.PASTOECO_MD5,
+        external_db=settings.bw.AGRIBALYSE,
+        migrations=PASTOECO_MIGRATIONS,
+        strategies=STRATEGIES,
+    ),
+    DatabaseImport(
+        "Ginko 2025",
+        settings.dbfiles.GINKO,
+        settings.dbfiles.GINKO_MD5,
+        external_db=settings.bw.AGRIBALYSE,
+        migrations=GINKO_MIGRATIONS + AGRIBALYSE_MIGRATIONS,
+        strategies=STRATEGIES + GINKO_STRATEGIES,
+    ),
+    DatabaseImport(
+        "CTCPA",
+        settings.dbfiles.CTCPA,
+        settings.dbfiles.CTCPA_MD5,
+        strategies=STRATEGIES,
+    ),
+    DatabaseImport(
+        "WFLDB",
+        settings.dbfiles.WFLDB,
+        settings.dbfiles.WFLDB_MD5,
+        strategies=STRATEGIES + WFLDB_STRATEGIES,
+    ),
+]
+
 if __name__ == "__main__":
     """Import Agribalyse and additional processes"""
     parser = argparse.ArgumentParser()
@@ -115,69 +151,33 @@ if __name__ == "__main__":
         action="store_true",
         help="Delete and re-create the created activities",
     )
+    parser.add_argument(
+        "--cpu-count",
+        type=int,
+        default=max(multiprocessing.cpu_count() // 2, 1),
+        help="The number of CPUs/cores to use when applying the strategies. Default to MAX/2.",
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        help="The number of databases prepared concurrently. Default to all of them.",
+    )
+    parser.add_argument(
+        "--from-stage",
+        type=ImportStage,
+        choices=list(ImportStage),
+        help="Rerun the imports from this stage instead of resuming from the last checkpoint",
+    )
     args = parser.parse_args()
 
     setup_project()
 
-    # AGRIBALYSE
-    if (db := settings.bw.agribalyse) not in bw2data.databases:
-        import_simapro_csv(
-            settings.dbfiles.AGRIBALYSE,
-            settings.dbfiles.AGRIBALYSE_MD5,
-            db,
-            migrations=AGRIBALYSE_MIGRATIONS,
-            strategies=[lower_formula_parameters] + STRATEGIES + AGB_STRATEGIES,
-        )
-    else:
-        logger.info(f"{db} already imported")
-
-    # PASTO ECO
-    if (db := "PastoEco") not in bw2data.databases:
-        import_simapro_csv(
-            settings.dbfiles.PASTOECO,
-            settings.dbfiles.PASTOECO_MD5,
-            db,
-            external_db=settings.bw.AGRIBALYSE,
-            migrations=PASTOECO_MIGRATIONS,
-            strategies=STRATEGIES,
-        )
-    else:
-        logger.info(f"{db} already imported")
-
-    # GINKO
-    if (db := "Ginko 2025") not in bw2data.databases:
-        import_simapro_csv(
-            settings.dbfiles.GINKO,
-            settings.dbfiles.GINKO_MD5,
-            db,
-            external_db=settings.bw.AGRIBALYSE,
-            strategies=STRATEGIES + GINKO_STRATEGIES,
-            migrations=GINKO_MIGRATIONS + AGRIBALYSE_MIGRATIONS,
-        )
-    else:
-        logger.info(f"{db} already imported")
-
-    # CTCPA
-    if (db := "CTCPA") not in bw2data.databases:
-        import_simapro_csv(
-            settings.dbfiles.CTCPA,
-            settings.dbfiles.CTCPA_MD5,
-            db,
-            strategies=STRATEGIES,
-        )
-    else:
-        logger.info(f"{db} already imported")
-
-    # WFLDB
-    if (db := "WFLDB") not in bw2data.databases:
-        import_simapro_csv(
-            settings.dbfiles.WFLDB,
-            settings.dbfiles.WFLDB_MD5,
-            db,
-            strategies=STRATEGIES + WFLDB_STRATEGIES,
-        )
-    else:
-        logger.info(f"{db} already imported")
+    import_databases(
+        IMPORTS,
+        cpu_count=args.cpu_count,
+        max_workers=args.max_workers,
+        from_stage=args.from_stage,
+    )
 
     if args.recreate_activities:
         if "Ecobalyse" in bw2data.databases:
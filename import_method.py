@@ -17,13 +17,13 @@ from bw2io.strategies import (
     normalize_units,
     set_biosphere_type,
 )
-from frozendict import frozendict
 
 from common import brightway_patch as brightway_patch
 from common.import_ import setup_project
 from config import settings
 from ecobalyse_data import s3
-from ecobalyse_data.bw.strategy import noLT, uraniumFRU
+from ecobalyse_data.bw.method import dedup_cfs, write_methods
+from ecobalyse_data.bw.strategy import FusedStrategy, noLT, uraniumFRU
 from ecobalyse_data.logging import logger
 
 
@@ -71,8 +71,7 @@ def import_method():
                     match_subcategories, biosphere_db_name=ef.biosphere_name
                 ),
             ]
-            ef.strategies.append(noLT)
-            ef.strategies.append(uraniumFRU)
+            ef.strategies.append(FusedStrategy([noLT, uraniumFRU]))
             ef.apply_strategies()
             logger.debug(f"biosphere3 size: {len(bw2data.Database('biosphere3'))}")
             ef.statistics()
@@ -82,11 +81,9 @@ def import_method():
             ef.drop_unlinked()
             # remove duplicates in exchanges
             for m in ef.data:
-                m["exchanges"] = [
-                    dict(f) for f in list(set([frozendict(d) for d in m["exchanges"]]))
-                ]
+                m["exchanges"] = dedup_cfs(m["exchanges"])
 
-            ef.write_methods(overwrite=True)
+            write_methods(ef.data, overwrite=True)
     logger.info(f"🟢 Finished importing {settings.bw.METHOD}")
 
 
@@ -1,9 +1,21 @@
+import functools
 import uuid
+from dataclasses import dataclass
 from enum import Enum
-from typing import Any, List, Optional
-
-from pydantic import AfterValidator, AliasGenerator, BaseModel, ConfigDict, Field
+from itertools import repeat
+from typing import List, Optional, Type, Union, get_args, get_origin
+
+from pydantic import (
+    AfterValidator,
+    AliasGenerator,
+    BaseModel,
+    ConfigDict,
+    Field,
+    TypeAdapter,
+    ValidationError,
+)
 from pydantic.alias_generators import to_camel, to_snake
+from pydantic.fields import FieldInfo
 from typing_extensions import Annotated
 
 from common.export import (
@@ -177,8 +189,25 @@ class Ingredient(EcoModel):
     process_id: uuid.UUID
 
 
+@dataclass(frozen=True, slots=True)
+class ActivityRef:
+    """The fields of the Brightway activity of a process, kept instead of the
+    activity itself so that processes don't hold on to the activity proxies and
+    their loaded data"""
+
+    database: Optional[str] = None
+    code: Optional[str] = None
+    name: Optional[str] = None
+    location: Optional[str] = None
+    unit: Optional[str] = None
+
+    @property
+    def key(self) -> tuple:
+        return (self.database, self.code)
+
+
 class Process(EcoModel):
-    bw_activity: Optional[Any]
+    bw_activity: Optional[ActivityRef]
     categories: List[str]
     comment: str
     computed_by: Optional[ComputedBy]
@@ -195,3 +224,173 @@ class Process(EcoModel):
     activity_name: str
     unit: Optional[UnitEnum]
     waste: float
+
+
+@functools.cache
+def list_adapter(model: Type[BaseModel]) -> TypeAdapter:
+    return TypeAdapter(List[model])
+
+
+def dump_all(
+    model: Type[BaseModel], instances: List[BaseModel], exclude: Optional[set] = None
+) -> List[dict]:
+    """The same dicts as `instance.model_dump(by_alias=True, exclude=exclude)` for
+    each of the `instances`, serialized in a single call to pydantic"""
+    return list_adapter(model).dump_python(
+        instances,
+        by_alias=True,
+        exclude={"__all__": exclude} if exclude else None,
+    )
+
+
+_MISSING = object()
+
+
+class _Unsupported(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class _Column:
+    name: str
+    # The key of the field in the records
+    key: str
+    # The key of the field in the serialized dicts
+    alias: str
+    field: FieldInfo
+    optional: bool
+    # The model of a nested model field, validated as columns too
+    model: Optional[Type[BaseModel]]
+    adapter: Optional[TypeAdapter]
+
+
+def _contains_model(annotation) -> bool:
+    return (isinstance(annotation, type) and issubclass(annotation, BaseModel)) or any(
+        _contains_model(arg) for arg in get_args(annotation)
+    )
+
+
+def _nested_model(annotation) -> Optional[Type[BaseModel]]:
+    """The model of a `Model` or `Optional[Model]` annotation"""
+    if get_origin(annotation) is Union:
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        annotation = args[0] if len(args) == 1 else annotation
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return annotation
+    if _contains_model(annotation):
+        raise _Unsupported(f"Can't validate {annotation} as a column")
+    return None
+
+
+@functools.cache
+def _columns(model: Type[BaseModel]) -> Optional[List[_Column]]:
+    """The columns of `model`, or None if it can't be validated column by column"""
+    decorators = model.__pydantic_decorators__
+    if (
+        model.model_config.get("extra") not in (None, "ignore")
+        or decorators.validators
+        or decorators.field_validators
+        or decorators.root_validators
+        or decorators.model_validators
+        or decorators.field_serializers
+        or decorators.model_serializers
+        or decorators.computed_fields
+    ):
+        return None
+
+    columns = []
+    try:
+        for name, field in model.model_fields.items():
+            nested = _nested_model(field.annotation)
+            if nested is not None and _columns(nested) is None:
+                return None
+            annotation = (
+                Annotated[(field.annotation, *field.metadata)]
+                if field.metadata
+                else field.annotation
+            )
+            columns.append(
+                _Column(
+                    name=name,
+                    key=field.validation_alias
+                    if isinstance(field.validation_alias, str)
+                    else field.alias or name,
+                    alias=field.serialization_alias or field.alias or name,
+                    field=field,
+                    optional=_is_optional(field.annotation),
+                    model=nested,
+                    adapter=None if nested else TypeAdapter(List[annotation]),
+                )
+            )
+    except _Unsupported:
+        return None
+    return columns
+
+
+def _serialize_columns(
+    model: Type[BaseModel], records: List[dict], exclude: Optional[set]
+) -> List[dict]:
+    aliases, columns = [], []
+    for column in _columns(model):
+        values = list(
+            map(dict.get, records, repeat(column.key), repeat(_MISSING, len(records)))
+        )
+        present = range(len(values))
+        if _MISSING in values:
+            if column.field.is_required():
+                raise _Unsupported(f"Missing {column.key}")
+            present = [
+                index for index, value in enumerate(values) if value is not _MISSING
+            ]
+            default = column.field.get_default(call_default_factory=True)
+            values = [default if value is _MISSING else value for value in values]
+
+        if column.model is not None:
+            nested = [index for index in present if values[index] is not None]
+            if len(nested) < len(present) and not column.optional:
+                raise _Unsupported(f"{column.key} is None")
+            if not all(isinstance(values[index], dict) for index in nested):
+                raise _Unsupported(f"{column.key} is not a dict")
+            validated = _serialize_columns(
+                column.model, [values[index] for index in nested], None
+            )
+            present = nested
+        elif isinstance(present, range):
+            validated = column.adapter.validate_python(values)
+            present = None
+        else:
+            validated = column.adapter.validate_python([values[i] for i in present])
+
+        if present is None:
+            values = validated
+        else:
+            for index, value in zip(present, validated):
+                values[index] = value
+
+        if not exclude or column.name not in exclude:
+            aliases.append(column.alias)
+            columns.append(values)
+    return [dict(zip(aliases, row)) for row in zip(*columns)]
+
+
+def _is_optional(annotation) -> bool:
+    return get_origin(annotation) is Union and type(None) in get_args(annotation)
+
+
+def serialize_all(
+    model: Type[BaseModel], records: List[dict], exclude: Optional[set] = None
+) -> List[dict]:
+    """The same dicts as `model(**record).model_dump(by_alias=True, exclude=exclude)`
+    for each of the `records`.
+
+    The records are validated field by field, each field of all the records in a
+    single call to pydantic, and then assembled into dicts without building the
+    models. Records that can't be validated this way, like the invalid ones, are
+    validated as models to raise the same errors."""
+    columns = _columns(model)
+    if columns is not None:
+        try:
+            return _serialize_columns(model, records, exclude)
+        except (_Unsupported, ValidationError):
+            pass
+    return dump_all(model, list_adapter(model).validate_python(records), exclude)
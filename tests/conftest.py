@@ -44,9 +44,11 @@ def temp_bw_dir(tmp_path):
     bwconfig.is_test = True
 
     os.environ["BRIGHTWAY2_DIR"] = str(tmp_path)
+    # Where the worker processes, only given BRIGHTWAY2_DIR, put the logs
+    (tmp_path / "logs").mkdir()
     projects.change_base_directories(
         base_dir=tmp_path,
-        base_logs_dir=tmp_path,
+        base_logs_dir=tmp_path / "logs",
         project_name=settings.bw.project,
         update=False,
     )
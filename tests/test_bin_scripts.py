@@ -4,8 +4,8 @@ import bw2data
 import orjson
 from pytest import approx
 
-from bin import export_bw_db, export_lcia, lcia_info
-from config import settings
+from bin import benchmark_serialization, export_bw_db, export_lcia, lcia_info
+from config import TESTS_FIXTURE_DIR, settings
 from ecobalyse_data.bw import simapro_export
 from models.process import ComputedBy, Impacts
 
@@ -78,3 +78,14 @@ def test_lcia_info(forwast, forwast_json_icv):
     forwast_impacts = forwast_json_icv["forwast"][0]["impacts"]
     assert impacts[0] == ComputedBy.brightway
     assert impacts[1].model_dump() == approx(Impacts(**forwast_impacts).model_dump())
+
+
+def test_benchmark_serialization(capsys):
+    # Raises if the batch path doesn't serialize the records like the models do
+    benchmark_serialization.main(
+        catalog_dir=TESTS_FIXTURE_DIR / "lci_catalog", repeat=1, multiply=2
+    )
+
+    output = capsys.readouterr().out
+    for model in ("Process", "Material", "Ingredient", "ProcessGeneric"):
+        assert model in output
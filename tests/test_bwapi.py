@@ -0,0 +1,152 @@
+import asyncio
+
+import bw2calc
+import bw2data
+import pytest
+
+# The dependencies of the API are not the ones of the project
+pytest.importorskip("fastapi")
+
+from archive.bwapi import server  # noqa: E402
+
+METHOD = "EF v3.1"
+
+
+def _write_technosphere(amount):
+    bw2data.Database("Agribalyse").write(
+        {
+            ("Agribalyse", "wheat"): {
+                "name": "Wheat",
+                "unit": "kilogram",
+                "location": "FR",
+                "exchanges": [
+                    {
+                        "input": ("Agribalyse", "wheat"),
+                        "amount": 1,
+                        "type": "production",
+                    },
+                    {
+                        "input": ("biosphere3", "co2"),
+                        "amount": 0.5,
+                        "type": "biosphere",
+                    },
+                    {
+                        "input": ("biosphere3", "ch4"),
+                        "amount": 0.01,
+                        "type": "biosphere",
+                    },
+                ],
+            },
+            ("Agribalyse", "flour"): {
+                "name": "Flour",
+                "unit": "kilogram",
+                "location": "FR",
+                "exchanges": [
+                    {
+                        "input": ("Agribalyse", "flour"),
+                        "amount": 1,
+                        "type": "production",
+                    },
+                    {
+                        "input": ("Agribalyse", "wheat"),
+                        "amount": amount,
+                        "type": "technosphere",
+                    },
+                    {
+                        "input": ("biosphere3", "co2"),
+                        "amount": 0.2,
+                        "type": "biosphere",
+                    },
+                ],
+            },
+        }
+    )
+
+
+@pytest.fixture
+def project(temp_bw_dir, mocker):
+    bw2data.projects.set_current("test-bwapi")
+    bw2data.Database("biosphere3").write(
+        {
+            ("biosphere3", code): {"name": name, "unit": "kilogram", "type": "emission"}
+            for code, name in [("co2", "Carbon dioxide"), ("ch4", "Methane")]
+        }
+    )
+    _write_technosphere(1.2)
+    for impact_category, factors in [
+        ("climate change", {"co2": 1, "ch4": 28}),
+        ("methane", {"ch4": 1}),
+    ]:
+        method = bw2data.Method((METHOD, impact_category))
+        method.register(unit="kg CO2 eq")
+        method.write([(("biosphere3", code), cf) for code, cf in factors.items()])
+    mocker.patch.object(server, "_warm_lcas", server.OrderedDict())
+    return "test-bwapi"
+
+
+def _expected(code, amount=1):
+    lca = bw2calc.LCA({bw2data.get_activity(("Agribalyse", code)): amount})
+    lca.lci()
+    scores = {}
+    for impact_category in [(METHOD, "climate change"), (METHOD, "methane")]:
+        lca.switch_method(impact_category)
+        lca.lcia()
+        scores[impact_category] = lca.score
+    return scores
+
+
+def _scores(impacts):
+    return {impact["method"]: impact["score"] for impact in impacts}
+
+
+def _impacts(project, code, method=METHOD):
+    return asyncio.run(server.impacts(None, project, "Agribalyse", code, method))
+
+
+def _batch_impacts(project, demands, method=METHOD):
+    return asyncio.run(
+        server.batch_impacts(
+            None, project, "Agribalyse", method, server.Demands(demands=demands)
+        )
+    )
+
+
+def test_impacts(project):
+    for code in ["wheat", "flour"]:
+        assert _scores(_impacts(project, code)) == pytest.approx(_expected(code))
+    assert len(server._warm_lcas) == 1
+
+    results = _batch_impacts(
+        project, [{"code": "flour", "amount": 2}, {"code": "wheat"}]
+    )
+    assert [(result["code"], result["amount"]) for result in results] == [
+        ("flour", 2),
+        ("wheat", 1),
+    ]
+    assert _scores(results[0]["impacts"]) == pytest.approx(_expected("flour", 2))
+    assert _scores(results[1]["impacts"]) == pytest.approx(_expected("wheat"))
+    assert {impact["unit"] for impact in results[0]["impacts"]} == {"kg CO2 eq"}
+
+
+def test_impacts_not_found(project):
+    for response in [
+        _impacts(project, "rice"),
+        _impacts(project, "wheat", method="EF v4.0"),
+        asyncio.run(server.impacts(None, project, "Ecoinvent", "wheat", METHOD)),
+        _batch_impacts(project, [{"code": "wheat"}, {"code": "rice"}]),
+    ]:
+        assert response.status_code == 404
+
+
+def test_warm_lca_rebuilt_when_the_database_changes(project):
+    _impacts(project, "flour")
+    warm_lca = server._warm_lcas[(project, "Agribalyse")]
+
+    _impacts(project, "flour")
+    assert server._warm_lcas[(project, "Agribalyse")] is warm_lca
+
+    _write_technosphere(2.5)
+    scores = _scores(_impacts(project, "flour"))
+
+    assert server._warm_lcas[(project, "Agribalyse")] is not warm_lca
+    assert scores == pytest.approx(_expected("flour"))
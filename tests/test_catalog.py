@@ -0,0 +1,56 @@
+import shutil
+
+import orjson
+import pytest
+
+from config import TESTS_FIXTURE_DIR
+from ecobalyse_data import catalog
+
+
+@pytest.fixture
+def lci_catalog(tmp_path):
+    catalog_dir = tmp_path / "lci_catalog"
+    shutil.copytree(TESTS_FIXTURE_DIR / "lci_catalog", catalog_dir)
+    return catalog_dir
+
+
+def test_load_catalog(lci_catalog, tmp_path):
+    activities = catalog.load_catalog([lci_catalog], cache_path=tmp_path / "cache.json")
+
+    assert len(activities) == len(list(lci_catalog.glob("*/*.json")))
+    assert all("id" in activity for activity in activities)
+
+
+def test_invalid_files_are_reported_together(lci_catalog):
+    milk_path = lci_catalog / "forwast" / "milk.json"
+    milk = orjson.loads(milk_path.read_bytes())
+    milk["id"] = "not-a-uuid"
+    milk_path.write_bytes(orjson.dumps(milk))
+
+    (lci_catalog / "forwast" / "broken.json").write_text("{")
+
+    with pytest.raises(catalog.CatalogValidationError) as excinfo:
+        catalog.load_catalog([lci_catalog], cache_path=None)
+
+    assert sorted(p.rsplit("/", 1)[-1] for p in excinfo.value.errors) == [
+        "broken.json",
+        "milk.json",
+    ]
+    assert "data.id must be uuid" in str(excinfo.value)
+
+
+def test_only_changed_files_are_validated(lci_catalog, tmp_path, mocker):
+    cache_path = tmp_path / "cache.json"
+    catalog.load_catalog([lci_catalog], cache_path=cache_path)
+
+    validate = mocker.spy(catalog, "_validate_file")
+    catalog.load_catalog([lci_catalog], cache_path=cache_path)
+    assert validate.call_count == 0
+
+    milk_path = lci_catalog / "forwast" / "milk.json"
+    milk = orjson.loads(milk_path.read_bytes())
+    milk["comment"] = "changed"
+    milk_path.write_bytes(orjson.dumps(milk))
+
+    catalog.load_catalog([lci_catalog], cache_path=cache_path)
+    assert validate.call_count == 1
@@ -0,0 +1,112 @@
+import functools
+
+import bw2data
+import orjson
+import pytest
+from bw2io.strategies import migrate_exchanges, normalize_units
+
+from common.bw.simapro_json import SimaProJsonImporter
+from common.import_ import ImportStage, _import_simapro_csv
+from ecobalyse_data.bw.checkpoint import (
+    Checkpoints,
+    migrations_fingerprint,
+    strategy_fingerprint,
+)
+from ecobalyse_data.bw.migration import GINKO_MIGRATIONS, WOOLMARK_MIGRATIONS
+from ecobalyse_data.bw.profiling import Profiler
+from ecobalyse_data.bw.strategy import extract_ciqual
+
+
+def test_fingerprints():
+    assert strategy_fingerprint(normalize_units) == strategy_fingerprint(
+        normalize_units
+    )
+    assert strategy_fingerprint(extract_ciqual) != strategy_fingerprint(normalize_units)
+    assert strategy_fingerprint(
+        functools.partial(migrate_exchanges, migration="default-units")
+    ) != strategy_fingerprint(
+        functools.partial(migrate_exchanges, migration="simapro-water")
+    )
+    assert migrations_fingerprint(GINKO_MIGRATIONS) != migrations_fingerprint(
+        WOOLMARK_MIGRATIONS
+    )
+
+
+def test_checkpoints(tmp_path):
+    importer = SimaProJsonImporter.__new__(SimaProJsonImporter)
+    importer.data = [{"name": "Wheat", "categories": ("air",), "input": ("db", "a")}]
+    importer.global_parameters = {"AREA": {"amount": 10}}
+    importer.metadata = {"Project": "Test"}
+
+    checkpoints = Checkpoints(tmp_path, "AGB3")
+    assert checkpoints.load("strategies", "key") is None
+
+    checkpoints.save("strategies", "old-key", {"data": []})
+    checkpoints.save("strategies", "key", importer.get_state())
+    assert not checkpoints.path("strategies", "old-key").exists()
+
+    restored = SimaProJsonImporter.from_state(
+        "Agribalyse", checkpoints.load("strategies", "key")
+    )
+    assert restored.db_name == "Agribalyse"
+    assert restored.data == importer.data
+    assert restored.global_parameters == importer.global_parameters
+    assert restored.metadata == importer.metadata
+    assert restored.applied_strategies == []
+
+
+def _import(tmp_path, until_stage=None):
+    _import_simapro_csv(
+        Profiler("Test"),
+        "AGB3.CSV.zip",
+        "md5",
+        "Test",
+        external_db=None,
+        biosphere="biosphere3",
+        migrations=[],
+        strategies=[],
+        cpu_count=1,
+        from_stage=None,
+        until_stage=until_stage,
+    )
+    return sorted(path.name.split(".")[1] for path in tmp_path.glob("*.pickle"))
+
+
+@pytest.fixture
+def simapro_json(temp_bw_dir, tmp_path, mocker):
+    bw2data.projects.set_current("test-checkpoint")
+    bw2data.Database("biosphere3").write({})
+    mocker.patch("common.import_.s3.get_file", return_value=tmp_path / "AGB3.CSV.zip")
+    # As converted from the CSV file
+    (tmp_path / "AGB3.md5.json").write_bytes(
+        orjson.dumps(
+            {
+                "data": [
+                    {
+                        "code": "wheat",
+                        "name": "Wheat",
+                        "unit": "kilogram",
+                        "location": "FR",
+                        "type": "process",
+                        "exchanges": [],
+                    }
+                ],
+                "global_parameters": {},
+                "metadata": {},
+            }
+        )
+    )
+
+
+@pytest.mark.parametrize("until_stage", list(ImportStage))
+def test_import_until_stage(simapro_json, tmp_path, until_stage):
+    stages = list(ImportStage)
+
+    checkpointed = _import(tmp_path, until_stage)
+
+    assert "Test" not in bw2data.databases
+    assert checkpointed == sorted(stages[1 : stages.index(until_stage) + 1])
+
+    # The import resumes from the last checkpoint
+    assert _import(tmp_path) == sorted(stages[1:])
+    assert len(bw2data.Database("Test")) == 1
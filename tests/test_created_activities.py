@@ -0,0 +1,244 @@
+import bw2calc
+import bw2data
+import orjson
+import pytest
+
+from common.import_ import add_created_activities
+from ecobalyse_data.bw.overlay import MatrixOverlay
+from ecobalyse_data.computation import compute_brightway_impacts
+
+
+def _activity(code, name, exchanges):
+    names = {"wheat": "Wheat", "flour": "Flour", "diesel": "Diesel"}
+    return ("Agb", code), {
+        "name": name,
+        "location": "FR",
+        "unit": "kilogram",
+        "type": "processwithreferenceproduct",
+        "exchanges": [{"input": ("Agb", code), "amount": 1, "type": "production"}]
+        + [
+            {
+                "name": names[input_code],
+                "input": ("Agb", input_code),
+                "amount": amount,
+                "type": "technosphere",
+            }
+            for input_code, amount in exchanges
+        ],
+    }
+
+
+@pytest.fixture
+def databases(temp_bw_dir):
+    bw2data.projects.set_current("test-created-activities")
+    bw2data.Database("biosphere3").write(
+        {
+            ("biosphere3", "co2"): {
+                "name": "Carbon dioxide, fossil",
+                "categories": ("air",),
+                "unit": "kilogram",
+                "type": "emission",
+            },
+        }
+    )
+    bw2data.Database("Agb").write(
+        dict(
+            [
+                _activity("wheat", "Wheat", [("diesel", 0.1)]),
+                _activity("wheat-organic", "Wheat organic", []),
+                _activity("flour", "Flour", [("wheat", 1.2), ("diesel", 0.3)]),
+                _activity("bread", "Bread", [("flour", 0.8)]),
+                _activity("diesel", "Diesel", []),
+            ]
+        )
+    )
+
+
+def _exchanges(activity):
+    return sorted(
+        (exc.input["name"], exc["type"], exc["amount"]) for exc in activity.exchanges()
+    )
+
+
+def test_add_created_activities(databases, tmp_path):
+    activities_to_create = tmp_path / "activities_to_create.json"
+    activities_to_create.write_bytes(
+        orjson.dumps(
+            [
+                {
+                    "activityCreationType": "from_scratch",
+                    "alias": "diesel-b7",
+                    "database": "Agb",
+                    "newName": "Diesel B7",
+                    "location": "FR",
+                    "exchanges": [
+                        {
+                            "name": "Carbon dioxide, fossil",
+                            "code": "co2",
+                            "database": "biosphere3",
+                            "amount": 2.19,
+                        },
+                        {"name": "Diesel", "amount": 0.9},
+                    ],
+                },
+                {
+                    "activityCreationType": "from_existing",
+                    "alias": "flour-b7",
+                    "database": "Agb",
+                    "newName": "Flour with B7",
+                    "existingActivity": {"name": "Flour"},
+                    "delete": [{"name": "Diesel"}],
+                    "exchanges": [
+                        {"name": "Diesel B7", "database": "Ecobalyse", "amount": 0.3}
+                    ],
+                },
+                {
+                    "activityCreationType": "from_existing",
+                    "alias": "bread-organic",
+                    "database": "Agb",
+                    "newName": "Bread organic",
+                    "existingActivity": {"name": "Bread"},
+                    "replacementPlan": {
+                        "upstreamPath": [{"name": "Flour"}],
+                        "replace": [
+                            {"from": {"name": "Wheat"}, "to": {"name": "Wheat organic"}}
+                        ],
+                    },
+                },
+            ]
+        )
+    )
+
+    add_created_activities("Ecobalyse", activities_to_create)
+
+    db = bw2data.Database("Ecobalyse")
+    assert len(db) == 4
+    assert not bw2data.databases["Ecobalyse"].get("dirty")
+
+    diesel_b7 = bw2data.get_node(database="Ecobalyse", name="Diesel B7")
+    assert diesel_b7["Process identifier"] == diesel_b7["code"]
+    assert _exchanges(diesel_b7) == [
+        ("Carbon dioxide, fossil", "biosphere", 2.19),
+        ("Diesel", "technosphere", 0.9),
+    ]
+
+    flour_b7 = bw2data.get_node(database="Ecobalyse", name="Flour with B7")
+    assert flour_b7["System description"] == "Ecobalyse"
+    assert _exchanges(flour_b7) == [
+        ("Diesel B7", "technosphere", 0.3),
+        ("Flour with B7", "production", 1),
+        ("Wheat", "technosphere", 1.2),
+    ]
+
+    flour_variant = bw2data.get_node(
+        database="Ecobalyse", name="Flour {{bread-organic}}"
+    )
+    assert _exchanges(flour_variant) == [
+        ("Diesel", "technosphere", 0.3),
+        ("Flour {{bread-organic}}", "production", 1),
+        ("Wheat organic", "technosphere", 1.2),
+    ]
+    bread = bw2data.get_node(database="Ecobalyse", name="Bread organic")
+    assert _exchanges(bread) == [
+        ("Bread organic", "production", 1),
+        ("Flour {{bread-organic}}", "technosphere", 0.8),
+    ]
+
+
+def test_activity_not_found(databases, tmp_path):
+    activities_to_create = tmp_path / "activities_to_create.json"
+    activities_to_create.write_bytes(
+        orjson.dumps(
+            [
+                {
+                    "activityCreationType": "from_existing",
+                    "alias": "rye",
+                    "database": "Agb",
+                    "newName": "Rye organic",
+                    "existingActivity": {"name": "Rye"},
+                }
+            ]
+        )
+    )
+
+    with pytest.raises(ValueError, match="one perfect match"):
+        add_created_activities("Ecobalyse", activities_to_create)
+    assert "Ecobalyse" not in bw2data.databases
+
+
+def test_matrix_overlay(databases, tmp_path):
+    bw2data.Method(("test", "climate change")).write([(("biosphere3", "co2"), 1.0)])
+    bw2data.Database("Agb").write(
+        {
+            **{
+                (ds["database"], ds["code"]): ds
+                for ds in bw2data.Database("Agb").load().values()
+            },
+            ("Agb", "diesel"): {
+                "name": "Diesel",
+                "location": "FR",
+                "unit": "kilogram",
+                "type": "processwithreferenceproduct",
+                "exchanges": [
+                    {"input": ("biosphere3", "co2"), "amount": 3.0, "type": "biosphere"}
+                ],
+            },
+        }
+    )
+    activities_to_create = tmp_path / "activities_to_create.json"
+    activities_to_create.write_bytes(
+        orjson.dumps(
+            [
+                {
+                    "activityCreationType": "from_scratch",
+                    "alias": "diesel-b7",
+                    "database": "Agb",
+                    "newName": "Diesel B7",
+                    "location": "FR",
+                    "exchanges": [
+                        {
+                            "name": "Carbon dioxide, fossil",
+                            "code": "co2",
+                            "database": "biosphere3",
+                            "amount": 0.5,
+                        },
+                        {"name": "Diesel", "amount": 0.9},
+                    ],
+                },
+                {
+                    "activityCreationType": "from_existing",
+                    "alias": "flour-b7",
+                    "database": "Agb",
+                    "newName": "Flour with B7",
+                    "existingActivity": {"name": "Flour"},
+                    "delete": [{"name": "Diesel"}],
+                    "exchanges": [
+                        {"name": "Diesel B7", "database": "Ecobalyse", "amount": 0.3}
+                    ],
+                },
+            ]
+        )
+    )
+
+    overlay = MatrixOverlay.from_file("Ecobalyse", activities_to_create)
+    assert "Ecobalyse" not in bw2data.databases
+
+    flour = overlay.search_one("Flour with B7")
+    lca = overlay.lca({flour.id: 1})
+    lca.lci()
+    lca.switch_method(("test", "climate change"))
+    lca.lcia()
+    # 1.2 wheat using 0.1 diesel each, 0.3 diesel B7 made of 0.5 CO2 and 0.9 diesel
+    assert lca.score == pytest.approx(1.2 * 0.1 * 3.0 + 0.3 * (0.5 + 0.9 * 3.0))
+
+    add_created_activities("Ecobalyse", activities_to_create)
+    written = bw2data.get_node(database="Ecobalyse", name="Flour with B7")
+    expected = bw2calc.LCA({written: 1}, ("test", "climate change"))
+    expected.lci()
+    expected.lcia()
+    assert lca.score == pytest.approx(expected.score)
+
+    impacts = compute_brightway_impacts(
+        flour, None, {"cch": ("test", "climate change")}, demand_amount=1
+    )
+    assert impacts["cch"] == pytest.approx(expected.score)
@@ -0,0 +1,196 @@
+import asyncio
+import time
+
+import pytest
+
+from common.distances.CountryDistances import CountryDistances
+from common.distances.fetcher import (
+    DistanceFetcher,
+    DistanceProvider,
+    RouteCheckpoint,
+    TokenBucket,
+    routes_for,
+)
+
+
+class LocalProvider(DistanceProvider):
+    """Distances computed from the position of the countries in the alphabet"""
+
+    modes = ("road", "sea")
+
+    def __init__(self, failures=None, rate=None):
+        self.calls = []
+        # The number of times each route fails before answering
+        self.failures = dict(failures or {})
+        self.rate = rate
+
+    def get_distance(self, mode, route):
+        self.calls.append((mode, route))
+        if self.failures.get(route, 0) > 0:
+            self.failures[route] -= 1
+            raise ConnectionError(f"No answer for {route}")
+        if mode == "sea" and "CH" in route:
+            return None
+        return abs(ord(route[0][0]) - ord(route[1][0])) * 1000
+
+
+def _fetcher(provider, checkpoint=None, **kwargs):
+    return DistanceFetcher(
+        [provider], checkpoint=checkpoint, backoff=0, workers=3, **kwargs
+    )
+
+
+def test_routes_for():
+    assert routes_for(["FR", "CN", "BE", "FR"]) == [
+        ("BE", "CN"),
+        ("BE", "FR"),
+        ("CN", "FR"),
+    ]
+
+
+def test_fetch():
+    provider = LocalProvider()
+
+    distances = _fetcher(provider).fetch(["FR", "CH", "BE"])
+
+    assert distances == {
+        "BE": {
+            "CH": {"road": 1000, "sea": None},
+            "FR": {"road": 4000, "sea": 4000},
+        },
+        "CH": {"FR": {"road": 3000, "sea": None}},
+        "FR": {},
+    }
+    assert len(provider.calls) == 6
+
+
+def test_fetch_retries():
+    provider = LocalProvider(failures={("BE", "FR"): 2})
+
+    distances = _fetcher(provider).fetch(["FR", "BE"])
+
+    assert distances["BE"]["FR"] == {"road": 4000, "sea": 4000}
+    assert len(provider.calls) == 4
+
+
+def test_fetch_resumes_from_the_checkpoint(tmp_path):
+    checkpoint = RouteCheckpoint(tmp_path / "checkpoint.jsonl")
+    provider = LocalProvider(failures={("CH", "FR"): 10})
+
+    with pytest.raises(ValueError, match=r"1 routes: \[\('CH', 'FR'\)\]"):
+        _fetcher(provider, checkpoint, retries=2).fetch(["FR", "CH", "BE"])
+    assert set(checkpoint.load()) == {("BE", "CH"), ("BE", "FR")}
+
+    # Only the failed route is fetched again
+    provider = LocalProvider()
+    distances = _fetcher(provider, checkpoint).fetch(["FR", "CH", "BE"])
+
+    assert {route for _, route in provider.calls} == {("CH", "FR")}
+    assert distances["CH"]["FR"] == {"road": 3000, "sea": None}
+
+
+def test_fetch_only_the_missing_routes():
+    provider = LocalProvider()
+    existing = {"BE": {"FR": {"road": 1, "sea": 2}}, "FR": {}}
+
+    distances = _fetcher(provider).fetch(["BE", "FR", "NL"], existing=existing)
+
+    assert {route for _, route in provider.calls} == {("BE", "NL"), ("FR", "NL")}
+    assert distances["BE"]["FR"] == {"road": 1, "sea": 2}
+    assert distances["FR"]["NL"] == {"road": 8000, "sea": 8000}
+
+
+def test_fetch_keeps_the_known_routes_of_other_countries(tmp_path):
+    checkpoint = RouteCheckpoint(tmp_path / "checkpoint.jsonl")
+    checkpoint.append(("CN", "FR"), {"road": 3, "sea": 4})
+    existing = {"BE": {"FR": {"road": 1, "sea": 2}, "US": {"road": None, "sea": 5}}}
+
+    distances = _fetcher(LocalProvider()).fetch(["FR", "NL"], existing=existing)
+    assert distances == {
+        "BE": {"FR": {"road": 1, "sea": 2}, "US": {"road": None, "sea": 5}},
+        "FR": {"NL": {"road": 8000, "sea": 8000}},
+        "NL": {},
+        "US": {},
+    }
+
+    distances = _fetcher(LocalProvider(), checkpoint).fetch(["FR"], existing=existing)
+    assert distances["CN"] == {"FR": {"road": 3, "sea": 4}}
+
+
+def test_checkpoint_ignores_an_interrupted_line(tmp_path):
+    checkpoint = RouteCheckpoint(tmp_path / "checkpoint.jsonl")
+    checkpoint.append(("BE", "FR"), {"road": 1})
+    with open(checkpoint.path, "a") as file:
+        file.write('{"route": ["BE", "N')
+
+    assert checkpoint.load() == {("BE", "FR"): {"road": 1}}
+
+
+def test_token_bucket():
+    async def acquire_all(bucket, count):
+        for _ in range(count):
+            await bucket.acquire()
+
+    bucket = TokenBucket(rate=50)
+    start = time.monotonic()
+    asyncio.run(acquire_all(bucket, 6))
+
+    # The first token is available right away, the next ones every 20 ms
+    assert time.monotonic() - start >= 0.1
+
+
+DISTANCES = {
+    "BE": {
+        "CN": {"air": 7900, "road": 11000, "sea": 19000},
+        "FR": {"air": 300, "road": 400, "sea": None},
+    },
+    "CN": {"FR": {"air": 8200, "road": 11500, "sea": 18500.5}},
+    "FR": {},
+}
+
+
+def test_country_distances():
+    distances = CountryDistances(DISTANCES)
+
+    assert distances._all_countries == {"BE", "CN", "FR"}
+    assert distances.get("FR", "BE") == {"air": 300, "road": 400, "sea": None}
+    assert distances.get("BE", "FR") == distances.get("FR", "BE")
+    assert distances.get("FR", "US") is None
+    assert distances.extract_distances_for_country("CN") == {
+        "BE": {"air": 7900, "road": 11000, "sea": 19000},
+        "FR": {"air": 8200, "road": 11500, "sea": 18500.5},
+    }
+    # Without the self distances
+    with pytest.raises(ValueError, match=r"BE\|BE"):
+        distances.validate()
+
+    distances.add_self_distances()
+    assert distances.validate()
+    assert distances.export_to_nested_dict() == {
+        "BE": {**DISTANCES["BE"], "BE": distances.self_distance},
+        "CN": {**DISTANCES["CN"], "CN": distances.self_distance},
+        "FR": {"FR": distances.self_distance},
+    }
+
+
+def test_country_distances_regions():
+    distances = CountryDistances(DISTANCES)
+    distances.add_self_distances()
+
+    distances.add_regions({"RAS": "CN", "REO": "FR"})
+
+    assert distances.get("RAS", "BE") == distances.get("CN", "BE")
+    assert distances.get("RAS", "CN") == distances.self_distance
+    assert distances.get("RAS", "RAS") == distances.self_distance
+    assert distances.get("RAS", "REO") == distances.get("CN", "FR")
+    assert distances.validate()
+
+    distances.delete_countries(["CN", "FR"])
+
+    assert distances._all_countries == {"BE", "RAS", "REO"}
+    assert distances.get("BE", "CN") is None
+    assert distances.validate()
+    assert set(distances.export_to_nested_dict()["RAS"]) == {"RAS", "REO"}
+
+    with pytest.raises(ValueError, match=r"BE\|US"):
+        distances.add_country("US", {"US": distances.self_distance})
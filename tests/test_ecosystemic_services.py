@@ -1,5 +1,7 @@
 import json
 
+import pytest
+
 from config import PROJECT_ROOT_DIR, settings
 from ecobalyse_data.export import food
 
@@ -70,3 +72,94 @@ def test_resolve_feed_unknown():
     """Unknown alias returns None"""
     result = food.resolve_feed("unknown", {}, {})
     assert result is None
+
+
+FACTORS = {
+    "CEREALES": {
+        "hedges": {"reference": 70.0, "organic": 280.0, "import": None},
+        "plotSize": {"reference": 4.0, "organic": 10.0, "import": None},
+        "cropDiversity": {"reference": 5.0, "organic": 10.0, "import": None},
+    },
+}
+
+
+def _activity(alias, **metadata):
+    return {
+        "displayName": alias,
+        "metadata": [{"alias": alias, "scopes": ["food"], **metadata}],
+    }
+
+
+def _vegetal(alias, land_occupation, scenario="reference"):
+    return _activity(
+        alias,
+        cropGroup="CEREALES",
+        scenario=scenario,
+        landOccupation=land_occupation,
+    )
+
+
+def test_compute_es_for_ingredients():
+    activities = [
+        _vegetal("wheat", 2.0),
+        _vegetal("wheat-organic", 3.0, scenario="organic"),
+        _activity("pig"),
+        _activity("bacon"),
+        _activity("salt"),
+    ]
+    feed = {"pig": {"wheat": 1.5, "wheat-organic": 0.5}}
+    raw_to_transformed = {"pig": {"bacon": {"ratio": 2.0}}}
+
+    es = food.compute_es_for_ingredients(activities, FACTORS, feed, raw_to_transformed)
+
+    assert es["wheat"] == {"hedges": -1.0, "plotSize": -1.0, "cropDiversity": 0.0}
+    assert es["wheat-organic"] == {
+        "hedges": -3.0,
+        "plotSize": -0.0,
+        "cropDiversity": -7.5,
+    }
+    assert es["pig"] == {
+        "hedges": -3.0,
+        "plotSize": -1.5,
+        "cropDiversity": -3.75,
+        "permanentPasture": 0.0,
+    }
+    assert es["bacon"]["hedges"] == -6.0
+    assert "salt" not in es
+
+    # The results are cached, but not shared with the callers
+    es["wheat"]["hedges"] = 0
+    again = food.compute_es_for_ingredients(
+        activities, FACTORS, feed, raw_to_transformed
+    )
+    assert again["wheat"]["hedges"] == -1.0
+
+
+def test_compute_es_for_animals_fed_with_animals():
+    activities = [_activity("milk"), _activity("calf"), _vegetal("wheat", 2.0)]
+    feed = {"milk": {"calf": 0.5, "wheat": 1.0}, "calf": {"wheat": 3.0}}
+
+    es = food.compute_es_for_ingredients(activities, FACTORS, feed, {})
+
+    assert es["calf"]["hedges"] == -3.0
+    assert es["milk"]["hedges"] == -2.5
+
+
+def test_compute_es_for_ingredients_errors():
+    with pytest.raises(ValueError, match="cycle"):
+        food.compute_es_for_ingredients(
+            [_activity("hen"), _activity("egg")],
+            FACTORS,
+            {"hen": {"egg": 1.0}, "egg": {"hen": 1.0}},
+            {},
+        )
+
+    with pytest.raises(ValueError, match="not in activities list"):
+        food.compute_es_for_ingredients(
+            [_activity("pig")], FACTORS, {"pig": {"corn": 1.0}}, {}
+        )
+
+    with pytest.raises(ValueError, match="No input value defined"):
+        food.compute_es_for_ingredients(
+            [_vegetal("wheat", 1.0, scenario="import")], FACTORS, {}, {}
+        )
@@ -1,9 +1,15 @@
+import os
+import uuid
+from functools import partial
+
 import orjson
 
 from bin import export
 from common.export import export_json
 from config import TESTS_FIXTURE_DIR, settings
 from create_activities import create_activities
+from ecobalyse_data.export import food as export_food
+from ecobalyse_data.export.export_generic import compute_processes_generic
 
 
 def test_export_processes(forwast, tmp_path, processes_impacts_json):
@@ -84,3 +90,102 @@ def test_export_processes_generic(
             TESTS_FIXTURE_DIR / "processes_generic_impacts_output.json",
         )
         assert json_data == processes_generic_impacts_json
+
+
+def test_export_all(
+    forwast,
+    tmp_path,
+    processes_impacts_full_json,
+    ingredients_food_json,
+    materials_textile_json,
+    processes_generic_impacts_json,
+):
+    settings.set("OUTPUT_DIR", str(tmp_path))
+    (tmp_path / "food").mkdir()
+    (tmp_path / "textile").mkdir()
+    create_activities("tests/activities_to_create.json")
+
+    export.export_all(plot=False, verbose=False, root_dir=TESTS_FIXTURE_DIR)
+
+    for path, expected in [
+        ("processes_impacts_full.json", processes_impacts_full_json),
+        ("food/ingredients.json", ingredients_food_json),
+        ("textile/materials.json", materials_textile_json),
+        ("processes_generic_impacts.json", processes_generic_impacts_json),
+    ]:
+        with open(tmp_path / path, "rb") as f:
+            assert orjson.loads(f.read()) == expected, path
+
+
+def test_processes_generic_from_memory(tmp_path, processes_impacts_full_json):
+    export_json(processes_impacts_full_json, tmp_path / "processes_impacts_full.json")
+    activities = [
+        {
+            "id": process["id"],
+            "scopes": process["scopes"],
+            "metadata": [{"id": process["id"], "scopes": process["scopes"]}],
+        }
+        for process in processes_impacts_full_json
+        if "object" in process["scopes"]
+    ]
+    # As returned by `activities_to_processes`, before being written to json
+    processes = [
+        {
+            **process,
+            "id": uuid.UUID(process["id"]),
+            "impacts": {
+                key: value * (1 + 1e-9) for key, value in process["impacts"].items()
+            },
+        }
+        for process in processes_impacts_full_json
+    ]
+
+    assert compute_processes_generic(
+        activities, tmp_path / "missing.json", processes=processes
+    ) == compute_processes_generic(activities, tmp_path / "processes_impacts_full.json")
+
+
+def test_land_occupations_already_added(mocker):
+    pool = mocker.patch.object(export_food, "Pool")
+    activities = [
+        {"metadata": [{"alias": "wheat", "scopes": ["food"], "landOccupation": 0.0}]}
+    ]
+
+    assert export_food.add_land_occupations(activities, 2) == activities
+    assert not pool.called
+
+
+def _record_stage(
+    scope, activities, root_dir, dirs_to_export_to, cpu_count, processes=None
+):
+    export_json(
+        {
+            "pid": os.getpid(),
+            "cpu_count": cpu_count,
+            "activities": activities,
+            "processes": processes,
+        },
+        root_dir / f"{scope.value}.json",
+    )
+
+
+def test_export_metadata_concurrently(tmp_path, mocker):
+    mocker.patch.dict(
+        export.METADATA_STAGES,
+        {scope: partial(_record_stage, scope) for scope in export.METADATA_STAGES},
+    )
+
+    export._export_metadata_concurrently(
+        [{"id": "wheat"}], [{"id": "flour"}], tmp_path, [tmp_path], cpu_count=7
+    )
+
+    stages = {
+        scope: orjson.loads((tmp_path / f"{scope.value}.json").read_bytes())
+        for scope in export.MetadataScope
+    }
+    assert {stage["cpu_count"] for stage in stages.values()} == {2}
+    assert os.getpid() not in {stage["pid"] for stage in stages.values()}
+    assert {stage["activities"][0]["id"] for stage in stages.values()} == {"wheat"}
+    assert stages[export.MetadataScope.generic]["processes"] == [{"id": "flour"}]
+    assert stages[export.MetadataScope.food]["processes"] is None
+    assert export._metadata_stages_inputs == {}
@@ -0,0 +1,66 @@
+import bw2data
+import bw2io
+import pytest
+
+from common.bw.workers import spawn_executor
+from common.import_ import write_migrations
+from common.import_scheduler import DatabaseImport, dependency_order
+
+
+def _import(dbname, external_db=None):
+    return DatabaseImport(dbname, f"{dbname}.csv.zip", "md5", external_db=external_db)
+
+
+def test_dependency_order(temp_bw_dir):
+    bw2data.projects.set_current("test-import-scheduler")
+    bw2data.Database("Ecoinvent 3.9.1").register()
+
+    imports = [
+        _import("Woolmark", external_db="Ecoinvent 3.11"),
+        _import("Ecoinvent 3.11"),
+        _import("Cotton", external_db="Ecoinvent 3.9.1"),
+    ]
+    order = [imp.dbname for imp in dependency_order(imports)]
+    assert order.index("Ecoinvent 3.11") < order.index("Woolmark")
+    assert sorted(order) == ["Cotton", "Ecoinvent 3.11", "Woolmark"]
+
+    with pytest.raises(ValueError, match="neither imported nor in the project"):
+        dependency_order([_import("Woolmark", external_db="Ecoinvent 3.10")])
+
+    with pytest.raises(ValueError, match="Circular dependencies"):
+        dependency_order([_import("A", external_db="B"), _import("B", external_db="A")])
+
+
+def test_write_migrations_only_once(temp_bw_dir, mocker):
+    bw2data.projects.set_current("test-import-scheduler")
+    migrations = [
+        {
+            "name": "test-fix",
+            "description": "Test fix",
+            "data": {"fields": ("name",), "data": [(("Diesel",), {"name": "Fuel"})]},
+        }
+    ]
+    write_migrations(migrations)
+    assert bw2io.Migration("test-fix").load()["data"] == [
+        [["Diesel"], {"name": "Fuel"}]
+    ]
+
+    write = mocker.spy(bw2io.Migration, "write")
+    write_migrations(migrations)
+    assert write.call_count == 0
+
+    migrations[0]["data"]["data"][0][1]["name"] = "Diesel fuel"
+    write_migrations(migrations)
+    assert write.call_count == 1
+
+
+def test_spawn_executor_in_a_new_brightway_directory(temp_bw_dir):
+    bw2data.projects.set_current("test-import-scheduler")
+    assert "default" not in bw2data.projects
+
+    # The workers all start at once, and would all create the default project
+    with spawn_executor(3) as executor:
+        assert list(executor.map(abs, range(-6, 0))) == [6, 5, 4, 3, 2, 1]
+
+    assert "default" in bw2data.projects
+    assert bw2data.projects.current == "test-import-scheduler"
@@ -0,0 +1,199 @@
+import copy
+
+import bw2data
+import pytest
+from bw2io.errors import StrategyError
+from bw2io.importers.base_lci import LCIImporter
+from bw2io.strategies.generic import link_iterable_by_fields
+from bw2io.utils import DEFAULT_FIELDS
+
+from common.import_ import add_unlinked_flows_to_biosphere_database
+from ecobalyse_data.bw.linking import (
+    TECHNOSPHERE_TYPES,
+    HashIndex,
+    Linker,
+    load_database_index,
+)
+
+
+@pytest.fixture
+def databases(temp_bw_dir):
+    bw2data.projects.set_current("test-linking")
+    bw2data.Database("biosphere").write(
+        {
+            ("biosphere", "co2"): {
+                "name": "Carbon dioxide, fossil",
+                "categories": ("air",),
+                "unit": "kilogram",
+                "type": "emission",
+            },
+        }
+    )
+    bw2data.Database("External").write(
+        {
+            ("External", "steel-fr"): {
+                "name": "Steel",
+                "unit": "kilogram",
+                "location": "FR",
+                "type": "process",
+            },
+            ("External", "water-glo"): {
+                "name": "Water",
+                "unit": "kilogram",
+                "location": "GLO",
+                "type": "processwithreferenceproduct",
+            },
+        }
+    )
+
+
+def _db():
+    return [
+        {
+            "database": "Imported",
+            "code": "wheat",
+            "name": "Wheat",
+            "unit": "kilogram",
+            "location": "FR",
+            "exchanges": [
+                {"name": "Wheat", "unit": "kilogram", "type": "production"},
+                {"name": "Seed", "unit": "kilogram", "type": "technosphere"},
+                {
+                    "name": "Steel",
+                    "unit": "kilogram",
+                    "location": "FR",
+                    "type": "technosphere",
+                },
+                {"name": "Water", "unit": "kilogram", "type": "technosphere"},
+                {"name": "Unknown", "unit": "kilogram", "type": "technosphere"},
+                {
+                    "name": "Carbon dioxide, fossil",
+                    "categories": ("air",),
+                    "unit": "kilogram",
+                    "type": "biosphere",
+                },
+            ],
+        },
+        {
+            "database": "Imported",
+            "code": "seed",
+            "name": "Seed",
+            "unit": "kilogram",
+            "location": "GLO",
+            "exchanges": [],
+        },
+    ]
+
+
+def _link_with_brightway(db, external_db_name, biosphere):
+    for fields in (("name", "unit", "location"), ("name", "unit")):
+        db = link_iterable_by_fields(
+            db, internal=True, kind=TECHNOSPHERE_TYPES, fields=fields
+        )
+    for fields in (("name", "unit", "location"), ("name", "unit")):
+        db = link_iterable_by_fields(
+            db,
+            (
+                obj
+                for obj in bw2data.Database(external_db_name)
+                if obj.get("type") in ("process", "processwithreferenceproduct")
+            ),
+            kind=TECHNOSPHERE_TYPES,
+            fields=fields,
+        )
+    return link_iterable_by_fields(
+        db, other=bw2data.Database(biosphere), kind="biosphere"
+    )
+
+
+def test_linker_links_like_brightway(databases):
+    linker = Linker(external_db_name="External", biosphere="biosphere")
+    db = _db()
+    for linking_pass in linker.strategies():
+        db = linking_pass(db)
+
+    assert db == _link_with_brightway(_db(), "External", "biosphere")
+    assert [exc.get("input") for exc in db[0]["exchanges"]] == [
+        ("Imported", "wheat"),
+        ("Imported", "seed"),
+        ("External", "steel-fr"),
+        ("External", "water-glo"),
+        None,
+        ("biosphere", "co2"),
+    ]
+    assert [(s.label, s.unlinked, s.linked) for s in linker.stats] == [
+        ("internal", 5, 0),
+        ("internal", 5, 2),
+        ("External", 3, 1),
+        ("External", 2, 1),
+        ("biosphere", 1, 1),
+    ]
+
+
+def test_indexes_are_built_once(databases):
+    linker = Linker(external_db_name="External", biosphere="biosphere")
+    db = _db()
+    indexes = []
+    for linking_pass in linker.strategies():
+        db = linking_pass(db)
+        indexes.append(linker.get_index(linking_pass.target, db))
+
+    assert len(linker.indexes) == 3
+    assert indexes[0] is indexes[1]
+    assert indexes[2] is indexes[3]
+
+
+def test_duplicate_candidates(databases):
+    db = _db()
+    db.append({**copy.deepcopy(db[1]), "code": "other-seed"})
+
+    linker = Linker()
+    internal, by_name_and_unit = linker.strategies()
+    internal(db)
+    with pytest.raises(StrategyError):
+        by_name_and_unit(db)
+
+
+def test_add_unlinked_flows_to_biosphere_database(databases, mocker):
+    co2_id = bw2data.get_node(database="biosphere", code="co2").id
+    importer = LCIImporter("Imported")
+    importer.data = _db()
+    importer.data[0]["exchanges"].append(
+        {
+            "name": "Methane, fossil",
+            "categories": ("air",),
+            "unit": "kilogram",
+            "type": "biosphere",
+        }
+    )
+    linker = Linker(biosphere="biosphere")
+    for linking_pass in linker.strategies():
+        importer.apply_strategy(linking_pass)
+
+    add_unlinked_flows_to_biosphere_database(importer, "biosphere", linker=linker)
+
+    biosphere = bw2data.Database("biosphere")
+    assert len(biosphere) == 2
+    # existing flows are not rewritten
+    assert bw2data.get_node(database="biosphere", code="co2").id == co2_id
+    methane = bw2data.get_node(database="biosphere", name="Methane, fossil")
+    assert importer.data[0]["exchanges"][-1]["input"] == methane.key
+
+    # the persisted index is up to date and reused
+    from_database = mocker.spy(HashIndex, "from_database")
+    index = load_database_index("biosphere", [DEFAULT_FIELDS])
+    assert from_database.call_count == 0
+    assert index.size == 2
+    assert methane.as_dict() in index
+
+
+def test_biosphere_index_is_reused_between_imports(databases, mocker):
+    from_database = mocker.spy(HashIndex, "from_database")
+
+    for _ in range(2):
+        db = _db()
+        for linking_pass in Linker(biosphere="biosphere").strategies():
+            linking_pass(db)
+        assert db[0]["exchanges"][-1]["input"] == ("biosphere", "co2")
+
+    assert from_database.call_count == 1
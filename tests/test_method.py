@@ -0,0 +1,72 @@
+import bw2data
+import pytest
+from bw2data.errors import UnknownObject
+
+from ecobalyse_data.bw.method import dedup_cfs, write_methods
+
+CLIMATE_CHANGE = ("EF 3.1", "Climate change")
+
+
+@pytest.fixture
+def biosphere(temp_bw_dir):
+    bw2data.projects.set_current("test-method")
+    bw2data.Database("biosphere3").write(
+        {
+            ("biosphere3", code): {"name": name, "unit": "kilogram", "type": "emission"}
+            for code, name in [("co2", "Carbon dioxide"), ("ch4", "Methane")]
+        }
+    )
+
+
+def _method(*cfs):
+    return {
+        "name": CLIMATE_CHANGE,
+        "description": "",
+        "filename": "ef31.csv",
+        "unit": "kg CO2 eq",
+        "exchanges": [
+            {"input": ("biosphere3", code), "amount": amount} for code, amount in cfs
+        ],
+    }
+
+
+def test_write_methods(biosphere):
+    write_methods([_method(("co2", 1.0), ("ch4", 29.8))])
+
+    ids = {
+        code: bw2data.get_node(database="biosphere3", code=code).id
+        for code in ("co2", "ch4")
+    }
+    assert bw2data.Method(CLIMATE_CHANGE).load() == [
+        (ids["co2"], 1.0),
+        (ids["ch4"], 29.8),
+    ]
+    assert bw2data.methods[CLIMATE_CHANGE]["num_cfs"] == 2
+
+    with pytest.raises(ValueError, match="already exists"):
+        write_methods([_method(("co2", 1.0))])
+    write_methods([_method(("co2", 1.0))], overwrite=True)
+    assert bw2data.Method(CLIMATE_CHANGE).load() == [(ids["co2"], 1.0)]
+
+
+def test_write_methods_with_unknown_flow(biosphere):
+    with pytest.raises(UnknownObject):
+        write_methods([_method(("n2o", 273.0))])
+
+
+def test_patched_method_write(biosphere):
+    bw2data.Method(CLIMATE_CHANGE).write([(("biosphere3", "ch4"), 29.8)])
+
+    ch4 = bw2data.get_node(database="biosphere3", code="ch4")
+    assert bw2data.Method(CLIMATE_CHANGE).load() == [(ch4.id, 29.8)]
+
+
+def test_dedup_cfs():
+    co2 = {"name": "Carbon dioxide", "categories": ("air",), "amount": 1.0}
+    ch4 = {"name": "Methane", "categories": ("air",), "amount": 29.8}
+
+    assert dedup_cfs([co2, ch4, dict(co2), {**co2, "amount": 2.0}]) == [
+        co2,
+        ch4,
+        {**co2, "amount": 2.0},
+    ]
@@ -0,0 +1,164 @@
+import pickle
+import uuid
+
+import pytest
+from pydantic import ValidationError, field_validator
+
+from ecobalyse_data.computation import activity_to_process_with_impacts
+from models.process import (
+    ActivityRef,
+    EcoModel,
+    Impacts,
+    IngredientMetadata,
+    Process,
+    ProcessGeneric,
+    Scope,
+    serialize_all,
+)
+
+
+def _generic(**fields):
+    return {
+        "activity_name": "Wood, at plant",
+        "categories": ["material"],
+        "comment": "",
+        "display_name": "Wood",
+        "elec_mj": 0,
+        "heat_mj": 1,
+        "id": str(uuid.uuid4()),
+        "impacts": {"cch": 1, "etf-c": 0.5},
+        "location": None,
+        "mass_per_unit": None,
+        "scopes": ["object"],
+        "source": "Ecoinvent 3.9.1",
+        "unit": "kg",
+        "waste": 0,
+        **fields,
+    }
+
+
+def _dump(model, records, exclude=None):
+    return [
+        model(**record).model_dump(by_alias=True, exclude=exclude) for record in records
+    ]
+
+
+def test_serialize_all():
+    records = [
+        _generic(),
+        _generic(alias="wood", land_occupation=2, impacts={}),
+        _generic(
+            metadata={
+                "forest_management": "intensivePlantation",
+                "complements": {"forest": 1.5},
+            }
+        ),
+        _generic(metadata={"ingredient": None}),
+    ]
+
+    serialized = serialize_all(ProcessGeneric, records)
+
+    assert serialized == _dump(ProcessGeneric, records)
+    assert serialized[0]["elecMJ"] == 0.0
+    assert serialized[0]["scopes"] == [Scope.object]
+    assert serialized[2]["metadata"]["complements"]["forest"] == 1.5
+    assert [list(s) for s in serialized] == [
+        list(s) for s in _dump(ProcessGeneric, records)
+    ]
+
+
+def test_serialize_all_exclude():
+    records = [
+        {
+            **_generic(),
+            "bw_activity": {"name": "Wood"},
+            "computed_by": "brightway",
+            "impacts": Impacts(cch=2),
+        },
+        {**_generic(), "bw_activity": None, "computed_by": None, "id": None},
+    ]
+    exclude = {"bw_activity", "computed_by"}
+
+    assert serialize_all(Process, records, exclude) == _dump(Process, records, exclude)
+
+
+def test_serialize_all_invalid():
+    with pytest.raises(ValidationError, match="not lowercase"):
+        serialize_all(ProcessGeneric, [_generic(), _generic(alias="Wood")])
+
+    with pytest.raises(ValidationError, match="default_origin"):
+        serialize_all(IngredientMetadata, [{"density": 1}])
+
+
+def test_serialize_all_with_validators():
+    class Named(EcoModel):
+        name: str
+
+        @field_validator("name")
+        @classmethod
+        def upper(cls, value):
+            return value.upper()
+
+    assert serialize_all(Named, [{"name": "wood"}]) == [{"name": "WOOD"}]
+
+
+class _Activity(dict):
+    """A Brightway activity, without the database"""
+
+    @property
+    def _data(self):
+        return self
+
+
+def test_process_keeps_an_activity_ref():
+    bw_activity = _Activity(
+        {
+            "code": "abc",
+            "database": "Ecobalyse",
+            "location": "FR",
+            "name": "Pot, at plant",
+            "parameters": {"PACKAGING_SYSTEM_G": {"amount": 44}},
+            "unit": "kilogram",
+        }
+    )
+    process = activity_to_process_with_impacts(
+        eco_activity={
+            "categories": ["packaging"],
+            "id": str(uuid.uuid4()),
+            "source": "Ecobalyse",
+            "unit": "item",
+        },
+        impacts=None,
+        computed_by=None,
+        bw_activity=bw_activity,
+    )
+
+    assert process.bw_activity == ActivityRef(
+        database="Ecobalyse",
+        code="abc",
+        name="Pot, at plant",
+        location="FR",
+        unit="kg",
+    )
+    assert process.bw_activity.key == ("Ecobalyse", "abc")
+    assert process.mass_per_unit == 0.044
+    # The activity, that can be shared by the searches, is left untouched
+    assert bw_activity["unit"] == "kilogram"
+    assert process.unit == "item"
+    assert pickle.loads(pickle.dumps(process)) == process
+
+
+def test_hardcoded_process_has_no_activity_ref():
+    process = activity_to_process_with_impacts(
+        eco_activity={
+            "displayName": "Custom",
+            "id": str(uuid.uuid4()),
+            "source": "Custom",
+            "unit": "kg",
+        },
+        impacts=None,
+        computed_by=None,
+    )
+
+    assert process.bw_activity is None
+    assert process.unit == "kg"
@@ -0,0 +1,76 @@
+import pytest
+
+from bin import compare_import_reports
+from ecobalyse_data.bw.profiling import Profiler, compare_reports, load_report
+from ecobalyse_data.bw.strategy import dataset_strategy
+
+
+class Importer:
+    def __init__(self, data, strategies):
+        self.data = data
+        self.strategies = strategies
+
+    def apply_strategy(self, strategy, verbose=True):
+        self.data = strategy(self.data)
+
+
+@dataset_strategy
+def drop_empty(ds):
+    return ds if ds["exchanges"] else None
+
+
+@dataset_strategy
+def add_water(ds):
+    return {**ds, "exchanges": ds["exchanges"] + [{"name": "Water"}]}
+
+
+def _importer():
+    return Importer(
+        [
+            {"name": "Wheat", "exchanges": [{"name": "Diesel"}]},
+            {"name": "Empty", "exchanges": []},
+        ],
+        [drop_empty, add_water],
+    )
+
+
+def test_profile_strategies():
+    profiler = Profiler("Agb")
+    profiler.apply_strategies(_importer())
+
+    assert [
+        (stage.name, stage.datasets, stage.exchanges) for stage in profiler.stages
+    ] == [("strategies/drop_empty", 1, 1), ("strategies/add_water", 1, 2)]
+    assert all(stage.wall_time >= 0 and stage.peak_rss > 0 for stage in profiler.stages)
+
+
+def test_failed_stage():
+    profiler = Profiler("Agb")
+    with pytest.raises(ValueError):
+        with profiler.stage("extract", data=lambda: None):
+            raise ValueError("Unexpected activity name")
+
+    assert [(stage.name, stage.datasets) for stage in profiler.stages] == [
+        ("extract", None)
+    ]
+
+
+def test_compare_reports(tmp_path, capsys):
+    before = Profiler("Agb")
+    before.apply_strategies(_importer(), [drop_empty])
+    after = Profiler("Agb")
+    after.apply_strategies(_importer(), [add_water])
+
+    before_path = before.save(tmp_path / "before")
+    after_path = after.save(tmp_path / "after")
+    assert load_report(after_path)["stages"][0]["exchanges"] == 3
+
+    rows = compare_reports(load_report(before_path), load_report(after_path))
+    assert [(row["name"], bool(row["before"]), bool(row["after"])) for row in rows] == [
+        ("strategies/add_water", False, True),
+        ("strategies/drop_empty", True, False),
+        ("total", True, True),
+    ]
+
+    compare_import_reports.main(before_path, after_path)
+    assert "total" in capsys.readouterr().out
@@ -0,0 +1,103 @@
+import hashlib
+import io
+
+import pytest
+from botocore.response import StreamingBody
+
+from config import settings
+from ecobalyse_data import s3
+
+
+class LocalS3:
+    """A local stand-in for the S3 client, serving `objects` from memory"""
+
+    def __init__(self, objects):
+        self.objects = objects
+        self.ranges = []
+        self.fail_at = None
+
+    def head_object(self, Bucket, Key):
+        data = self.objects[Key]
+        return {
+            "ContentLength": len(data),
+            "ETag": f'"{hashlib.md5(data).hexdigest()}"',
+        }
+
+    def get_object(self, Bucket, Key, Range):
+        start, end = (int(bound) for bound in Range.removeprefix("bytes=").split("-"))
+        self.ranges.append((Key, start, end))
+        data = self.objects[Key][start : end + 1]
+        if self.fail_at is not None and start <= self.fail_at <= end:
+            # The connection drops in the middle of the part
+            self.fail_at = None
+            data = data[: len(data) // 2]
+            return {"Body": FailingBody(io.BytesIO(data), len(data))}
+        return {"Body": StreamingBody(io.BytesIO(data), len(data))}
+
+
+class FailingBody(StreamingBody):
+    def iter_chunks(self, chunk_size):
+        yield from super().iter_chunks(chunk_size)
+        raise ConnectionError("Connection reset by peer")
+
+
+FILES = {
+    "db/wool.CSV.zip": b"wool " * 20,
+    "method.CSV.zip": b"method " * 3,
+}
+
+
+@pytest.fixture
+def bucket(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "S3_BUCKET", "ecobalyse", raising=False)
+    monkeypatch.setattr(settings, "S3_DB_PREFIX", "dbfiles", raising=False)
+    monkeypatch.setattr(s3, "DB_CACHE_PATH", tmp_path)
+    monkeypatch.setattr(s3, "PART_SIZE", 16)
+    client = LocalS3({f"dbfiles/{path}": data for path, data in FILES.items()})
+    monkeypatch.setattr(s3.S3Client, "_client", client)
+    return client
+
+
+def _md5(data):
+    return hashlib.md5(data).hexdigest()
+
+
+def test_prefetch(bucket, tmp_path):
+    files = [(path, _md5(data)) for path, data in FILES.items()]
+    local_filepaths = s3.prefetch(files, max_concurrency=4)
+
+    assert [path.read_bytes() for path in local_filepaths] == list(FILES.values())
+    # 100 bytes in parts of 16 bytes, 21 bytes in 2 parts
+    assert len(bucket.ranges) == 7 + 2
+    assert not list(tmp_path.glob("**/*.parts"))
+
+    s3.prefetch(files)
+    assert len(bucket.ranges) == 7 + 2
+
+
+def test_resume_download(bucket, tmp_path):
+    path = "db/wool.CSV.zip"
+    bucket.fail_at = 40
+    with pytest.raises(ConnectionError):
+        s3.get_file(path, _md5(FILES[path]))
+    assert not (tmp_path / path).exists()
+
+    bucket.ranges = []
+    assert s3.get_file(path, _md5(FILES[path])).read_bytes() == FILES[path]
+    # Only the end of the interrupted part is downloaded again
+    assert bucket.ranges == [(f"dbfiles/{path}", 40, 47)]
+
+
+def test_checksum_sidecar(bucket, tmp_path, mocker):
+    path = "method.CSV.zip"
+    s3.get_file(path, _md5(FILES[path]))
+
+    file_digest = mocker.spy(s3, "file_digest")
+    s3.get_file(path, _md5(FILES[path]))
+    assert file_digest.call_count == 0
+
+    # A modified file is hashed again
+    (tmp_path / path).write_bytes(b"modified")
+    with pytest.raises(AssertionError, match="different than the expected one"):
+        s3.get_file(path, _md5(FILES[path]))
+    assert file_digest.call_count == 1
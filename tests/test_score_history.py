@@ -0,0 +1,245 @@
+import threading
+import time
+
+import pytest
+import requests
+
+from common.score_history.api_client import ScoreApiClient, query_hash
+
+
+class FakeResponse:
+    def __init__(self, content, status_code=200):
+        self.content = content
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Error")
+
+    def json(self):
+        return self.content
+
+
+class FakeSession:
+    """Answer the simulations with the mass of the query, and keep track of the
+    requests in flight"""
+
+    def __init__(self, version={"hash": "abc123", "tag": "v1.0.0"}, delay=0.0):
+        self.version = version
+        self.delay = delay
+        self.posts = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def get(self, url, timeout=None):
+        return FakeResponse(self.version)
+
+    def post(self, url, json=None, timeout=None):
+        with self.lock:
+            self.posts.append((url, json))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self.lock:
+            self.in_flight -= 1
+        if json.get("mass") is None:
+            return FakeResponse({"error": "missing mass"}, status_code=400)
+        return FakeResponse({"url": url, "mass": json["mass"]})
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    data_dir = tmp_path / "data"
+    (data_dir / "textile").mkdir(parents=True)
+    (data_dir / "impacts.json").write_text('{"cch": {}}')
+    (data_dir / "textile" / "materials.json").write_text("[]")
+    return data_dir
+
+
+def _client(cache_dir, session, data_dir=None, **kwargs):
+    return ScoreApiClient(
+        "http://api/",
+        data_dir=data_dir,
+        cache_dir=cache_dir / "cache",
+        session=session,
+        **kwargs,
+    )
+
+
+def _examples(count):
+    return [{"id": str(i), "query": {"mass": i, "materials": []}} for i in range(count)]
+
+
+def test_query_hash_ignores_the_keys_order():
+    assert query_hash({"a": 1, "b": [1, 2]}) == query_hash({"b": [1, 2], "a": 1})
+    assert query_hash({"a": 1}) != query_hash({"a": 2})
+
+
+def test_compute_scores_for_examples(tmp_path, data_dir):
+    session = FakeSession(delay=0.01)
+    client = _client(tmp_path, session, data_dir, concurrency=3)
+
+    examples = client.compute_scores_for_examples(_examples(10), "/api/textile")
+
+    assert client.api_version == "v1.0.0"
+    assert [example["response"]["mass"] for example in examples] == list(range(10))
+    assert examples[0]["response"]["url"] == "http://api/api/textile"
+    assert len(session.posts) == 10
+    assert 1 < session.max_in_flight <= 3
+
+
+def test_unchanged_examples_are_not_simulated_again(tmp_path, data_dir):
+    session = FakeSession()
+    _client(tmp_path, session, data_dir).compute_scores_for_examples(
+        _examples(4), "/api/textile"
+    )
+
+    client = _client(tmp_path, session, data_dir)
+    examples = client.compute_scores_for_examples(_examples(6), "/api/textile")
+
+    assert client.simulated == 2
+    assert len(session.posts) == 6
+    assert [example["response"]["mass"] for example in examples] == list(range(6))
+
+    # The responses of another endpoint are not reused
+    client.compute_scores_for_examples(_examples(1), "/api/food")
+    assert len(session.posts) == 7
+
+
+def test_cache_of_a_new_commit_with_the_same_data(tmp_path, data_dir):
+    session = FakeSession()
+    _client(tmp_path, session, data_dir).compute_scores_for_examples(
+        _examples(2), "/api/textile"
+    )
+
+    session.version = {"hash": "def456", "tag": "v1.0.0"}
+    client = _client(tmp_path, session, data_dir)
+    client.compute_scores_for_examples(_examples(2), "/api/textile")
+    assert client.simulated == 0
+
+    # A change of the data, or a new release, can change the scores
+    (data_dir / "textile" / "materials.json").write_text('[{"id": "coton"}]')
+    client = _client(tmp_path, session, data_dir)
+    client.compute_scores_for_examples(_examples(2), "/api/textile")
+    assert client.simulated == 2
+
+    session.version = {"hash": "def456", "tag": "v1.1.0"}
+    client = _client(tmp_path, session, data_dir)
+    client.compute_scores_for_examples(_examples(2), "/api/textile")
+    assert client.simulated == 2
+
+
+def test_nothing_is_cached_without_data(tmp_path):
+    session = FakeSession()
+    client = _client(tmp_path, session, data_dir=tmp_path / "missing")
+
+    client.compute_scores_for_examples(_examples(2), "/api/textile")
+    client.compute_scores_for_examples(_examples(2), "/api/textile")
+
+    assert client.cache is None
+    assert len(session.posts) == 4
+    assert not (tmp_path / "cache").exists()
+
+
+def test_failed_simulations_are_not_cached(tmp_path, data_dir):
+    session = FakeSession()
+    client = _client(tmp_path, session, data_dir)
+
+    with pytest.raises(requests.HTTPError):
+        client.compute_scores_for_examples([{"query": {}}], "/api/textile")
+
+    assert not any(tmp_path.rglob("cache/**/*.json"))
+
+
+@pytest.fixture
+def score_history(mocker):
+    # The dependencies of the score history job are not the ones of the project
+    pytest.importorskip("sqlalchemy")
+    from common.score_history import score_history
+
+    mocker.patch.object(
+        score_history,
+        "compute_normalization_factors",
+        return_value={"cch": 0.5, "ecs": 0},
+    )
+    return score_history
+
+
+def test_get_new_score_textile(score_history):
+    example = {
+        "id": "1",
+        "name": "Tshirt",
+        "query": {"mass": 0.17, "materials": [{"id": "coton"}]},
+        "response": {
+            "impacts": {"cch": 2.0, "ecs": 10.0},
+            "complementsImpacts": {"microfibers": -1.5},
+            "lifeCycle": [
+                {"label": "Spinning", "country": {"code": "CN"}, "impacts": {"cch": 1}}
+            ],
+            "transport": {"impacts": {"cch": 0.25}},
+        },
+    }
+
+    df = score_history.get_new_score("textile", [example], "master", "abc1234")
+
+    assert list(df.columns) == score_history.SCORE_COLUMNS
+    assert df[
+        ["lifecycle_step", "lifecycle_step_country", "impact"]
+    ].values.tolist() == [
+        ["Total", "", "cch"],
+        ["Total", "", "ecs"],
+        ["Total", "", "microfibers"],
+        ["Spinning", "CN", "cch"],
+        ["Transport", "", "cch"],
+    ]
+    assert df["value"].tolist() == [2.0, 10.0, 0, 1.0, 0.25]
+    assert df["norm_value_ecs"].tolist() == [1e6, 0, -1.5, 5e5, 1.25e5]
+    assert set(df["mass"]) == {0.17}
+    assert set(df["elements"]) == {'[{"id": "coton"}]'}
+    # The query of an example is serialized once for all its rows
+    assert len({id(query) for query in df["query"]}) == 1
+
+
+def test_get_new_score_food(score_history):
+    impacts = {"cch": 1.0}
+    examples = [
+        {
+            "id": str(index),
+            "name": f"Recipe {index}",
+            "query": {"ingredients": [{"id": "carrot", "mass": 100 * index}]},
+            "response": {
+                "results": {
+                    "preparedMass": 0.1 * index,
+                    "recipe": {
+                        "ingredientsTotal": impacts,
+                        "totalBonusImpact": {"hedges": 2.0},
+                        "transform": impacts,
+                    },
+                    "packaging": impacts,
+                    "preparation": impacts,
+                    "transports": {"impacts": impacts},
+                    # No distribution
+                }
+            },
+        }
+        for index in range(1, 3)
+    ]
+
+    df = score_history.get_new_score("food", examples, "master", "abc1234")
+
+    assert len(df) == 2 * 6
+    assert df["lifecycle_step"].tolist()[:6] == [
+        "ingredients",
+        "ingredients",
+        "transformation",
+        "packaging",
+        "preparation",
+        "transports",
+    ]
+    assert df["product_name"].tolist() == ["Recipe 1"] * 6 + ["Recipe 2"] * 6
+    assert df["mass"].tolist() == [0.1] * 6 + [0.2] * 6
+    assert df["norm_value_ecs"].tolist()[:3] == [5e5, 2.0, 5e5]
+
+    with pytest.raises(ValueError, match="Invalid domain"):
+        score_history.get_new_score("object", examples, "master", "abc1234")
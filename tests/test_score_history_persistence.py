@@ -0,0 +1,186 @@
+import uuid
+from decimal import Decimal
+
+import pandas as pd
+import pytest
+
+# The dependencies of the score history job are not the ones of the project
+sqlalchemy = pytest.importorskip("sqlalchemy")
+
+from common.score_history.persistence import (  # noqa: E402
+    ScoreHistoryStore,
+    _copy_insert,
+    are_scores_different,
+    score_hash,
+)
+
+SCORE_HISTORY_SQL = """CREATE TABLE score_history (
+datetime timestamp NOT NULL,
+branch text NOT NULL,
+"commit" text NOT NULL,
+domain text NOT NULL,
+product_name text NOT NULL,
+id uuid NOT NULL,
+query text NOT NULL,
+mass numeric NOT NULL,
+elements text NOT NULL,
+lifecycle_step text NOT NULL,
+lifecycle_step_country text NOT NULL,
+impact text NOT NULL,
+value numeric NOT NULL,
+norm_value_ecs numeric NOT NULL
+)"""
+
+PRODUCT_ID = str(uuid.uuid4())
+
+
+def _scores(commit="abc1234", cch=1.5, branch="master"):
+    return pd.DataFrame(
+        {
+            "datetime": "2026-01-01 00:00:00",
+            "branch": branch,
+            "commit": commit,
+            "domain": "textile",
+            "product_name": "Tshirt",
+            "id": PRODUCT_ID,
+            "query": '{"mass": 0.17}',
+            "mass": 0.17,
+            "elements": "[]",
+            "lifecycle_step": ["Total", "Total", "Transport"],
+            "lifecycle_step_country": "",
+            "impact": ["cch", "ecs", "cch"],
+            "value": [cch, 100.0, 0.25],
+            "norm_value_ecs": [2.0, 100.0, 0.5],
+        }
+    )
+
+
+@pytest.fixture
+def store(tmp_path):
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'scores.db'}")
+    with engine.begin() as conn:
+        conn.execute(sqlalchemy.text(SCORE_HISTORY_SQL))
+    store = ScoreHistoryStore(engine)
+    store.create_tables()
+    return store
+
+
+def _history(store):
+    with store.engine.connect() as conn:
+        return pd.read_sql(sqlalchemy.text("SELECT * FROM score_history"), conn)
+
+
+def test_score_hash():
+    scores = _scores()
+
+    # The order of the rows, the commit and the types of the values don't matter
+    reordered = scores.iloc[::-1].assign(commit="def5678")
+    reordered["value"] = [Decimal(str(value)) for value in reordered["value"]]
+    reordered["id"] = [uuid.UUID(id) for id in reordered["id"]]
+    assert score_hash(reordered) == score_hash(scores)
+
+    # Within the tolerance
+    assert score_hash(_scores(cch=1.50001)) == score_hash(scores)
+    assert score_hash(_scores(cch=1.6)) != score_hash(scores)
+
+
+def test_record(store):
+    assert store.is_new_commit("abc1234")
+    assert store.latest_hash("master", "textile") is None
+
+    assert store.record("master", "textile", "abc1234", _scores())
+    assert not store.is_new_commit("abc1234")
+    assert store.latest_hash("master", "textile") == score_hash(_scores())
+
+    # The same scores are not stored again, but the commit is known
+    assert not store.record("master", "textile", "def5678", _scores("def5678"))
+    assert not store.is_new_commit("def5678")
+    assert len(_history(store)) == 3
+
+    assert store.record("master", "textile", "0123456", _scores("0123456", cch=2))
+    history = _history(store)
+    assert len(history) == 6
+    assert set(history["commit"]) == {"abc1234", "0123456"}
+    assert store.latest_hash("master", "textile") == score_hash(_scores(cch=2))
+
+    # Each branch has its own latest scores
+    assert store.record("dev", "textile", "789abcd", _scores(branch="dev"))
+
+    # Commits that are no longer the latest of their branch are still known
+    assert not store.is_new_commit("abc1234")
+    assert not store.is_new_commit("def5678")
+    assert store.is_new_commit("fedcba9")
+
+
+def test_record_within_the_tolerance(store):
+    assert store.record("master", "textile", "abc1234", _scores("abc1234", cch=0.00004))
+
+    # Within the tolerance, but not rounded to the same value
+    assert score_hash(_scores(cch=0.00006)) != score_hash(_scores(cch=0.00004))
+    assert not store.record(
+        "master", "textile", "def5678", _scores("def5678", cch=0.00006)
+    )
+    # Compared with the stored scores, not with the previous ones
+    assert not store.record(
+        "master", "textile", "0123456", _scores("0123456", cch=0.00012)
+    )
+    assert store.record("master", "textile", "789abcd", _scores("789abcd", cch=0.0002))
+    assert set(_history(store)["commit"]) == {"abc1234", "789abcd"}
+
+
+def test_are_scores_different():
+    scores = _scores()
+    reordered = scores.iloc[::-1].assign(commit="def5678")
+    reordered["value"] = [Decimal(str(value)) for value in reordered["value"]]
+    assert not are_scores_different(scores, reordered)
+    assert not are_scores_different(scores, _scores(cch=1.50009))
+    assert are_scores_different(scores, _scores(cch=1.5002))
+    assert are_scores_different(scores, scores.iloc[:2])
+    assert are_scores_different(scores.iloc[:2], scores)
+
+
+def test_latest_hash_of_the_history(store):
+    # Scores stored before the latest hashes were kept
+    with store.engine.begin() as conn:
+        _scores("abc1234", cch=1).assign(datetime="2025-01-01 00:00:00").to_sql(
+            "score_history", con=conn, if_exists="append", index=False
+        )
+        _scores("def5678").to_sql(
+            "score_history", con=conn, if_exists="append", index=False
+        )
+
+    assert store.latest_hash("master", "textile") == score_hash(_scores())
+    assert not store.record("master", "textile", "0123456", _scores("0123456"))
+    assert len(_history(store)) == 6
+
+
+def test_copy_insert():
+    class Cursor:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            pass
+
+        def copy_expert(self, sql, file):
+            self.sql, self.content = sql, file.read()
+
+    cursor = Cursor()
+
+    class Table:
+        schema, name = None, "score_history"
+
+    class Connection:
+        class connection:
+            @staticmethod
+            def cursor():
+                return cursor
+
+    _copy_insert(
+        Table, Connection, ["branch", "value"], iter([("master", Decimal("1.5"))])
+    )
+
+    assert cursor.sql == (
+        'COPY score_history ("branch", "value") FROM STDIN WITH (FORMAT csv)'
+    )
+    assert cursor.content == "master,1.5\r\n"
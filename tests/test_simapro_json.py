@@ -0,0 +1,122 @@
+import io
+import zipfile
+
+import orjson
+from bw2io.extractors.simapro_csv import SimaProCSVExtractor
+
+from common import patch_agb3
+from common.bw.simapro_json import (
+    _sanitize_undefined_cp1252_bytes,
+    export_zipped_csv_to_json,
+    preprocess_simapro_csv,
+)
+
+SIMAPRO_CSV = (
+    b"{SimaPro 9.5.0.0}\r\n{processes}\r\n{Date: 01/03/2005}\r\n{Project: Test}\r\n"
+    b"{CSV Format version: 9.0.0}\r\n{CSV separator: Semicolon}\r\n"
+    b"{Decimal separator: ,}\r\n{Date separator: /}\r\n"
+    b"{Short date format: dd/MM/yyyy}\r\n\r\n"
+    b"Process\r\n\r\nCategory type\r\nmaterial\r\n\r\n"
+    b"Process identifier\r\nEI3CQUNI000000000000001\r\n\r\n"
+    b"Type\r\nUnit process\r\n\r\nProcess name\r\nWheat yield\r\n\r\n"
+    b"Date\r\n01/03/2005\r\n\r\nComment\r\nstray \x81 bytes \x9d\r\n\r\n"
+    b"Products\r\n"
+    b"Wheat, at farm {FR} U;kg;1;100;not defined;Agricultural\\Plant production\r\n\r\n"
+    b"Materials/fuels\r\n"
+    b"Fertiliser {FR}| market | Cut-off, U;kg;0,5;Undefined;0;0;0;yield comment\r\n\r\n"
+    b"Emissions to air\r\nCarbon dioxide, fossil;;kg;0,1;Undefined;0;0;0;\r\n\r\n"
+    b"End\r\n\r\n"
+)
+
+
+def test_preprocess_simapro_csv_by_chunks():
+    expected = _sanitize_undefined_cp1252_bytes(patch_agb3(SIMAPRO_CSV))
+
+    for chunk_size in (1, 7, 64, len(SIMAPRO_CSV)):
+        chunks = list(
+            preprocess_simapro_csv(
+                io.BytesIO(SIMAPRO_CSV), patch=patch_agb3, chunk_size=chunk_size
+            )
+        )
+        assert b"".join(chunks) == expected
+        # patches only see whole lines
+        assert all(chunk.endswith(b"\n") for chunk in chunks)
+
+
+def test_export_zipped_csv_to_json(tmp_path):
+    zip_path = tmp_path / "AGB3.csv.zip"
+    with zipfile.ZipFile(zip_path, "w") as zf:
+        zf.writestr("AGB3.csv", SIMAPRO_CSV)
+
+    export_zipped_csv_to_json(zip_path, tmp_path / "AGB3.json", "Agribalyse")
+    data = orjson.loads((tmp_path / "AGB3.json").read_bytes())["data"]
+
+    csv_path = tmp_path / "AGB3.csv"
+    csv_path.write_bytes(_sanitize_undefined_cp1252_bytes(patch_agb3(SIMAPRO_CSV)))
+    expected, _, _ = SimaProCSVExtractor.extract(
+        filepath=str(csv_path), name="Agribalyse", delimiter=";", encoding="cp1252"
+    )
+    for ds in expected:
+        ds["database"] = "Agribalyse"
+        ds["filename"] = "AGB3.csv"
+
+    assert data == orjson.loads(orjson.dumps(expected))
+    assert data[0]["simapro metadata"]["Process name"] == "Wheat Yield_"
+    assert data[0]["simapro metadata"]["Comment"] == "stray ? bytes ?"
+
+
+def _simapro_csv_with_processes(count):
+    header, _, _ = SIMAPRO_CSV.partition(b"Process\r\n")
+    processes = [
+        b"Process\r\n\r\n"
+        b"Process identifier\r\nEI3CQUNI0000000000000%02d\r\n\r\n"
+        b"Process name\r\nWheat %d\r\n\r\n"
+        b"Products\r\n"
+        b"Wheat %d {FR} U;kg;1;100;not defined;Agricultural\\Plant production\r\n\r\n"
+        b"Materials/fuels\r\n"
+        b"Fertiliser {FR}| market | Cut-off, U;kg;dose*area;Undefined;0;0;0;\r\n\r\n"
+        b"Input parameters\r\ndose;0,%d;Undefined;0;0;0;No;\r\n\r\n"
+        b"Calculated parameters\r\nsurface;area*2;\r\n\r\n"
+        b"End\r\n\r\n" % (i, i, i, i + 1)
+        for i in range(count)
+    ]
+    footer = (
+        b"Database Input parameters\r\narea;10;Undefined;0;0;0;No;\r\n\r\n"
+        b"Process\r\n\r\nProcess name\r\nAfter the end of the datasets\r\n\r\nEnd\r\n"
+    )
+    return header + b"".join(processes) + footer
+
+
+def test_parallel_extraction_equals_sequential_extraction(tmp_path):
+    content = _simapro_csv_with_processes(40)
+    zip_path = tmp_path / "WFLDB.csv.zip"
+    with zipfile.ZipFile(zip_path, "w") as zf:
+        zf.writestr("WFLDB.csv", content)
+
+    export_zipped_csv_to_json(zip_path, tmp_path / "sequential.json", "WFLDB")
+    export_zipped_csv_to_json(
+        zip_path, tmp_path / "parallel.json", "WFLDB", cpu_count=2
+    )
+
+    sequential = (tmp_path / "sequential.json").read_bytes()
+    assert (tmp_path / "parallel.json").read_bytes() == sequential
+
+    csv_path = tmp_path / "WFLDB.csv"
+    csv_path.write_bytes(content)
+    expected, global_parameters, metadata = SimaProCSVExtractor.extract(
+        filepath=str(csv_path), name="WFLDB", delimiter=";", encoding="cp1252"
+    )
+    for ds in expected:
+        ds["filename"] = "WFLDB.csv"
+    assert sequential == orjson.dumps(
+        {
+            "data": expected,
+            "global_parameters": global_parameters,
+            "metadata": metadata,
+        }
+    )
+
+    extracted = orjson.loads(sequential)
+    assert len(extracted["data"]) == 40
+    assert extracted["global_parameters"]["AREA"]["amount"] == 10
+    assert extracted["data"][3]["exchanges"][1]["formula"] == "DOSE*AREA"
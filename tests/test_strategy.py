@@ -0,0 +1,212 @@
+import copy
+import functools
+
+from bw2io.strategies import (
+    migrate_exchanges,
+    normalize_units,
+    set_code_by_activity_hash,
+    split_simapro_name_geo,
+)
+
+from ecobalyse_data.bw.parallel import ShardedStrategy, parallelize_strategies
+from ecobalyse_data.bw.strategy import (
+    FusedStrategy,
+    extract_ciqual,
+    extract_simapro_location,
+    extract_simapro_metadata,
+    extract_tags,
+    fix_lentil_ldu,
+    fuse_strategies,
+    lower_formula_parameters,
+    noLT,
+    remove_acetamiprid,
+    remove_azadirachtine,
+    remove_creosote,
+    remove_negative_land_use_on_tomato,
+    remove_some_processes,
+    uraniumFRU,
+)
+
+STRATEGIES = [
+    lower_formula_parameters,
+    remove_some_processes,
+    extract_simapro_metadata,
+    extract_simapro_location,
+    extract_ciqual,
+    extract_tags,
+    remove_azadirachtine,
+    remove_negative_land_use_on_tomato,
+    remove_creosote,
+    remove_acetamiprid,
+    fix_lentil_ldu,
+]
+
+
+def _db():
+    return [
+        {
+            "name": "Lentil, conventional, at farm gate {FR} U [Ciqual code: 20504]",
+            "simapro metadata": {
+                "Comment": "The overall DQR of this product is: 2.1 {P: 2.0, TiR: 2.2, GR: 1.5, TeR: 2.7}",
+                "Process identifier": "EI3CQUNI000000000000001",
+                "Status": "Unspecified",
+            },
+            "simapro name": "Lentil",
+            "filename": "agb.csv",
+            "parameters": {"yield": {"amount": 1, "formula": "A*B"}},
+            "exchanges": [
+                {"name": "Transformation, from unspecified", "amount": 1},
+                {"name": "Acetamiprid", "amount": 0.1},
+                {"name": "Azadirachtin", "amount": 0.1},
+            ],
+        },
+        {
+            "name": "Plastic tunnel, at plant/GLO U",
+            "exchanges": [
+                {"name": "Transformation, from urban, discontinuously built"},
+                {"name": "Steel"},
+            ],
+        },
+        {
+            "name": "Apple, at farm | Chilled | PP | at consumer",
+            "location": "IT",
+            "exchanges": [{"name": "Azadirachtin"}, {"name": "Creosote"}],
+        },
+        {
+            "name": "Trellis system, wooden poles",
+            "location": "FR",
+            "exchanges": [{"name": "Pyrene"}, {"name": "Wood, creosote treated"}],
+        },
+        {
+            "name": "Broken process",
+            "simapro metadata": {"Process identifier": "EI3CQUNI000025017103662"},
+            "exchanges": [],
+        },
+    ]
+
+
+def test_fused_strategies_equal_sequential_application():
+    sequential = _db()
+    for strategy in STRATEGIES:
+        sequential = strategy(sequential)
+
+    fused = fuse_strategies(STRATEGIES)
+    assert len(fused) == 1
+
+    assert fused[0](_db()) == sequential
+
+
+def test_strategies_do_not_mutate_their_input():
+    db = _db()
+    expected = copy.deepcopy(db)
+
+    FusedStrategy(STRATEGIES)(db)
+
+    assert db == expected
+
+
+def test_fusing_stops_at_other_strategies():
+    fused = fuse_strategies(
+        [extract_ciqual, extract_tags, normalize_units, remove_creosote]
+    )
+
+    assert [strategy.__name__ for strategy in fused] == [
+        "extract_ciqual+extract_tags",
+        "normalize_units",
+        "remove_creosote",
+    ]
+    assert fused[2] is remove_creosote
+
+
+def test_remove_some_processes():
+    names = [ds["name"] for ds in remove_some_processes(_db())]
+
+    assert "Broken process" not in names
+    assert len(names) == len(_db()) - 1
+
+
+def test_dataset_strategies():
+    lentil, tunnel, apple, trellis = FusedStrategy(STRATEGIES)(_db())
+
+    assert lentil["location"] == "FR"
+    assert lentil["ciqual_code"] == "20504"
+    assert lentil["DQR"]["overall"] == 2.1
+    assert "Status" not in lentil
+    assert "simapro metadata" not in lentil
+    assert "simapro name" not in lentil
+    assert lentil["parameters"]["yield"]["formula"] == "a*b"
+    assert [exc["name"] for exc in lentil["exchanges"]] == [
+        "Transformation, from annual crop"
+    ]
+
+    assert tunnel["location"] == "GLO"
+    assert [exc["name"] for exc in tunnel["exchanges"]] == ["Steel"]
+
+    assert apple["packaging"] == "PP"
+    assert apple["stage"] == "at consumer"
+    assert apple["transport_type"] == "Chilled"
+    assert [exc["name"] for exc in apple["exchanges"]] == ["Azadirachtin", "Creosote"]
+
+    assert trellis["exchanges"] == []
+
+
+def test_method_strategies():
+    methods = [
+        {
+            "name": ("EF 3.1", "Resource use, fossils"),
+            "exchanges": [
+                {"name": "Uranium", "categories": ("natural resource",), "amount": 10},
+                {
+                    "name": "Coal, hard",
+                    "categories": ("natural resource",),
+                    "amount": 2,
+                },
+            ],
+        },
+        {
+            "name": ("EF 3.1", "Climate change"),
+            "exchanges": [
+                {"name": "Uranium", "categories": ("air",), "amount": 1},
+                {"name": "Radon", "categories": ("air", "long-term"), "amount": 3},
+            ],
+        },
+    ]
+    expected = copy.deepcopy(methods)
+
+    fossils, climate_change = FusedStrategy([noLT, uraniumFRU])(methods)
+
+    assert methods == expected
+    assert [cf["amount"] for cf in fossils["exchanges"]] == [6, 2]
+    assert [cf["amount"] for cf in climate_change["exchanges"]] == [1, 0]
+
+
+def test_sharded_strategies_equal_serial_application():
+    # needs the brightway project, applied serially and left out of this test
+    migration = functools.partial(migrate_exchanges, migration="default-units")
+    strategies = [
+        normalize_units,
+        migration,
+        split_simapro_name_geo,
+        functools.partial(set_code_by_activity_hash, overwrite=True),
+    ] + STRATEGIES
+    db = [
+        {**ds, "name": f"{ds['name']} {i}", "unit": "kg"}
+        for i in range(20)
+        for ds in _db()
+    ]
+
+    parallelized = parallelize_strategies(strategies, cpu_count=2)
+    assert [type(strategy) for strategy in parallelized] == [
+        ShardedStrategy,
+        functools.partial,
+        ShardedStrategy,
+    ]
+
+    serial = copy.deepcopy(db)
+    for strategy in [s for s in strategies if s is not migration]:
+        serial = strategy(serial)
+    sharded = db
+    for strategy in [parallelized[0], parallelized[2]]:
+        sharded = strategy(sharded)
+
+    assert sharded == serial
@@ -0,0 +1,94 @@
+import bw2data
+import pytest
+from bw2data.backends import ActivityDataset
+
+from common.sync_datapackages import (
+    is_database_current,
+    is_method_current,
+    load_fingerprints,
+    sync_datapackages,
+)
+
+METHOD = ("test", "climate change")
+
+
+@pytest.fixture
+def project(temp_bw_dir):
+    bw2data.projects.set_current("test-sync-datapackages")
+    bw2data.Database("biosphere3").write(
+        {
+            ("biosphere3", "co2"): {
+                "name": "Carbon dioxide, fossil",
+                "unit": "kilogram",
+                "type": "emission",
+            },
+        }
+    )
+    bw2data.Database("Agb").write(
+        {
+            ("Agb", "diesel"): {
+                "name": "Diesel",
+                "unit": "kilogram",
+                "type": "processwithreferenceproduct",
+                "exchanges": [
+                    {"input": ("biosphere3", "co2"), "amount": 3.0, "type": "biosphere"}
+                ],
+            },
+        }
+    )
+    bw2data.Method(METHOD).write([(("biosphere3", "co2"), 1.0)])
+
+
+def _stale(fingerprints=None):
+    fingerprints = fingerprints if fingerprints is not None else load_fingerprints()
+    databases = [
+        dbname
+        for dbname in bw2data.databases
+        if not is_database_current(
+            dbname,
+            fingerprints.get(bw2data.Database(dbname).filename_processed()),
+        )
+    ]
+    methods = [
+        method
+        for method in bw2data.methods
+        if not is_method_current(
+            method, fingerprints.get(bw2data.Method(method).filename_processed())
+        )
+    ]
+    return sorted(databases), methods
+
+
+def test_written_datapackages_are_current(project):
+    assert _stale() == ([], [])
+
+
+def test_sync_stale_datapackages(project):
+    bw2data.databases.set_dirty("biosphere3")
+    # Agb links to the biosphere, that may have been rewritten since
+    assert _stale() == (["Agb", "biosphere3"], [])
+
+    sync_datapackages(max_workers=2)
+    assert not bw2data.databases["biosphere3"]["dirty"]
+    assert bw2data.databases["Agb"]["depends"] == ["biosphere3"]
+    assert _stale() == ([], [])
+    assert len(load_fingerprints()) == 3
+
+
+def test_rows_written_behind_bw2data(project):
+    sync_datapackages(max_workers=1)
+    ActivityDataset.create(
+        database="Agb",
+        code="petrol",
+        name="Petrol",
+        type="processwithreferenceproduct",
+        data={"database": "Agb", "code": "petrol", "name": "Petrol"},
+    )
+    assert _stale() == (["Agb"], [])
+    # Without the recorded fingerprints, only the timestamps can tell
+    assert _stale({}) == ([], [])
+
+
+def test_method_rewritten_without_processing(project):
+    bw2data.Method(METHOD).write([(("biosphere3", "co2"), 2.0)], process=False)
+    assert _stale() == ([], [METHOD])